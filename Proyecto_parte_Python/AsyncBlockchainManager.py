@@ -0,0 +1,411 @@
+import asyncio
+import logging
+import time
+from web3 import AsyncWeb3, AsyncHTTPProvider
+from web3.exceptions import (
+    TimeExhausted,
+    ContractLogicError,
+    InvalidAddress
+)
+from BlockchainManager import BlockchainManager
+from ContractUtils import is_valid_ethereum_address, format_transaction_receipt
+from NonceManager import AsyncNonceManager
+from ModeloGas import ModeloGas
+from EstrategiaComisiones import EstrategiaComisiones
+
+
+class TransaccionPendiente:
+    """
+        Referencia a una transacción ya difundida a la red cuyo recibo todavía no se ha obtenido.
+
+        Los métodos de envío de `AsyncBlockchainManager` devuelven una instancia de esta clase en
+        cuanto el nodo acepta la transacción, sin esperar a que sea minada. Para obtener el recibo
+        formateado basta con esperarla (`recibo = await transaccion`). La espera se inicia la
+        primera vez que se solicita y su resultado se reutiliza en las siguientes.
+
+        Atributos:
+        - tx_hash (HexBytes): El hash de la transacción difundida.
+        - timeout (float): Segundos máximos de espera por el recibo.
+    """
+
+    def __init__(self, manager, tx_hash, timeout=120, clave_gas=None, gas_limite=None):
+        self.tx_hash = tx_hash
+        self.timeout = timeout
+        self._manager = manager
+        self._clave_gas = clave_gas
+        self._gas_limite = gas_limite
+        self._tarea = None
+
+    def _obtener_tarea(self):
+        if self._tarea is None:
+            self._tarea = asyncio.ensure_future(
+                self._manager.esperar_recibo(self.tx_hash, self.timeout, self._clave_gas, self._gas_limite)
+            )
+        return self._tarea
+
+    def __await__(self):
+        return self._obtener_tarea().__await__()
+
+    def done(self):
+        """Indica si ya se ha obtenido el recibo (o un error) de la transacción."""
+        return self._tarea is not None and self._tarea.done()
+
+    def __repr__(self):
+        return f"TransaccionPendiente({self.tx_hash.hex()})"
+
+
+class AsyncBlockchainManager:
+    """
+        Variante asíncrona de `BlockchainManager` construida sobre `AsyncWeb3` y `AsyncHTTPProvider`.
+
+        Ofrece los mismos métodos que la versión síncrona, pero como corrutinas. Los métodos que envían
+        transacciones retornan una `TransaccionPendiente` en cuanto la transacción ha sido difundida,
+        de forma que se pueden lanzar miles de operaciones en un mismo bucle de eventos y esperar
+        sus confirmaciones en paralelo (por ejemplo con `asyncio.gather`).
+
+        Atributos:
+        - web3 (AsyncWeb3): Instancia asíncrona de Web3.
+        - contract (AsyncContract): Instancia del contrato inteligente.
+        - nonce_manager (AsyncNonceManager): Gestor local de nonces por cuenta.
+
+        Métodos:
+        - crear(cls, ganache_url, contract_address, abi_path, ...): Construye el gestor y comprueba la conexión.
+        - sign_and_send_transaction(self, function_call, account_address, private_key, ...): Firma y
+        difunde una transacción y retorna su `TransaccionPendiente`.
+        - esperar_recibo(self, tx_hash, timeout): Espera el recibo de una transacción y lo formatea.
+        - comisiones(self): Retorna las comisiones de gas vigentes según el historial de comisiones de la red.
+    """
+    ESTADOS_PRESTAMO = BlockchainManager.ESTADOS_PRESTAMO
+    mapear_estado_prestamo = BlockchainManager.mapear_estado_prestamo
+    formatear_prestamo = BlockchainManager.formatear_prestamo
+    load_contract = BlockchainManager.load_contract
+    INTERVALO_BLOQUE = BlockchainManager.INTERVALO_BLOQUE
+
+    def __init__(self, ganache_url, contract_address, abi_path, socio_principal_address, socio_principal_private_key, ruta_modelo_gas='modelo_gas.json', margen_gas=0.2, estrategia_comisiones=None):
+        """
+            Constructor de la clase. Prepara el proveedor asíncrono y carga el contrato, pero no realiza
+            ninguna petición a la red; para comprobar la conexión se debe usar `crear` o `conectar`.
+
+            Parámetros:
+            - ganache_url (str): La URL del nodo Ethereum.
+            - contract_address (str): La dirección del contrato inteligente.
+            - abi_path (str): La ruta al archivo JSON que contiene la ABI del contrato.
+            - socio_principal_address (str): La dirección del socio principal.
+            - socio_principal_private_key (str): La clave privada del socio principal.
+            - ruta_modelo_gas (str): Archivo en el que se persisten los límites de gas aprendidos.
+            - margen_gas (float): Margen de seguridad sobre el consumo de gas observado.
+            - estrategia_comisiones (EstrategiaComisiones, opcional): Cálculo de las comisiones de gas.
+        """
+        self.web3 = AsyncWeb3(AsyncHTTPProvider(ganache_url))
+        self.load_contract(contract_address, abi_path)
+        self.nonce_manager = AsyncNonceManager(self.web3)
+        self.modelo_gas = ModeloGas(ruta_modelo_gas, margen_gas)
+        self.estrategia_comisiones = estrategia_comisiones or EstrategiaComisiones()
+        self.chain_id = None
+        self._bloque_conocido = None
+        self.socio_principal_address = socio_principal_address
+        self.socio_principal_private_key = socio_principal_private_key
+
+    @classmethod
+    async def crear(cls, ganache_url, contract_address, abi_path, socio_principal_address, socio_principal_private_key, **kwargs):
+        """
+            Construye una instancia de `AsyncBlockchainManager` y comprueba la conexión con el nodo.
+            Los argumentos adicionales (`ruta_modelo_gas`, `margen_gas`, `estrategia_comisiones`) se
+            pasan al constructor.
+
+            Retorna:
+            La instancia lista para su uso.
+
+            Excepciones:
+            - ConnectionError: Se lanza si no se puede establecer la conexión con el nodo.
+        """
+        manager = cls(ganache_url, contract_address, abi_path, socio_principal_address, socio_principal_private_key, **kwargs)
+        await manager.conectar()
+        return manager
+
+    async def conectar(self):
+        """
+            Comprueba que el nodo está accesible y obtiene una sola vez el chain id de la red.
+
+            Excepciones:
+            - ConnectionError: Se lanza si la conexión con el nodo no puede ser establecida.
+        """
+        try:
+            if not await self.web3.is_connected():
+                raise ConnectionError("No se pudo conectar a Ganache.")
+            self.chain_id = await self.web3.eth.chain_id
+        except ConnectionError as e:
+            logging.error(f"Error al conectar con Ganache: {e}")
+            raise
+
+    async def sign_and_send_transaction(self, function_call, account_address, private_key, ether_value=0, gas_limit=None, timeout=120):
+        """
+            Construye, firma y difunde una transacción que invoca una función del contrato, sin esperar
+            a que sea minada.
+
+            Parámetros:
+            - function_call (AsyncContractFunction): La función del contrato a invocar.
+            - account_address (str): La dirección Ethereum desde la cual se envía la transacción.
+            - private_key (str): La clave privada del emisor. Debe empezar con '0x'.
+            - ether_value (int): El valor de la transacción en wei.
+            - gas_limit (int, opcional): El límite de gas para la transacción. Si no se indica, se usa el
+            límite aprendido por `modelo_gas` para la función.
+            - timeout (float): Segundos máximos de espera por el recibo cuando se espere la transacción.
+
+            Retorna:
+            Una `TransaccionPendiente` que, al ser esperada, retorna el recibo formateado.
+
+            Excepciones:
+            - ValueError: Se lanza si los parámetros no son válidos.
+            - Exception: Cualquier error producido al construir o difundir la transacción.
+        """
+        if ether_value < 0:
+            raise ValueError("El valor de la transacción no puede ser negativo.")
+        if gas_limit is not None and (gas_limit < 21000 or gas_limit > 8000000):
+            raise ValueError("El límite de gas proporcionado es inadecuado.")
+        if not isinstance(private_key, str) or not private_key.startswith('0x'):
+            raise ValueError("La clave privada debe ser una cadena hexadecimal que comience con 0x.")
+
+        try:
+            account_address = self.web3.to_checksum_address(account_address.strip())
+            if not is_valid_ethereum_address(account_address):
+                raise ValueError(f"La dirección {account_address} no es válida.")
+
+            if self.chain_id is None:
+                self.chain_id = await self.web3.eth.chain_id
+            clave_gas = ModeloGas.clave(function_call)
+            if gas_limit is None:
+                gas_limit = self.modelo_gas.limite(clave_gas)
+                if gas_limit is None:
+                    estimacion = await function_call.estimate_gas({'from': account_address, 'value': ether_value})
+                    gas_limit = self.modelo_gas.sembrar(clave_gas, estimacion)
+
+            transaction = await function_call.build_transaction({
+                'from': account_address,
+                'chainId': self.chain_id,
+                'gas': gas_limit,
+                'value': ether_value,
+                **await self.comisiones(),
+            })
+
+            # Con el cerrojo de envío las transacciones de la cuenta llegan al nodo en orden de nonce y un
+            # fallo se resincroniza sin otros nonces de la cuenta en vuelo
+            async with self.nonce_manager.envio(account_address):
+                nonce = await self.nonce_manager.asignar(account_address)
+                transaction['nonce'] = nonce
+                try:
+                    signed_txn = self.web3.eth.account.sign_transaction(transaction, private_key)
+                    txn_hash = await self.web3.eth.send_raw_transaction(signed_txn.rawTransaction)
+                except Exception as e:
+                    await self.nonce_manager.descartar(account_address, nonce, e)
+                    raise
+            return TransaccionPendiente(self, txn_hash, timeout, clave_gas, gas_limit)
+
+        except ValueError as e:
+            logging.error(f"Error de valor: {e}")
+            raise
+
+        except InvalidAddress as e:
+            logging.error(f"Dirección inválida: {e}")
+            raise
+
+        except ContractLogicError as e:
+            logging.error(f"Error de lógica del contrato: {e}")
+            raise
+
+        except Exception as e:
+            logging.error(f"Error al realizar la transacción: {e}")
+            raise
+
+    async def comisiones(self):
+        """
+            Retorna las comisiones de gas para una transacción nueva según `estrategia_comisiones`,
+            consultando el historial de comisiones (`eth_feeHistory`) como mucho una vez por bloque.
+            Si el nodo no lo admite, se usa `gasPrice` con el precio que indica el nodo.
+        """
+        ahora = time.monotonic()
+        if self._bloque_conocido is None or ahora - self._bloque_conocido[1] >= self.INTERVALO_BLOQUE:
+            self._bloque_conocido = (await self.web3.eth.block_number, ahora)
+        bloque = self._bloque_conocido[0]
+        comisiones = self.estrategia_comisiones.vigentes(bloque)
+        if comisiones is not None:
+            return comisiones
+
+        estrategia = self.estrategia_comisiones
+        try:
+            historial = await self.web3.eth.fee_history(estrategia.bloques_historial, 'latest', [estrategia.percentil])
+        except Exception as e:
+            logging.error(f"Error al obtener el historial de comisiones: {e}")
+            historial = None
+        if not historial or not historial.get('baseFeePerGas'):
+            return estrategia.calcular(bloque, gas_price=await self.web3.eth.gas_price)
+        return estrategia.calcular(bloque, historial)
+
+    async def esperar_recibo(self, tx_hash, timeout=120, clave_gas=None, gas_limite=None):
+        """
+            Espera a que una transacción sea minada y retorna su recibo formateado.
+
+            Parámetros:
+            - tx_hash (HexBytes): El hash de la transacción.
+            - timeout (float): Segundos máximos de espera.
+            - clave_gas (str, opcional): Clave de la función en el modelo de gas, para actualizarlo con el recibo.
+            - gas_limite (int, opcional): Límite de gas con el que se envió la transacción.
+
+            Retorna:
+            El recibo formateado con `format_transaction_receipt`.
+
+            Excepciones:
+            - TimeExhausted: Se lanza si la transacción no es minada dentro del tiempo indicado.
+            - ValueError: Se lanza si la transacción falló (status 0).
+        """
+        try:
+            receipt = await self.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+        except TimeExhausted as e:
+            logging.error(f"Tiempo agotado esperando la transacción: {e}")
+            raise
+        if clave_gas is not None and (receipt.status == 1 or receipt.gasUsed >= gas_limite):
+            self.modelo_gas.registrar(clave_gas, receipt.gasUsed, gas_limite)
+        if receipt.status == 0:
+            logging.error(f"La transacción falló. Recibo: {receipt}")
+            raise ValueError("La transacción falló.")
+        return format_transaction_receipt(receipt)
+
+    async def alta_prestamista(self, nueva_direccion):
+        """
+            Registra un nuevo prestamista firmando con la cuenta del socio principal.
+            Retorna la `TransaccionPendiente` de la operación.
+        """
+        if not is_valid_ethereum_address(nueva_direccion):
+            raise ValueError("La nueva dirección no es válida.")
+        try:
+            function_call = self.contract.functions.altaPrestamista(self.web3.to_checksum_address(nueva_direccion))
+            return await self.sign_and_send_transaction(function_call, self.socio_principal_address, self.socio_principal_private_key, 0)
+        except Exception as e:
+            logging.error("Error en alta_prestamista: %s", str(e))
+            raise Exception(f"Error al dar de alta al prestamista: {e}")
+
+    async def alta_cliente(self, direccion_prestamista, clave_privada, nueva_direccion):
+        """
+            Registra un nuevo cliente en el sistema. La transacción es firmada por el prestamista.
+            Retorna la `TransaccionPendiente` de la operación.
+        """
+        if not is_valid_ethereum_address(direccion_prestamista) or not is_valid_ethereum_address(nueva_direccion):
+            raise ValueError("Se ha proporcionado una dirección Ethereum no válida.")
+        try:
+            function_call = self.contract.functions.altaCliente(self.web3.to_checksum_address(nueva_direccion))
+            return await self.sign_and_send_transaction(function_call, direccion_prestamista, clave_privada, 0)
+        except ValueError as e:
+            logging.error(f"Error de valor: {e}")
+            raise e
+        except Exception as e:
+            logging.error("Error al registrar al cliente: %s", str(e))
+            raise Exception(f"Error al registrar al cliente: {e}")
+
+    async def depositar_garantia(self, direccion_cliente, clave_privada, valor_ether):
+        """
+            Deposita garantía en el contrato. `valor_ether` debe estar expresado en wei.
+            Retorna la `TransaccionPendiente` de la operación.
+        """
+        try:
+            direccion_cliente = self.web3.to_checksum_address(direccion_cliente)
+            function_call = self.contract.functions.depositarGarantia()
+            return await self.sign_and_send_transaction(function_call, direccion_cliente, clave_privada, valor_ether)
+        except ValueError as e:
+            logging.error(f"Error de valor: {e}")
+            raise e
+        except Exception as e:
+            logging.error("Error al depositar garantia: %s", str(e))
+            raise Exception(f"Error al depositar garantia: {e}")
+
+    async def solicitar_prestamo(self, direccion_cliente, clave_privada, monto, plazo):
+        """
+            Solicita un préstamo de `monto` wei con un plazo de `plazo` segundos.
+            Retorna la `TransaccionPendiente` de la operación.
+        """
+        try:
+            function_call = self.contract.functions.solicitarPrestamo(monto, plazo)
+            return await self.sign_and_send_transaction(function_call, direccion_cliente, clave_privada, 0)
+        except Exception as e:
+            logging.error("Error al solicitar prestamo: %s", str(e))
+            raise Exception(f"Error al solicitar prestamo: {e}")
+
+    async def aprobar_prestamo(self, direccion_prestamista, clave_privada, direccion_prestatario, prestamo_id):
+        """
+            Aprueba el préstamo `prestamo_id` del prestatario indicado.
+            Retorna la `TransaccionPendiente` de la operación.
+        """
+        if not is_valid_ethereum_address(direccion_prestatario):
+            raise ValueError("La dirección del prestatario no es válida.")
+        try:
+            function_call = self.contract.functions.aprobarPrestamo(self.web3.to_checksum_address(direccion_prestatario), prestamo_id)
+            return await self.sign_and_send_transaction(function_call, direccion_prestamista, clave_privada)
+        except Exception as e:
+            logging.error("Error al aprobar prestamo: %s", str(e))
+            raise Exception(f"Error al aprobar prestamo: {e}")
+
+    async def reembolsar_prestamo(self, direccion_cliente, clave_privada, prestamo_id):
+        """
+            Reembolsa el préstamo `prestamo_id` del cliente que firma la transacción.
+            Retorna la `TransaccionPendiente` de la operación.
+        """
+        try:
+            function_call = self.contract.functions.reembolsarPrestamo(prestamo_id)
+            return await self.sign_and_send_transaction(function_call, direccion_cliente, clave_privada)
+        except Exception as e:
+            logging.error("Error al reembolsar prestamo: %s", str(e))
+            raise Exception(f"Error al reembolsar prestamo: {e}")
+
+    async def liquidar_garantia(self, direccion_prestamista, clave_privada, direccion_prestatario, prestamo_id):
+        """
+            Liquida la garantía del préstamo `prestamo_id` del prestatario indicado.
+            Retorna la `TransaccionPendiente` de la operación.
+        """
+        if not is_valid_ethereum_address(direccion_prestatario):
+            raise ValueError("La dirección del prestatario no es válida.")
+        try:
+            function_call = self.contract.functions.liquidarGarantia(self.web3.to_checksum_address(direccion_prestatario), prestamo_id)
+            return await self.sign_and_send_transaction(function_call, direccion_prestamista, clave_privada, 0)
+        except Exception as e:
+            logging.error("Error al liquidar garantia: %s", str(e))
+            raise Exception(f"Error al liquidar garantia: {e}")
+
+    async def obtener_prestamos_por_prestatario(self, direccion_prestatario):
+        """
+            Recupera los IDs de los préstamos asociados con un prestatario.
+
+            Excepciones:
+            - ValueError: Se lanza si la dirección del prestatario no es válida.
+            - Exception: Cualquier otro error producido durante la consulta.
+        """
+        if not is_valid_ethereum_address(direccion_prestatario):
+            raise ValueError("La dirección del prestatario no es válida.")
+        try:
+            return await self.contract.functions.obtenerPrestamosPorPrestatario(
+                self.web3.to_checksum_address(direccion_prestatario)
+            ).call()
+        except Exception as e:
+            logging.error(f"Error al obtener préstamos por prestatario: {e}")
+            raise Exception(f"Error al obtener préstamos por prestatario: {e}")
+
+    async def obtener_detalle_de_prestamo(self, direccion_prestatario, prestamo_id):
+        """
+            Obtiene los detalles de un préstamo con el mismo formato que
+            `BlockchainManager.obtener_detalle_de_prestamo`.
+
+            Excepciones:
+            - ValueError: Se lanza si la dirección no es válida o si el ID del préstamo no es positivo.
+            - Exception: Cualquier otro error producido durante la consulta.
+        """
+        if not is_valid_ethereum_address(direccion_prestatario):
+            raise ValueError("La dirección del prestatario no es válida.")
+        if prestamo_id <= 0:
+            raise ValueError("El ID del préstamo debe ser un número positivo.")
+        try:
+            prestamo = await self.contract.functions.obtenerDetalleDePrestamo(
+                self.web3.to_checksum_address(direccion_prestatario), prestamo_id).call()
+            if not prestamo:
+                return None
+            return self.formatear_prestamo(prestamo)
+        except Exception as e:
+            logging.error(f"Error al obtener detalle de préstamo: {e}")
+            raise Exception(f"Error al obtener detalle de préstamo: {e}")
@@ -0,0 +1,448 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+from BlockchainManager import EnvioOmitido
+from ContractUtils import ruta_datos
+from NonceManager import es_error_de_nonce
+
+# Estados del ciclo de vida de una operación de la bandeja de salida
+EN_COLA = 'en_cola'
+FIRMADA = 'firmada'
+DIFUNDIDA = 'difundida'
+MINADA = 'minada'
+FALLIDA = 'fallida'
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS operaciones (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        referencia TEXT UNIQUE,
+        cuenta TEXT NOT NULL,
+        funcion TEXT NOT NULL,
+        argumentos TEXT NOT NULL,
+        valor TEXT NOT NULL DEFAULT '0',
+        estado TEXT NOT NULL,
+        nonce INTEGER,
+        txn_hash TEXT,
+        transaccion_firmada TEXT,
+        detalle TEXT,
+        actualizada REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_operaciones_estado ON operaciones (estado, id);
+    CREATE TABLE IF NOT EXISTS eventos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        operacion INTEGER NOT NULL,
+        estado TEXT NOT NULL,
+        nonce INTEGER,
+        txn_hash TEXT,
+        detalle TEXT,
+        momento REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_eventos_operacion ON eventos (operacion);
+"""
+
+
+class BandejaSalida:
+    """
+        Bandeja de salida persistente (outbox) en SQLite para las transacciones del contrato.
+
+        Cada operación se guarda al encolarla y pasa por los estados 'en_cola', 'firmada', 'difundida'
+        y, finalmente, 'minada' o 'fallida'. Cada cambio de estado se añade a la tabla `eventos`, que
+        nunca se modifica, y la tabla `operaciones` guarda el estado actual con su nonce y su hash.
+
+        La transacción firmada (con su nonce y su hash) se guarda antes de difundirla. Así, si el
+        proceso termina entre la difusión y el recibo, al reiniciar `reconciliar` no vuelve a construir
+        la operación, sino que consulta la red: si ya tiene recibo se marca como minada; si sigue en el
+        mempool se espera; si el nonce ya lo ha usado otra transacción, la operación no se ejecutó y se
+        marca como fallida; y si el nodo la ha perdido se difunden de nuevo los mismos bytes firmados,
+        que como mucho se pueden minar una vez. Ninguna operación se envía dos veces con nonces distintos.
+
+        Las claves privadas no se guardan en la base de datos: se indican al crear la bandeja o con
+        `registrar_clave` y solo se mantienen en memoria.
+
+        Las operaciones en cola se procesan en lotes con `BlockchainManager.difundir_lote_firmado`, sin
+        esperar los recibos del lote anterior, y los cambios de estado de cada lote se escriben en una
+        única transacción de SQLite. Las operaciones de una misma cuenta se difunden en orden de nonce;
+        entre cuentas distintas, una operación que comparte alguna dirección (la cuenta o un argumento)
+        con otra anterior aún no minada espera a que esta se mine, de modo que, por ejemplo, un
+        `depositarGarantia` no se ejecuta antes del `altaCliente` de su cliente. La base de datos usa el
+        modo WAL, que conserva lo confirmado aunque el proceso termine de forma abrupta.
+
+        Atributos:
+        - blockchain_manager (BlockchainManager): Gestor con la conexión al nodo y el contrato.
+        - conexion (sqlite3.Connection): Conexión a la base de datos de la bandeja (una ruta relativa se
+        resuelve con `ContractUtils.ruta_datos`).
+        - tamano_lote (int): Número máximo de operaciones en cola que se difunden juntas.
+        - timeout_recibo (float): Segundos sin recibo tras los que una operación difundida se vuelve a
+        comprobar contra la red.
+
+        Métodos:
+        - encolar(self, cuenta, funcion, argumentos, valor, referencia): Añade una operación a la bandeja.
+        - procesar_lote(self): Firma y difunde el siguiente lote de operaciones en cola.
+        - comprobar_recibos(self): Anota las operaciones difundidas que ya tienen recibo.
+        - reconciliar(self): Comprueba contra la red las operaciones firmadas o difundidas.
+        - ejecutar(self, intervalo, detener): Reconcilia y vacía la bandeja hasta que se active `detener`.
+    """
+
+    def __init__(self, blockchain_manager, ruta_bd='bandeja_salida.db', claves=None, tamano_lote=100, timeout_recibo=120):
+        self.blockchain_manager = blockchain_manager
+        self.web3 = blockchain_manager.web3
+        self.contract = blockchain_manager.contract
+        self.tamano_lote = tamano_lote
+        self.timeout_recibo = timeout_recibo
+        self._claves = {}
+        for cuenta, clave in (claves or {}).items():
+            self.registrar_clave(cuenta, clave)
+        # Operaciones difundidas cuyo recibo se espera: id -> (futuro, function_call, transaction, difundida en)
+        self._esperando = {}
+        self._cerrojo = threading.RLock()
+
+        self.conexion = sqlite3.connect(ruta_datos(ruta_bd), check_same_thread=False)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        with self.conexion:
+            self.conexion.executescript(ESQUEMA)
+
+    def registrar_clave(self, cuenta, clave_privada):
+        """Indica la clave privada con la que se firman las operaciones de `cuenta`. Solo se guarda en memoria."""
+        self._claves[Web3.to_checksum_address(cuenta)] = clave_privada
+
+    def _transicion(self, operacion_id, estado, detalle=None, **campos):
+        """Cambia el estado de una operación y lo anota en `eventos`. Debe llamarse dentro de una transacción de SQLite."""
+        momento = time.time()
+        asignaciones = ''.join(f", {campo} = ?" for campo in campos)
+        self.conexion.execute(
+            f"UPDATE operaciones SET estado = ?, detalle = ?, actualizada = ?{asignaciones} WHERE id = ?",
+            (estado, detalle, momento, *campos.values(), operacion_id),
+        )
+        self.conexion.execute(
+            "INSERT INTO eventos (operacion, estado, nonce, txn_hash, detalle, momento) VALUES (?, ?, ?, ?, ?, ?)",
+            (operacion_id, estado, campos.get('nonce'), campos.get('txn_hash'), detalle, momento),
+        )
+
+    def encolar(self, cuenta, funcion, argumentos=(), valor=0, referencia=None):
+        """
+            Añade una llamada a una función del contrato a la bandeja de salida.
+
+            Parámetros:
+            - cuenta (str): Dirección de la cuenta que firma la transacción.
+            - funcion (str): Nombre de la función del contrato, por ejemplo 'depositarGarantia'.
+            - argumentos (list): Argumentos de la función. Deben poder guardarse como JSON.
+            - valor (int): Ether enviado con la transacción, en wei.
+            - referencia (str, opcional): Identificador único de la operación para la aplicación. Si ya
+            hay una operación con la misma referencia no se añade otra, de modo que reintentar el
+            encolado tras un fallo no duplica la operación.
+
+            Retorna:
+            El ID (int) de la operación en la bandeja.
+
+            Excepciones:
+            - ValueError: Se lanza si la dirección no es válida o el contrato no tiene la función indicada.
+        """
+        try:
+            cuenta = Web3.to_checksum_address(cuenta)
+            getattr(self.contract.functions, funcion)(*argumentos)
+        except Exception as e:
+            logging.error(f"Error al encolar la operación {funcion}: {e}")
+            raise ValueError(f"Operación no válida: {e}") from e
+
+        with self._cerrojo, self.conexion:
+            if referencia is not None:
+                fila = self.conexion.execute("SELECT id FROM operaciones WHERE referencia = ?", (referencia,)).fetchone()
+                if fila:
+                    return fila[0]
+            cursor = self.conexion.execute(
+                "INSERT INTO operaciones (referencia, cuenta, funcion, argumentos, valor, estado, actualizada) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (referencia, cuenta, funcion, json.dumps(list(argumentos)), str(valor), EN_COLA, time.time()),
+            )
+            operacion_id = cursor.lastrowid
+            self.conexion.execute(
+                "INSERT INTO eventos (operacion, estado, momento) VALUES (?, ?, ?)",
+                (operacion_id, EN_COLA, time.time()),
+            )
+        return operacion_id
+
+    def operacion(self, operacion_id):
+        """Retorna el estado actual de una operación como diccionario, o None si no existe."""
+        with self._cerrojo:
+            cursor = self.conexion.execute(
+                "SELECT id, referencia, cuenta, funcion, argumentos, valor, estado, nonce, txn_hash, detalle "
+                "FROM operaciones WHERE id = ?",
+                (operacion_id,),
+            )
+            fila = cursor.fetchone()
+            columnas = [descripcion[0] for descripcion in cursor.description]
+        if fila is None:
+            return None
+        operacion = dict(zip(columnas, fila))
+        operacion['argumentos'] = json.loads(operacion['argumentos'])
+        operacion['valor'] = int(operacion['valor'])
+        return operacion
+
+    def historial(self, operacion_id):
+        """Retorna los cambios de estado de una operación como tuplas (estado, nonce, txn_hash, detalle, momento)."""
+        with self._cerrojo:
+            return self.conexion.execute(
+                "SELECT estado, nonce, txn_hash, detalle, momento FROM eventos WHERE operacion = ? ORDER BY id",
+                (operacion_id,),
+            ).fetchall()
+
+    def resumen(self):
+        """Retorna el número de operaciones en cada estado."""
+        with self._cerrojo:
+            return dict(self.conexion.execute("SELECT estado, COUNT(*) FROM operaciones GROUP BY estado").fetchall())
+
+    def procesar_lote(self):
+        """
+            Firma y difunde las siguientes `tamano_lote` operaciones en cola, sin esperar sus recibos.
+
+            Las transacciones firmadas se guardan como 'firmada' antes de difundir ninguna. Si el nodo
+            rechaza una transacción se marca como 'fallida'; si el error no permite saber si llegó a la
+            red (por ejemplo, un corte de conexión) se deja como 'firmada' y, si no aparece su recibo en
+            `timeout_recibo` segundos, se comprueba contra la red como en `reconciliar`. Las operaciones
+            que no se enviaron por un fallo anterior de la misma cuenta vuelven a la cola.
+
+            El lote termina antes de la primera operación que comparte una dirección con una operación
+            de otra cuenta anterior y aún no minada (de este lote o de uno anterior); esa operación y las
+            siguientes se procesan en un lote posterior.
+
+            Retorna:
+            El número de operaciones procesadas.
+        """
+        with self._cerrojo:
+            filas = self.conexion.execute(
+                "SELECT id, cuenta, funcion, argumentos, valor FROM operaciones WHERE estado = ? ORDER BY id LIMIT ?",
+                (EN_COLA, self.tamano_lote),
+            ).fetchall()
+            en_vuelo = self.conexion.execute(
+                "SELECT cuenta, argumentos FROM operaciones WHERE estado IN (?, ?)", (FIRMADA, DIFUNDIDA)
+            ).fetchall()
+        if not filas:
+            return 0
+
+        # Dirección -> cuentas de las operaciones anteriores aún no minadas que la usan
+        cuentas_por_direccion = {}
+        for cuenta, argumentos in en_vuelo:
+            for direccion in self._direcciones(cuenta, argumentos):
+                cuentas_por_direccion.setdefault(direccion, set()).add(cuenta)
+        for posicion, (_, cuenta, _, argumentos, _) in enumerate(filas):
+            direcciones = self._direcciones(cuenta, argumentos)
+            if any(cuentas_por_direccion.get(direccion, {cuenta}) - {cuenta} for direccion in direcciones):
+                filas = filas[:posicion]
+                break
+            for direccion in direcciones:
+                cuentas_por_direccion.setdefault(direccion, set()).add(cuenta)
+        if not filas:
+            return 0
+
+        ids = []
+        operaciones = []
+        with self._cerrojo, self.conexion:
+            for operacion_id, cuenta, funcion, argumentos, valor in filas:
+                if cuenta not in self._claves:
+                    self._transicion(operacion_id, FALLIDA, f"No hay clave privada para la cuenta {cuenta}.")
+                    continue
+                try:
+                    function_call = getattr(self.contract.functions, funcion)(*json.loads(argumentos))
+                except Exception as e:
+                    self._transicion(operacion_id, FALLIDA, str(e))
+                    continue
+                ids.append(operacion_id)
+                operaciones.append({
+                    'function_call': function_call,
+                    'account_address': cuenta,
+                    'private_key': self._claves[cuenta],
+                    'ether_value': int(valor),
+                })
+
+        if not operaciones:
+            return len(filas)
+
+        guardadas = {}
+
+        def guardar_firmadas(firmadas):
+            with self._cerrojo, self.conexion:
+                for indice, transaction, raw_transaction, txn_hash in firmadas:
+                    self._transicion(
+                        ids[indice], FIRMADA,
+                        nonce=transaction['nonce'],
+                        txn_hash=Web3.to_hex(txn_hash),
+                        transaccion_firmada=Web3.to_hex(raw_transaction),
+                    )
+            guardadas.update((indice, txn_hash) for indice, _, _, txn_hash in firmadas)
+
+        pendientes = self.blockchain_manager.difundir_lote_firmado(operaciones, al_firmar=guardar_firmadas)
+
+        difundida_en = time.monotonic()
+        with self._cerrojo, self.conexion:
+            for indice, (operacion_id, operacion, pendiente) in enumerate(zip(ids, operaciones, pendientes)):
+                if isinstance(pendiente, EnvioOmitido):
+                    self._transicion(operacion_id, EN_COLA, str(pendiente), nonce=None, txn_hash=None, transaccion_firmada=None)
+                elif isinstance(pendiente, Exception):
+                    mensaje = str(pendiente).lower()
+                    if indice in guardadas and ('already known' in mensaje or 'known transaction' in mensaje):
+                        # El nodo ya tenía estos mismos bytes firmados (por ejemplo, tras un reintento): está difundida
+                        self._transicion(operacion_id, DIFUNDIDA, str(pendiente))
+                        futuro = self.blockchain_manager.notificador_recibos.registrar(guardadas[indice])
+                        self._esperando[operacion_id] = (futuro, None, None, difundida_en)
+                    elif isinstance(pendiente, ValueError) and es_error_de_nonce(pendiente):
+                        # Otra transacción usó el nonce: se vuelve a firmar con uno nuevo en el siguiente lote
+                        self._transicion(operacion_id, EN_COLA, str(pendiente), nonce=None, txn_hash=None, transaccion_firmada=None)
+                    # ValueError es la respuesta de error del nodo: la transacción no entró en la red
+                    elif indice not in guardadas or isinstance(pendiente, ValueError):
+                        self._transicion(operacion_id, FALLIDA, str(pendiente))
+                    else:
+                        # Se espera su recibo como si se hubiera difundido; si no llega, se reconcilia
+                        logging.error(f"No se sabe si la operación {operacion_id} llegó a la red: {pendiente}")
+                        futuro = self.blockchain_manager.notificador_recibos.registrar(guardadas[indice])
+                        self._esperando[operacion_id] = (futuro, None, None, difundida_en)
+                else:
+                    transaction, txn_hash = pendiente
+                    self._transicion(operacion_id, DIFUNDIDA)
+                    futuro = self.blockchain_manager.notificador_recibos.registrar(txn_hash)
+                    self._esperando[operacion_id] = (futuro, operacion['function_call'], transaction, difundida_en)
+        return len(filas)
+
+    @staticmethod
+    def _direcciones(cuenta, argumentos):
+        """Retorna las direcciones (en minúsculas) que usa una operación: su cuenta y las de sus argumentos."""
+        direcciones = {cuenta.lower()}
+        for argumento in json.loads(argumentos):
+            if isinstance(argumento, str) and Web3.is_address(argumento):
+                direcciones.add(argumento.lower())
+        return direcciones
+
+    def _resolver(self, operacion_id, receipt, function_call=None, transaction=None):
+        """Anota el recibo de una operación. Debe llamarse dentro de una transacción de SQLite."""
+        if function_call is not None:
+            try:
+                self.blockchain_manager.finalizar_transaccion(function_call, transaction, receipt)
+            except Exception as e:
+                self._transicion(operacion_id, FALLIDA, str(e))
+                return
+        elif receipt['status'] != 1:
+            self._transicion(operacion_id, FALLIDA, "La transacción fue revertida.")
+            return
+        self._transicion(operacion_id, MINADA, f"Bloque {receipt['blockNumber']}, gas {receipt['gasUsed']}")
+
+    def comprobar_recibos(self):
+        """
+            Anota como 'minada' o 'fallida' las operaciones difundidas cuyo recibo ya se ha obtenido, y
+            vuelve a comprobar contra la red las que llevan más de `timeout_recibo` segundos sin recibo.
+
+            Retorna:
+            El número de operaciones resueltas.
+        """
+        with self._cerrojo:
+            resueltas = [
+                (operacion_id, esperando) for operacion_id, esperando in self._esperando.items()
+                if esperando[0].done() and not esperando[0].cancelled()
+            ]
+            caducadas = [
+                operacion_id for operacion_id, (futuro, _, _, difundida_en) in self._esperando.items()
+                if not futuro.done() and time.monotonic() - difundida_en > self.timeout_recibo
+            ]
+            if resueltas:
+                with self.conexion:
+                    for operacion_id, (futuro, function_call, transaction, _) in resueltas:
+                        del self._esperando[operacion_id]
+                        self._resolver(operacion_id, futuro.result(), function_call, transaction)
+            for operacion_id in caducadas:
+                self._esperando.pop(operacion_id)
+                self._reconciliar_operacion(operacion_id)
+        return len(resueltas)
+
+    def reconciliar(self):
+        """
+            Comprueba contra la red las operaciones 'firmada' o 'difundida' de las que no se está
+            esperando el recibo, por ejemplo las que quedaron pendientes al terminar el proceso. Debe
+            llamarse antes de procesar operaciones nuevas, para que sus nonces no se reutilicen.
+
+            Retorna:
+            El número de operaciones comprobadas.
+        """
+        with self._cerrojo:
+            ids = [
+                fila[0] for fila in self.conexion.execute(
+                    "SELECT id FROM operaciones WHERE estado IN (?, ?) ORDER BY cuenta, nonce", (FIRMADA, DIFUNDIDA)
+                ).fetchall()
+                if fila[0] not in self._esperando
+            ]
+            for operacion_id in ids:
+                self._reconciliar_operacion(operacion_id)
+        return len(ids)
+
+    def _reconciliar_operacion(self, operacion_id):
+        cuenta, nonce, txn_hash, transaccion_firmada = self.conexion.execute(
+            "SELECT cuenta, nonce, txn_hash, transaccion_firmada FROM operaciones WHERE id = ?", (operacion_id,)
+        ).fetchone()
+        try:
+            # El nonce se consulta antes que el recibo: si se minara entre ambas consultas, se vería el recibo
+            nonce_usado = self.web3.eth.get_transaction_count(cuenta, 'latest') > nonce
+            try:
+                receipt = self.web3.eth.get_transaction_receipt(txn_hash)
+            except TransactionNotFound:
+                receipt = None
+            if receipt is not None:
+                with self.conexion:
+                    self._resolver(operacion_id, receipt)
+                return
+            if nonce_usado:
+                with self.conexion:
+                    self._transicion(operacion_id, FALLIDA, f"El nonce {nonce} lo usó otra transacción; la operación no se ejecutó.")
+                return
+
+            try:
+                self.web3.eth.get_transaction(txn_hash)
+                detalle = "Pendiente en el mempool tras reconciliar."
+            except TransactionNotFound:
+                # El nodo la ha perdido: se difunden los mismos bytes firmados, con el mismo nonce y hash
+                try:
+                    self.web3.eth.send_raw_transaction(HexBytes(transaccion_firmada))
+                    detalle = "Difundida de nuevo tras reconciliar."
+                except ValueError as e:
+                    if not es_error_de_nonce(e):
+                        with self.conexion:
+                            self._transicion(operacion_id, FALLIDA, str(e))
+                        return
+                    # Por ejemplo 'already known': se espera el recibo y, si no llega, se vuelve a comprobar
+                    detalle = f"Reconciliada: {e}"
+                self.blockchain_manager.nonce_manager.sincronizar(cuenta)
+        except Exception as e:
+            logging.error(f"Error al reconciliar la operación {operacion_id}: {e}")
+            return
+
+        with self.conexion:
+            self._transicion(operacion_id, DIFUNDIDA, detalle)
+        futuro = self.blockchain_manager.notificador_recibos.registrar(txn_hash)
+        self._esperando[operacion_id] = (futuro, None, None, time.monotonic())
+
+    def ejecutar(self, intervalo=0.2, detener=None):
+        """
+            Reconcilia las operaciones pendientes de una ejecución anterior y después procesa la cola
+            y los recibos de forma continua hasta que se active el evento `detener` (threading.Event).
+            Mientras haya operaciones en cola se procesan sin pausa; si no, se espera `intervalo` segundos.
+        """
+        detener = detener or threading.Event()
+        try:
+            self.reconciliar()
+        except Exception as e:
+            logging.error(f"Error al reconciliar la bandeja de salida: {e}")
+        while not detener.is_set():
+            procesadas = 0
+            try:
+                procesadas = self.procesar_lote()
+                self.comprobar_recibos()
+            except Exception as e:
+                logging.error(f"Error al procesar la bandeja de salida: {e}")
+            if not procesadas:
+                detener.wait(intervalo)
+
+    def cerrar(self):
+        """Cierra la conexión con la base de datos."""
+        with self._cerrojo:
+            self.conexion.close()
@@ -1,9 +1,21 @@
 import logging
 from web3 import Web3, HTTPProvider, exceptions
+from hexbytes import HexBytes
 import json
 import time
 from datetime import datetime
-from ContractUtils import ether_to_wei, wei_to_ether, is_valid_ethereum_address, format_transaction_receipt, log_transaction_receipt
+from ContractUtils import ether_to_wei, wei_to_ether, is_valid_ethereum_address, format_transaction_receipt, log_transaction_receipt, abi_output_types, load_abi
+from NonceManager import NonceManager
+from Registros import RegistroCliente, RegistroPrestamo
+from CacheLecturas import CacheLecturas
+from SingleFlight import SingleFlight
+from ModeloGas import ModeloGas
+from EstrategiaComisiones import EstrategiaComisiones
+from NotificadorRecibos import NotificadorRecibos
+from ProveedorMultiNodo import ProveedorMultiNodo, crear_sesion
+from Metricas import Metricas
+from Trazas import Trazador
+from FirmadorProcesos import FirmadorProcesos
 from web3.exceptions import (
     TransactionNotFound,
     TimeExhausted,
@@ -11,6 +23,9 @@ from web3.exceptions import (
     InvalidAddress
 )
 import os
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
+from contextlib import contextmanager, ExitStack
 from dotenv import load_dotenv
 
 # Carga las variables de entorno desde el archivo .env al inicio del script
@@ -20,6 +35,14 @@ load_dotenv()
 logging.basicConfig(filename='blockchain_errors.log', level=logging.ERROR, format='%(asctime)s:%(levelname)s:%(message)s')
 
 
+class OperacionCancelada(Exception):
+    """Se lanza cuando se cancela la espera del recibo de una transacción ya difundida."""
+
+
+class EnvioOmitido(Exception):
+    """Se lanza para las transacciones de un lote que no se difundieron porque falló una anterior de la misma cuenta."""
+
+
 class BlockchainManager:
     """
         Gestiona la conexión y las interacciones con un contrato inteligente en la red Ethereum,
@@ -42,6 +65,22 @@ class BlockchainManager:
         - init_web3(self, ganache_url): Inicializa la conexión con la red Ethereum utilizando Web3.
         - load_contract(self, contract_address, abi_path): Carga el contrato inteligente especificado
         por su dirección y ABI para interactuar con él.
+        - submit_many(self, operaciones, timeout): Firma y difunde varias llamadas al contrato seguidas
+        y recoge después todos sus recibos.
+        - difundir_lote_firmado(self, operaciones): Firma un lote de transacciones en el pool de procesos
+        de `firmador` y las difunde en orden de nonce.
+        - rpc_batch(self, peticiones): Envía varias peticiones JSON-RPC en un único lote HTTP.
+        - batch_call(self, llamadas, block_identifier, tamano_lote): Ejecuta varias funciones de lectura
+        del contrato en lotes, fijadas al mismo bloque.
+        - leer_prestatarios(self, direcciones, incluir_prestamos, tamano_lote): Lee en lote el estado y los
+        préstamos de muchos prestatarios.
+        - leer_contrato(self, nombre, *args): Ejecuta una función de lectura del contrato a través de la
+        caché de lecturas.
+        - comisiones(self): Retorna las comisiones de gas vigentes según el historial de comisiones de la red.
+        - esperar_recibo(self, transaction, txn_hash, private_key, timeout, plazo_reemplazo): Espera el recibo
+        de una transacción y la reemplaza con comisiones mayores si no se mina a tiempo.
+        - seguimiento(self, progreso, cancelacion): Contexto que notifica el progreso de las transacciones
+        enviadas desde el hilo actual y permite cancelar sus esperas.
         
     """
     ESTADOS_PRESTAMO = {
@@ -51,7 +90,25 @@ class BlockchainManager:
         3: 'Liquidado',
     }
 
-    def __init__(self, ganache_url, contract_address, abi_path, socio_principal_address, socio_principal_private_key):
+    # Número máximo de llamadas agrupadas en cada petición JSON-RPC por lotes
+    TAMANO_LOTE_RPC = 200
+
+    # Segundos durante los que se reutiliza el número de bloque conocido antes de volver a consultarlo
+    INTERVALO_BLOQUE = 1.0
+
+    # Segundos que se espera a que se mine una transacción antes de reemplazarla con comisiones mayores
+    PLAZO_REEMPLAZO = 60
+
+    # Plazo de reemplazo para operaciones urgentes, como reembolsar un préstamo antes de su vencimiento
+    PLAZO_REEMPLAZO_URGENTE = 15
+
+    # Plazo máximo en segundos de cada petición al nodo
+    TIMEOUT_RPC = 10
+
+    # Segundos entre dos comprobaciones locales de cancelación mientras se espera un recibo
+    INTERVALO_SONDEO = 0.1
+
+    def __init__(self, ganache_url, contract_address, abi_path, socio_principal_address, socio_principal_private_key, tamano_cache=1024, contract_code_hash=None, ruta_modelo_gas='modelo_gas.json', margen_gas=0.2, estrategia_comisiones=None, firmador=None, metricas=None, trazador=None):
         """
             Constructor para la clase BlockchainManager, que inicializa la conexión con la red Ethereum local
             utilizando Ganache y carga un contrato inteligente especificado para su interacción.
@@ -68,6 +125,19 @@ class BlockchainManager:
             - abi_path (str): La ruta al archivo JSON que contiene la ABI del contrato inteligente.
                             La ABI es necesaria para que Web3.py sepa cómo interactuar
                             con el contrato (por ejemplo, qué funciones se pueden llamar).
+            - tamano_cache (int): Número máximo de resultados de lectura que se conservan en la caché.
+            - contract_code_hash (str, opcional): Hash keccak esperado del bytecode desplegado en
+                            `contract_address`. Si se indica, se verifica al iniciar la sesión.
+            - ruta_modelo_gas (str): Archivo en el que se persisten los límites de gas aprendidos.
+            - margen_gas (float): Margen de seguridad sobre el consumo de gas observado (0.2 = 20 %).
+            - estrategia_comisiones (EstrategiaComisiones, opcional): Cálculo de las comisiones de gas y de
+                            los reemplazos. Si no se indica, se usa la configuración por defecto.
+            - firmador (FirmadorProcesos, opcional): Firma las transacciones de `submit_many` en un pool de
+                            procesos. Si no se indica, se firman en el hilo que llama.
+            - metricas (Metricas, opcional): Registro en el que se anotan las peticiones al nodo, las
+                            transacciones y las lecturas. Si no se indica, se crea uno propio.
+            - trazador (Trazador, opcional): Registra un tramo por cada fase de las transacciones y de las
+                            lecturas, y perfila las operaciones seleccionadas. Por defecto, desactivado.
 
             Además, se carga la configuración del socio principal desde las variables de entorno, incluyendo
             su dirección y clave privada, para ser usadas en operaciones que requieran autenticación.
@@ -77,10 +147,34 @@ class BlockchainManager:
             2. Carga el contrato inteligente utilizando su dirección y la ruta al archivo ABI especificadas.
             Si no se proporciona una dirección de contrato, la carga del contrato debe ser manejada
             externamente antes de interactuar con él.
+            3. Inicia la sesión: obtiene una única vez el chain id y verifica el bytecode del contrato.
             
         """
+        self.metricas = metricas or Metricas()
+        self.trazador = trazador or Trazador()
         self.init_web3(ganache_url)
+        # Cuenta y cronometra todas las peticiones JSON-RPC que pasan por Web3. Si la instancia de Web3
+        # ya tenía el de otro gestor (por ejemplo, en CadenaLocal) se sustituye por el de este
+        if 'metricas' in self.web3.middleware_onion:
+            self.web3.middleware_onion.remove('metricas')
+        self.web3.middleware_onion.add(self.metricas.middleware_rpc, name='metricas')
+        if self.trazador.activo:
+            if 'trazas' in self.web3.middleware_onion:
+                self.web3.middleware_onion.remove('trazas')
+            self.web3.middleware_onion.add(self.trazador.middleware_rpc, name='trazas')
         self.load_contract(contract_address, abi_path)
+        self.iniciar_sesion(contract_code_hash)
+        self.nonce_manager = NonceManager(self.web3)
+        self.modelo_gas = ModeloGas(ruta_modelo_gas, margen_gas)
+        self.estrategia_comisiones = estrategia_comisiones or EstrategiaComisiones()
+        self.firmador = firmador
+        self.cache_lecturas = CacheLecturas(tamano_cache)
+        self.single_flight = SingleFlight()
+        self._bloque_conocido = None
+        self._cerrojo_bloque = threading.Lock()
+        self._seguimiento = threading.local()
+        self.notificador_recibos = NotificadorRecibos(self)
+        self.metricas.indicador('recibos_pendientes', self.notificador_recibos.pendientes)
         # Carga las configuraciones específicas del socio principal
         self.socio_principal_address = socio_principal_address
         self.socio_principal_private_key = socio_principal_private_key
@@ -94,7 +188,11 @@ class BlockchainManager:
             ejecutar pruebas en un entorno controlado sin costos de gas.
 
             Parámetros:
-            - ganache_url: La URL de la instancia de Ganache a la que se desea conectar.
+            - ganache_url: La URL de la instancia de Ganache a la que se desea conectar. Se pueden indicar
+            varios nodos, como lista o separados por comas; en ese caso se usa un `ProveedorMultiNodo`, que
+            envía las lecturas al nodo más rápido, fija las escrituras a un nodo y aparta los que fallan.
+
+            Las conexiones HTTP se mantienen abiertas (keep-alive) en un pool compartido por todos los hilos.
 
             Proceso:
             - Intenta establecer una conexión utilizando la URL proporcionada. Si la conexión es exitosa,
@@ -107,7 +205,13 @@ class BlockchainManager:
             
         """
         try:
-            self.web3 = Web3(Web3.HTTPProvider(ganache_url))
+            urls = [url.strip() for url in ganache_url.split(',')] if isinstance(ganache_url, str) else list(ganache_url)
+            # Sesión HTTP reutilizable, compartida por el proveedor y las peticiones JSON-RPC por lotes
+            self.rpc_session = crear_sesion()
+            if len(urls) > 1:
+                self.web3 = Web3(ProveedorMultiNodo(urls, timeout=self.TIMEOUT_RPC))
+            else:
+                self.web3 = Web3(Web3.HTTPProvider(urls[0], request_kwargs={'timeout': self.TIMEOUT_RPC}, session=self.rpc_session))
             if not self.web3.is_connected():
                 raise ConnectionError("No se pudo conectar a Ganache.")
         except ConnectionError as e:
@@ -136,14 +240,38 @@ class BlockchainManager:
         """
         try:
             self.contract_address = self.web3.to_checksum_address(contract_address)
-            with open(abi_path, 'r') as abi_file:
-                self.contract_abi = json.load(abi_file)
+            self.contract_abi = load_abi(abi_path)
             self.contract = self.web3.eth.contract(address=self.contract_address, abi=self.contract_abi)
         except Exception as e:
             logging.error(f"Error al cargar el contrato: {e}")
             raise
 
-    def sign_and_send_transaction(self, function_call, account_address, private_key, ether_value=0, gas_limit=None):
+    def iniciar_sesion(self, contract_code_hash=None):
+        """
+            Obtiene una sola vez los datos de la red que no cambian durante la sesión y comprueba que en
+            la dirección configurada hay un contrato desplegado.
+
+            Parámetros:
+            - contract_code_hash (str, opcional): Hash keccak esperado del bytecode del contrato. Si se
+            indica y no coincide con el desplegado, la sesión no se inicia.
+
+            Excepciones:
+            - ValueError: Se lanza si no hay código en la dirección del contrato o si el hash del código
+            no coincide con el esperado.
+        """
+        try:
+            self.chain_id = self.web3.eth.chain_id
+            codigo = self.web3.eth.get_code(self.contract_address)
+            if not codigo:
+                raise ValueError(f"No hay ningún contrato desplegado en {self.contract_address}.")
+            self.contract_code_hash = self.web3.to_hex(self.web3.keccak(codigo))
+            if contract_code_hash and contract_code_hash.lower() != self.contract_code_hash:
+                raise ValueError(f"El bytecode desplegado en {self.contract_address} no coincide con el esperado.")
+        except Exception as e:
+            logging.error(f"Error al iniciar la sesión: {e}")
+            raise
+
+    def sign_and_send_transaction(self, function_call, account_address, private_key, ether_value=0, gas_limit=None, plazo_reemplazo=None):
         """
             Firma y envía una transacción al blockchain, invocando una función específica de un contrato inteligente
             y asegurando que el emisor tenga fondos suficientes para cubrir el costo de gas y el valor de la transacción.
@@ -159,8 +287,11 @@ class BlockchainManager:
             la transacción. Debe empezar con '0x' y ser una cadena hexadecimal válida.
             - ether_value (int): El valor de la transacción en wei. Es el valor enviado junto con la llamada a la 
             función del contrato. Debe ser un número no negativo.
-            - gas_limit (int, opcional): El límite de gas para la transacción. Si no se proporciona, se estima un valor
-            por defecto. Debe ser suficiente para cubrir la ejecución de la transacción.
+            - gas_limit (int, opcional): El límite de gas para la transacción. Si no se proporciona, se toma del
+            modelo de gas aprendido para la función (sembrado con `estimate_gas` la primera vez) y, si la
+            transacción lo agota, se reenvía una vez con una estimación del nodo.
+            - plazo_reemplazo (float, opcional): Segundos que se espera a que se mine la transacción antes de
+            reemplazarla con comisiones mayores. Por defecto, `PLAZO_REEMPLAZO`.
 
             Retorna:
             Una cadena de texto que representa un mensaje de éxito y un resumen del recibo de la transacción si esta
@@ -177,41 +308,24 @@ class BlockchainManager:
             - Exception: Captura y lanza cualquier otro error no especificado que pueda ocurrir durante el proceso
             de firma y envío de la transacción.
         """
-        if ether_value < 0:
-            raise ValueError("El valor de la transacción no puede ser negativo.")
-        if gas_limit is not None and (gas_limit < 21000 or gas_limit > 8000000):
-            raise ValueError("El límite de gas proporcionado es inadecuado.")
-
+        inicio = time.perf_counter()
+        resultado = 'error'
         try:
-            account_address = self.web3.to_checksum_address(account_address.strip())
-            if not is_valid_ethereum_address(account_address):
-                raise ValueError(f"La dirección {account_address} no es válida.")
-            
-            nonce = self.web3.eth.get_transaction_count(account_address)
-            value_in_wei = ether_value
-            gas_price = self.web3.eth.gas_price
-            transaction = function_call.build_transaction({
-                'from': account_address,
-                'chainId': self.web3.eth.chain_id,
-                'gas': gas_limit or 200000,
-                'gasPrice': self.web3.to_wei('50', 'gwei'),
-                'nonce': nonce,
-                'value': value_in_wei,
-            })
-            
-            if not isinstance(private_key, str) or not private_key.startswith('0x'):
-                raise ValueError("La clave privada debe ser una cadena hexadecimal que comience con 0x.")
-            
-            signed_txn = self.web3.eth.account.sign_transaction(transaction, private_key)
-            txn_hash = self.web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-            receipt = self.web3.eth.wait_for_transaction_receipt(txn_hash)
-            
-            if receipt.status == 0:
-                logging.error(f"La transacción falló. Recibo: {receipt}")
-                raise ValueError("La transacción falló.")
-            
-            logging.info(f"Transacción exitosa. Recibo: {receipt}")
-            return format_transaction_receipt(receipt)
+            with self.trazador.perfilar(function_call.fn_name), \
+                    self.trazador.tramo(f"transaccion:{function_call.fn_name}", 'transaccion') as tramo:
+                with self.trazador.tramo('construir', 'transaccion'):
+                    transaction, account_address = self.build_transaction(function_call, account_address, ether_value, gas_limit)
+                transaction, txn_hash = self.sign_and_broadcast(transaction, account_address, private_key)
+                tramo.anotar(hash=txn_hash.hex(), nonce=transaction['nonce'])
+                with self.trazador.tramo('esperar_recibo', 'transaccion'):
+                    receipt = self.esperar_recibo(transaction, txn_hash, private_key, plazo_reemplazo=plazo_reemplazo)
+                if gas_limit is None and self._agoto_gas(transaction, receipt):
+                    with self.trazador.tramo('reintento_sin_gas', 'transaccion'):
+                        transaction, receipt = self._reintentar_sin_gas(function_call, transaction, receipt, private_key, plazo_reemplazo=plazo_reemplazo)
+                with self.trazador.tramo('finalizar', 'transaccion'):
+                    receipt = self.finalizar_transaccion(function_call, transaction, receipt)
+            resultado = 'ok'
+            return receipt
         
         except ValueError as e:
             logging.error(f"Error de valor: {e}")
@@ -227,16 +341,638 @@ class BlockchainManager:
 
         except TimeExhausted as e:
             logging.error(f"Tiempo agotado esperando la transacción: {e}")
+            resultado = 'tiempo_agotado'
+            raise
+
+        except OperacionCancelada as e:
+            logging.error(f"Espera cancelada: {e}")
+            resultado = 'cancelada'
             raise
 
         except ContractLogicError as e:
             logging.error(f"Error de lógica del contrato: {e}")
+            resultado = 'revertida'
             raise
 
         except Exception as e:
             logging.error(f"Error al realizar la transacción: {e}")
             raise            
+
+        finally:
+            self.metricas.incrementar('transacciones_total', funcion=function_call.fn_name, resultado=resultado)
+            self.metricas.observar('transaccion_duracion_segundos', time.perf_counter() - inicio, funcion=function_call.fn_name)
+
+    def build_transaction(self, function_call, account_address, ether_value=0, gas_limit=None):
+        """
+            Valida los parámetros y construye el diccionario de la transacción (sin nonce) para una
+            llamada a función del contrato.
+
+            Parámetros:
+            - function_call (ContractFunction): La función del contrato a invocar.
+            - account_address (str): La dirección Ethereum desde la cual se envía la transacción.
+            - ether_value (int): El valor de la transacción en wei.
+            - gas_limit (int, opcional): El límite de gas para la transacción. Si no se indica, se usa el
+            límite aprendido por `modelo_gas` para la función o, si aún no hay datos, una estimación del nodo.
+
+            Las comisiones de gas se toman de `comisiones`.
+
+            Retorna:
+            Una tupla (transaction, account_address) con la transacción construida y la dirección
+            del emisor en formato checksum.
+
+            Excepciones:
+            - ValueError: Se lanza si el valor es negativo, el límite de gas es inadecuado o la
+            dirección no es válida.
+        """
+        if ether_value < 0:
+            raise ValueError("El valor de la transacción no puede ser negativo.")
+        if gas_limit is not None and (gas_limit < 21000 or gas_limit > 8000000):
+            raise ValueError("El límite de gas proporcionado es inadecuado.")
+
+        with self.trazador.tramo('checksum', 'transaccion'):
+            account_address = self.web3.to_checksum_address(account_address.strip())
+            if not is_valid_ethereum_address(account_address):
+                raise ValueError(f"La dirección {account_address} no es válida.")
+
+        value_in_wei = ether_value
+        if gas_limit is None:
+            gas_limit = self.modelo_gas.limite(ModeloGas.clave(function_call))
+            if gas_limit is None:
+                gas_limit = self._estimar_gas(function_call, account_address, value_in_wei)
+
+        with self.trazador.tramo('comisiones', 'transaccion'):
+            comisiones = self.comisiones()
+        with self.trazador.tramo('codificar', 'transaccion'):
+            transaction = function_call.build_transaction({
+                'from': account_address,
+                'chainId': self.chain_id,
+                'gas': gas_limit,
+                'value': value_in_wei,
+                **comisiones,
+            })
+        return transaction, account_address
+
+    def _estimar_gas(self, function_call, account_address, value_in_wei):
+        """Pide al nodo una estimación de gas para la llamada, siembra con ella el modelo de gas y retorna el límite propuesto."""
+        with self.trazador.tramo('estimar_gas', 'transaccion'):
+            estimacion = function_call.estimate_gas({'from': account_address, 'value': value_in_wei})
+        return self.modelo_gas.sembrar(ModeloGas.clave(function_call), estimacion)
+
+    @staticmethod
+    def _agoto_gas(transaction, receipt):
+        return receipt['status'] == 0 and receipt['gasUsed'] >= transaction['gas']
+
+    def _reintentar_sin_gas(self, function_call, transaction, receipt, private_key, timeout=120, plazo_reemplazo=None):
+        """
+            Reenvía una vez, con una estimación del nodo, una transacción que agotó el límite de gas
+            aprendido. El consumo de algunas funciones (por ejemplo, `depositarGarantia`) depende del estado
+            del contrato, así que el mayor consumo reciente no siempre basta.
+
+            Retorna:
+            Una tupla (transaction, receipt) con la transacción reenviada y su recibo.
+        """
+        logging.error(f"La transacción de {function_call.fn_name} agotó su límite de gas ({transaction['gas']}); se reenvía con una estimación del nodo.")
+        try:
+            # Actualiza la caché de lecturas y descarta los datos del modelo de gas para la función
+            self.finalizar_transaccion(function_call, transaction, receipt)
+        except ValueError:
+            pass
+        account_address = transaction['from']
+        gas_limit = self._estimar_gas(function_call, account_address, transaction['value'])
+        transaction, account_address = self.build_transaction(function_call, account_address, transaction['value'], gas_limit)
+        transaction, txn_hash = self.sign_and_broadcast(transaction, account_address, private_key)
+        return transaction, self.esperar_recibo(transaction, txn_hash, private_key, timeout, plazo_reemplazo)
+
+    def sign_and_broadcast(self, transaction, account_address, private_key):
+        """
+            Asigna un nonce local a la transacción, la firma y la difunde a la red sin esperar
+            a que sea minada.
+
+            Parámetros:
+            - transaction (dict): La transacción construida con `build_transaction`.
+            - account_address (str): La dirección (checksum) del emisor.
+            - private_key (str): La clave privada del emisor. Debe empezar con '0x'.
+
+            Retorna:
+            Una tupla (transaction, txn_hash) con la transacción firmada, ya con su nonce, y el hash
+            (HexBytes) con el que se difundió.
+
+            Excepciones:
+            - ValueError: Se lanza si la clave privada no tiene el formato correcto.
+            - Exception: Cualquier error del nodo al recibir la transacción. En ese caso el nonce
+            asignado se devuelve o la cuenta se resincroniza con la red.
+        """
+        if not isinstance(private_key, str) or not private_key.startswith('0x'):
+            raise ValueError("La clave privada debe ser una cadena hexadecimal que comience con 0x.")
+
+        # El cerrojo de envío se adquiere fuera del `with` para medir en la traza cuánto se espera turno
+        with self.trazador.tramo('esperar_turno_envio', 'transaccion'):
+            self.nonce_manager.envio(account_address).acquire()
+        try:
+            with self.trazador.tramo('nonce', 'transaccion'):
+                nonce = self.nonce_manager.asignar(account_address)
+            transaction = dict(transaction, nonce=nonce)
+            try:
+                with self.trazador.tramo('firma', 'transaccion'):
+                    signed_txn = self.web3.eth.account.sign_transaction(transaction, private_key)
+                self._notificar('firmada', signed_txn.hash)
+                with self.trazador.tramo('difusion', 'transaccion'):
+                    txn_hash = self.web3.eth.send_raw_transaction(signed_txn.rawTransaction)
+            except Exception as e:
+                self.nonce_manager.descartar(account_address, nonce, e)
+                raise
+        finally:
+            self.nonce_manager.envio(account_address).release()
+        self._notificar('enviada', txn_hash)
+        return transaction, txn_hash
+
+    def finalizar_transaccion(self, function_call, transaction, receipt):
+        """
+            Procesa el recibo de una transacción propia: actualiza la caché de lecturas y el modelo de
+            gas, y comprueba su estado.
+
+            Parámetros:
+            - function_call (ContractFunction): La función del contrato invocada.
+            - transaction (dict): La transacción enviada.
+            - receipt (TxReceipt): El recibo devuelto por el nodo.
+
+            Retorna:
+            El recibo formateado (ver `check_receipt`).
+        """
+        self.invalidar_lecturas(function_call, transaction['from'], receipt)
+        self.metricas.observar('gas_usado', receipt['gasUsed'], funcion=function_call.fn_name)
+        if receipt['status'] != 1:
+            self.metricas.incrementar('reversiones_total', funcion=function_call.fn_name)
+        # Las transacciones revertidas no reflejan el consumo real, salvo si agotaron el gas
+        if receipt['status'] == 1 or receipt['gasUsed'] >= transaction['gas']:
+            self.modelo_gas.registrar(ModeloGas.clave(function_call), receipt['gasUsed'], transaction['gas'])
+        return self.check_receipt(receipt)
+
+    def check_receipt(self, receipt):
+        """
+            Comprueba el estado de un recibo de transacción y lo devuelve formateado.
+
+            Parámetros:
+            - receipt (TxReceipt): El recibo devuelto por el nodo.
+
+            Retorna:
+            El recibo formateado con `format_transaction_receipt`.
+
+            Excepciones:
+            - ValueError: Se lanza si la transacción falló (status 0).
+        """
+        if receipt.status == 0:
+            logging.error(f"La transacción falló. Recibo: {receipt}")
+            raise ValueError("La transacción falló.")
+
+        logging.info(f"Transacción exitosa. Recibo: {receipt}")
+        return format_transaction_receipt(receipt)
+
+    def submit_many(self, operaciones, timeout=120):
+        """
+            Firma y difunde varias llamadas a funciones del contrato de forma consecutiva y, una vez
+            enviadas todas, recoge sus recibos. Gracias al gestor de nonces local, varias transacciones
+            de la misma cuenta pueden incluirse en el mismo bloque en lugar de necesitar un bloque cada una.
+
+            Parámetros:
+            - operaciones (list): Lista de diccionarios con las claves 'function_call', 'account_address'
+            y 'private_key', y opcionalmente 'ether_value' (wei), 'gas_limit' y 'plazo_reemplazo'. Por ejemplo:
+            {'function_call': contract.functions.altaCliente(direccion), 'account_address': prestamista,
+            'private_key': clave}.
+            - timeout (int): Segundos máximos de espera por cada recibo.
+
+            Si hay un `firmador`, todas las transacciones se firman juntas en su pool de procesos (ver
+            `difundir_lote_firmado`).
+
+            Retorna:
+            Una lista con un elemento por operación y en el mismo orden: el recibo formateado si la
+            transacción fue minada con éxito, o la excepción producida en caso contrario. Un fallo en
+            una operación no interrumpe el envío de las demás.
+        """
+        if self.firmador is not None:
+            pendientes = self.difundir_lote_firmado(operaciones)
+        else:
+            pendientes = []
+            for operacion in operaciones:
+                try:
+                    transaction, account_address = self.build_transaction(
+                        operacion['function_call'],
+                        operacion['account_address'],
+                        operacion.get('ether_value', 0),
+                        operacion.get('gas_limit'),
+                    )
+                    transaction, txn_hash = self.sign_and_broadcast(transaction, account_address, operacion['private_key'])
+                    # Se registra ya para que todos los recibos del lote se resuelvan con las mismas consultas por bloque
+                    self.notificador_recibos.registrar(txn_hash)
+                    pendientes.append((transaction, txn_hash))
+                except Exception as e:
+                    logging.error(f"Error al enviar la transacción del lote: {e}")
+                    pendientes.append(e)
+
+        resultados = []
+        for operacion, pendiente in zip(operaciones, pendientes):
+            if isinstance(pendiente, Exception):
+                resultados.append(pendiente)
+                continue
+            transaction, txn_hash = pendiente
+            try:
+                receipt = self.esperar_recibo(transaction, txn_hash, operacion['private_key'], timeout, operacion.get('plazo_reemplazo'))
+                if operacion.get('gas_limit') is None and self._agoto_gas(transaction, receipt):
+                    transaction, receipt = self._reintentar_sin_gas(
+                        operacion['function_call'], transaction, receipt, operacion['private_key'], timeout, operacion.get('plazo_reemplazo')
+                    )
+                resultados.append(self.finalizar_transaccion(operacion['function_call'], transaction, receipt))
+            except Exception as e:
+                logging.error(f"Error al esperar la transacción del lote {txn_hash.hex()}: {e}")
+                resultados.append(e)
+
+        for operacion, resultado in zip(operaciones, resultados):
+            self.metricas.incrementar(
+                'transacciones_total',
+                funcion=operacion['function_call'].fn_name,
+                resultado='error' if isinstance(resultado, Exception) else 'ok'
+            )
+        return resultados
                            
+    def difundir_lote_firmado(self, operaciones, al_firmar=None):
+        """
+            Construye las transacciones de `operaciones` (ver `submit_many`), les asigna nonce, las firma
+            todas a la vez con `firmador` (o en el propio hilo si no hay) y las difunde en orden de nonce,
+            sin esperar los recibos.
+
+            Los cerrojos de envío de todas las cuentas del lote se mantienen desde la asignación de
+            nonces hasta la difusión. Si una transacción de una cuenta no se puede firmar o difundir, las
+            siguientes de esa cuenta en el lote no se envían (tendrían un hueco de nonce), se devuelven
+            como `EnvioOmitido` y la cuenta se resincroniza con la red.
+
+            Parámetros:
+            - operaciones (list): Las operaciones del lote, con el formato de `submit_many`.
+            - al_firmar (callable, opcional): Se llama con la lista de tuplas (indice, transaction,
+            raw_transaction, txn_hash) de las transacciones firmadas antes de difundir ninguna, por
+            ejemplo para guardarlas de forma persistente (ver `BandejaSalida`). Si lanza una excepción,
+            no se difunde nada y todas las operaciones firmadas terminan con esa excepción.
+
+            Retorna:
+            Una lista con un elemento por operación: la tupla (transaction, txn_hash) o la excepción producida.
+        """
+        pendientes = [None] * len(operaciones)
+        construidas = []
+        for indice, operacion in enumerate(operaciones):
+            try:
+                if not isinstance(operacion['private_key'], str) or not operacion['private_key'].startswith('0x'):
+                    raise ValueError("La clave privada debe ser una cadena hexadecimal que comience con 0x.")
+                transaction, account_address = self.build_transaction(
+                    operacion['function_call'],
+                    operacion['account_address'],
+                    operacion.get('ether_value', 0),
+                    operacion.get('gas_limit'),
+                )
+                construidas.append((indice, transaction, account_address))
+            except Exception as e:
+                logging.error(f"Error al construir la transacción del lote: {e}")
+                pendientes[indice] = e
+
+        with ExitStack() as cerrojos:
+            # Orden fijo de adquisición para no bloquearse con otros hilos que envían lotes
+            for cuenta in sorted({account_address for _, _, account_address in construidas}):
+                cerrojos.enter_context(self.nonce_manager.envio(cuenta))
+
+            construidas = [
+                (indice, dict(transaction, nonce=self.nonce_manager.asignar(account_address)), account_address)
+                for indice, transaction, account_address in construidas
+            ]
+            firmador = self.firmador or FirmadorProcesos(procesos=1)
+            firmadas = firmador.firmar(
+                [transaction for _, transaction, _ in construidas],
+                [operaciones[indice]['private_key'] for indice, _, _ in construidas],
+            )
+
+            fallidas = {}
+            if al_firmar is not None:
+                try:
+                    al_firmar([
+                        (indice, transaction, *firmada)
+                        for (indice, transaction, _), firmada in zip(construidas, firmadas)
+                        if not isinstance(firmada, Exception)
+                    ])
+                except Exception as e:
+                    logging.error(f"Error al registrar las transacciones firmadas del lote: {e}")
+                    for indice, transaction, account_address in construidas:
+                        if account_address not in fallidas:
+                            self.nonce_manager.descartar(account_address, transaction['nonce'], e)
+                            fallidas[account_address] = e
+                        pendientes[indice] = e
+                    return pendientes
+
+            for (indice, transaction, account_address), firmada in zip(construidas, firmadas):
+                if account_address in fallidas:
+                    pendientes[indice] = EnvioOmitido(f"No se envió: falló una transacción anterior de la cuenta ({fallidas[account_address]}).")
+                    continue
+                try:
+                    if isinstance(firmada, Exception):
+                        raise firmada
+                    raw_transaction, hash_firmado = firmada
+                    self._notificar('firmada', hash_firmado)
+                    txn_hash = self.web3.eth.send_raw_transaction(raw_transaction)
+                except Exception as e:
+                    logging.error(f"Error al enviar la transacción del lote: {e}")
+                    self.nonce_manager.descartar(account_address, transaction['nonce'], e)
+                    fallidas[account_address] = e
+                    pendientes[indice] = e
+                    continue
+                self._notificar('enviada', txn_hash)
+                self.notificador_recibos.registrar(txn_hash)
+                pendientes[indice] = (transaction, txn_hash)
+        return pendientes
+
+    def comisiones(self):
+        """
+            Retorna las comisiones de gas para una transacción nueva según `estrategia_comisiones`.
+
+            El historial de comisiones (`eth_feeHistory`) se consulta como mucho una vez por bloque. Si el
+            nodo no lo admite, se usa `gasPrice` con el precio que indica el nodo.
+
+            Retorna:
+            Un diccionario con 'maxFeePerGas' y 'maxPriorityFeePerGas', o con 'gasPrice'.
+        """
+        bloque = self.bloque_actual()
+        comisiones = self.estrategia_comisiones.vigentes(bloque)
+        if comisiones is not None:
+            return comisiones
+
+        estrategia = self.estrategia_comisiones
+        try:
+            historial = self.web3.eth.fee_history(estrategia.bloques_historial, 'latest', [estrategia.percentil])
+        except Exception as e:
+            logging.error(f"Error al obtener el historial de comisiones: {e}")
+            historial = None
+        if not historial or not historial.get('baseFeePerGas'):
+            return estrategia.calcular(bloque, gas_price=self.web3.eth.gas_price)
+        return estrategia.calcular(bloque, historial)
+
+    def esperar_recibo(self, transaction, txn_hash, private_key, timeout=120, plazo_reemplazo=None):
+        """
+            Espera el recibo de una transacción propia. Si no se ha minado pasados `plazo_reemplazo`
+            segundos, la vuelve a firmar con el mismo nonce y comisiones mayores (ver
+            `EstrategiaComisiones.reemplazo`) y la difunde de nuevo, tantas veces como haga falta
+            dentro del `timeout`. Se devuelve el recibo de la versión que se mine primero.
+
+            Los recibos se obtienen a través de `notificador_recibos`, que consulta el nodo una vez por
+            bloque para todas las transacciones pendientes.
+
+            Parámetros:
+            - transaction (dict): La transacción firmada, con su nonce (ver `sign_and_broadcast`).
+            - txn_hash (HexBytes): El hash con el que se difundió.
+            - private_key (str): La clave privada del emisor, para firmar los reemplazos.
+            - timeout (int): Segundos máximos de espera.
+            - plazo_reemplazo (float, opcional): Segundos de espera antes de cada reemplazo. Por defecto,
+            `PLAZO_REEMPLAZO`.
+
+            Retorna:
+            El recibo (TxReceipt) de la transacción minada.
+
+            Excepciones:
+            - TimeExhausted: Se lanza si ninguna versión de la transacción se mina dentro del `timeout`.
+            - OperacionCancelada: Se lanza si se cancela la espera (ver `seguimiento`). La transacción
+            ya difundida puede minarse igualmente.
+        """
+        plazo_reemplazo = plazo_reemplazo or self.PLAZO_REEMPLAZO
+        cancelacion = getattr(self._seguimiento, 'cancelacion', None)
+        futuros = {self.notificador_recibos.registrar(txn_hash): txn_hash}
+        inicio = time.monotonic()
+        siguiente_reemplazo = inicio + plazo_reemplazo
+        try:
+            while True:
+                for futuro in futuros:
+                    if futuro.done() and not futuro.cancelled():
+                        self._notificar('minada', futuros[futuro])
+                        self.metricas.observar('confirmacion_segundos', time.monotonic() - inicio)
+                        return futuro.result()
+
+                if cancelacion is not None and cancelacion.is_set():
+                    raise OperacionCancelada(f"Se canceló la espera de la transacción {txn_hash.hex()}.")
+
+                ahora = time.monotonic()
+                if ahora - inicio >= timeout:
+                    raise TimeExhausted(f"La transacción {txn_hash.hex()} no se ha minado tras {timeout} segundos.")
+
+                if ahora >= siguiente_reemplazo:
+                    siguiente_reemplazo = ahora + plazo_reemplazo
+                    reemplazo = dict(transaction, **self.estrategia_comisiones.reemplazo(transaction, self.comisiones()))
+                    try:
+                        signed_txn = self.web3.eth.account.sign_transaction(reemplazo, private_key)
+                        enviado = self.web3.eth.send_raw_transaction(signed_txn.rawTransaction)
+                        futuros[self.notificador_recibos.registrar(enviado)] = enviado
+                        transaction = reemplazo
+                        self._notificar('reemplazada', enviado)
+                        logging.info(f"Transacción {txn_hash.hex()} reemplazada por {enviado.hex()} con nonce {transaction['nonce']}.")
+                    except Exception as e:
+                        # Si alguna versión ya se ha minado, el nodo rechaza el reemplazo; el recibo llega con el siguiente bloque
+                        logging.error(f"Error al reemplazar la transacción {txn_hash.hex()}: {e}")
+
+                espera = min(inicio + timeout, siguiente_reemplazo) - time.monotonic()
+                if cancelacion is not None:
+                    espera = min(espera, self.INTERVALO_SONDEO)
+                wait(list(futuros), timeout=max(espera, 0), return_when=FIRST_COMPLETED)
+        finally:
+            for futuro, enviado in futuros.items():
+                if not futuro.done():
+                    self.notificador_recibos.cancelar(enviado)
+
+    @contextmanager
+    def seguimiento(self, progreso=None, cancelacion=None):
+        """
+            Contexto para seguir las transacciones que se envíen desde el hilo actual, por ejemplo desde
+            un hilo de trabajo de la interfaz gráfica.
+
+            Parámetros:
+            - progreso (callable, opcional): Función que se llama con (fase, txn_hash) cuando una
+            transacción se firma ('firmada'), se difunde ('enviada'), se reemplaza ('reemplazada') o
+            se mina ('minada').
+            - cancelacion (threading.Event, opcional): Evento que, al activarse, interrumpe la espera de
+            los recibos con `OperacionCancelada`.
+        """
+        anterior = (getattr(self._seguimiento, 'progreso', None), getattr(self._seguimiento, 'cancelacion', None))
+        self._seguimiento.progreso, self._seguimiento.cancelacion = progreso, cancelacion
+        try:
+            yield
+        finally:
+            self._seguimiento.progreso, self._seguimiento.cancelacion = anterior
+
+    def _notificar(self, fase, txn_hash):
+        progreso = getattr(self._seguimiento, 'progreso', None)
+        if progreso is not None:
+            progreso(fase, txn_hash)
+
+    def bloque_actual(self):
+        """
+            Retorna el número del último bloque de la cadena. El valor se reutiliza durante
+            `INTERVALO_BLOQUE` segundos para no consultar al nodo en cada lectura; cuando cambia,
+            se descartan de la caché las lecturas de bloques anteriores.
+        """
+        ahora = time.monotonic()
+        with self._cerrojo_bloque:
+            if self._bloque_conocido is not None and ahora - self._bloque_conocido[1] < self.INTERVALO_BLOQUE:
+                return self._bloque_conocido[0]
+
+        numero = self.web3.eth.block_number
+        with self._cerrojo_bloque:
+            self._bloque_conocido = (numero, ahora)
+        self.cache_lecturas.invalidar_anteriores(numero)
+        return numero
+
+    def invalidar_lecturas(self, function_call, account_address, receipt):
+        """
+            Descarta de la caché las lecturas afectadas por una transacción propia: las de bloques
+            anteriores al de la transacción y las que incluyen al emisor o a alguna de las direcciones
+            pasadas como argumento a la función del contrato.
+
+            Parámetros:
+            - function_call (ContractFunction): La función del contrato invocada.
+            - account_address (str): La dirección del emisor de la transacción.
+            - receipt (TxReceipt): El recibo de la transacción.
+        """
+        numero = receipt['blockNumber']
+        with self._cerrojo_bloque:
+            if self._bloque_conocido is None or numero >= self._bloque_conocido[0]:
+                self._bloque_conocido = (numero, time.monotonic())
+        self.cache_lecturas.invalidar_anteriores(numero)
+
+        direcciones = [account_address] + [arg for arg in function_call.args if isinstance(arg, str) and self.web3.is_address(arg)]
+        for direccion in direcciones:
+            self.cache_lecturas.invalidar_direccion(self.web3.to_checksum_address(direccion))
+
+    def leer_contrato(self, nombre, *args):
+        """
+            Ejecuta una función de lectura del contrato a través de la caché de lecturas.
+
+            El resultado se busca por (funcion, argumentos, bloque actual). Si no está en la caché se
+            consulta al nodo fijando ese mismo bloque y se guarda para las siguientes lecturas. Si otro
+            hilo ya está realizando la misma consulta, se espera y se comparte su resultado en lugar de
+            enviar una petición más al nodo.
+
+            Parámetros:
+            - nombre (str): El nombre de la función del contrato, por ejemplo 'obtenerPrestamosPorPrestatario'.
+            - args: Los argumentos de la función. Las direcciones deben estar en formato checksum.
+
+            Retorna:
+            El resultado de la función tal y como lo devuelve Web3.
+        """
+        with self.trazador.perfilar(nombre), self.trazador.tramo(f"lectura:{nombre}", 'lectura') as tramo:
+            bloque = self.bloque_actual()
+            clave = (nombre, args, bloque)
+            encontrado, valor = self.cache_lecturas.obtener(clave)
+            if encontrado:
+                self.metricas.incrementar('lecturas_total', funcion=nombre, origen='cache')
+                tramo.anotar(origen='cache')
+                return valor
+
+            self.metricas.incrementar('lecturas_total', funcion=nombre, origen='nodo')
+            tramo.anotar(origen='nodo', bloque=bloque)
+            with self.metricas.cronometrar('lectura_latencia_segundos', funcion=nombre):
+                valor = self.single_flight.ejecutar(
+                    clave, lambda: getattr(self.contract.functions, nombre)(*args).call(block_identifier=bloque)
+                )
+            self.cache_lecturas.guardar(clave, valor)
+            return valor
+
+    def rpc_batch(self, peticiones):
+        """
+            Envía varias peticiones JSON-RPC al nodo en un único lote (una sola petición HTTP).
+
+            Si el proveedor no es HTTP (por ejemplo, un proveedor en memoria para pruebas), las peticiones
+            se realizan de una en una a través de Web3, de modo que pasan por sus middlewares.
+
+            Parámetros:
+            - peticiones (list): Lista de tuplas (metodo, parametros), por ejemplo ('eth_call', [tx, 'latest']).
+
+            Retorna:
+            Una lista con el campo `result` de cada respuesta, en el mismo orden que las peticiones.
+
+            Excepciones:
+            - Exception: Se lanza si el nodo rechaza el lote o si alguna de las peticiones devuelve un error.
+        """
+        if not peticiones:
+            return []
+
+        provider = self.web3.provider
+        if isinstance(provider, (HTTPProvider, ProveedorMultiNodo)):
+            lote = [
+                {'jsonrpc': '2.0', 'id': indice, 'method': metodo, 'params': parametros}
+                for indice, (metodo, parametros) in enumerate(peticiones)
+            ]
+            # Los lotes no pasan por los middlewares de Web3: se anotan aquí como método 'lote'
+            self.metricas.incrementar('rpc_llamadas_en_lote_total', len(lote))
+            with self.metricas.cronometrar('rpc_latencia_segundos', metodo='lote'):
+                try:
+                    if isinstance(provider, ProveedorMultiNodo):
+                        respuestas = provider.enviar_lote(lote)
+                    else:
+                        request_kwargs = provider.get_request_kwargs()
+                        response = self.rpc_session.post(
+                            provider.endpoint_uri,
+                            data=json.dumps(lote),
+                            headers=request_kwargs.get('headers'),
+                            timeout=request_kwargs.get('timeout', self.TIMEOUT_RPC),
+                        )
+                        response.raise_for_status()
+                        respuestas = response.json()
+                except Exception:
+                    self.metricas.incrementar('rpc_peticiones_total', metodo='lote', resultado='excepcion')
+                    raise
+            self.metricas.incrementar('rpc_peticiones_total', metodo='lote', resultado='ok')
+            if not isinstance(respuestas, list):
+                raise Exception(f"El nodo no admite peticiones por lotes: {respuestas}")
+            respuestas = sorted(respuestas, key=lambda respuesta: respuesta['id'])
+        else:
+            return [self.web3.manager.request_blocking(metodo, parametros) for metodo, parametros in peticiones]
+
+        resultados = []
+        for (metodo, _), respuesta in zip(peticiones, respuestas):
+            if 'error' in respuesta:
+                raise Exception(f"Error en la petición {metodo}: {respuesta['error'].get('message', respuesta['error'])}")
+            resultados.append(respuesta['result'])
+        return resultados
+
+    def batch_call(self, llamadas, block_identifier='latest', tamano_lote=None):
+        """
+            Ejecuta varias funciones de lectura del contrato como lotes de `eth_call`, todas evaluadas
+            sobre el mismo bloque.
+
+            Parámetros:
+            - llamadas (list): Lista de tuplas (nombre_funcion, argumentos), por ejemplo
+            ('obtenerDetalleDePrestamo', (direccion, 1)).
+            - block_identifier (int|str): El bloque sobre el que se evalúan las llamadas.
+            - tamano_lote (int, opcional): Número máximo de llamadas por petición HTTP. Por defecto
+            se usa `TAMANO_LOTE_RPC`.
+
+            Retorna:
+            Una lista con el resultado decodificado de cada llamada, en el mismo orden. Si la función
+            tiene una única salida se retorna directamente ese valor.
+        """
+        if isinstance(block_identifier, int):
+            block_identifier = hex(block_identifier)
+
+        with self.trazador.tramo('batch_call', 'lectura', llamadas=len(llamadas)):
+            with self.trazador.tramo('codificar', 'lectura'):
+                peticiones = []
+                for nombre, argumentos in llamadas:
+                    data = self.contract.encodeABI(fn_name=nombre, args=list(argumentos))
+                    peticiones.append(('eth_call', [{'to': self.contract_address, 'data': data}, block_identifier]))
+
+            tamano_lote = tamano_lote or self.TAMANO_LOTE_RPC
+            respuestas = []
+            for inicio in range(0, len(peticiones), tamano_lote):
+                with self.trazador.tramo('rpc_batch', 'rpc', peticiones=min(tamano_lote, len(peticiones) - inicio)):
+                    respuestas.extend(self.rpc_batch(peticiones[inicio:inicio + tamano_lote]))
+
+            with self.trazador.tramo('decodificar', 'lectura'):
+                resultados = []
+                for (nombre, _), resultado in zip(llamadas, respuestas):
+                    valores = self.web3.codec.decode(abi_output_types(self.contract_abi, nombre), HexBytes(resultado))
+                    resultados.append(valores[0] if len(valores) == 1 else valores)
+            return resultados
+
     def alta_prestamista(self, nueva_direccion):
         """
             Registra un nuevo prestamista en el contrato inteligente del sistema. Este método
@@ -347,7 +1083,7 @@ class BlockchainManager:
             
             valor_wei = valor_ether
             function_call = self.contract.functions.depositarGarantia()
-            receipt = self.sign_and_send_transaction(function_call, direccion_cliente, clave_privada, valor_wei, gas_limit=2000000)
+            receipt = self.sign_and_send_transaction(function_call, direccion_cliente, clave_privada, valor_wei)
             
             return format_transaction_receipt(receipt)
         except ValueError as e:
@@ -432,7 +1168,8 @@ class BlockchainManager:
         """
         try:
             function_call = self.contract.functions.reembolsarPrestamo(prestamo_id)
-            receipt = self.sign_and_send_transaction(function_call, direccion_cliente, clave_privada)
+            # El reembolso debe minarse antes del vencimiento, así que se reemplaza antes si se atasca
+            receipt = self.sign_and_send_transaction(function_call, direccion_cliente, clave_privada, plazo_reemplazo=self.PLAZO_REEMPLAZO_URGENTE)
             return format_transaction_receipt(receipt)
         except Exception as e:
             logging.error("Error al reembolsar prestamo: %s", str(e))
@@ -485,6 +1222,28 @@ class BlockchainManager:
         """
         return self.ESTADOS_PRESTAMO.get(estado, 'Desconocido')
     
+    def formatear_prestamo(self, prestamo):
+        """
+            Convierte la estructura `Prestamo` devuelta por el contrato en un diccionario legible.
+
+            Parámetros:
+            - prestamo: La tupla (id, prestatario, monto, plazo, tiempoSolicitud, tiempoLimite, estado)
+            devuelta por el contrato.
+
+            Retorna:
+            Un diccionario con el ID, prestatario, monto (en ether), plazo, fecha de solicitud,
+            fecha límite y estado del préstamo.
+        """
+        return {
+            "id": prestamo[0],
+            "prestatario": self.web3.to_checksum_address(prestamo[1]),
+            "monto": wei_to_ether(prestamo[2]),
+            "plazo": prestamo[3],
+            "fecha_solicitud": datetime.utcfromtimestamp(prestamo[4]).strftime('%Y-%m-%d %H:%M:%S'),
+            "fecha_limite": datetime.utcfromtimestamp(prestamo[5]).strftime('%Y-%m-%d %H:%M:%S'),
+            "estado": self.mapear_estado_prestamo(prestamo[6])
+        }
+
     def obtener_prestamos_por_prestatario(self, direccion_prestatario):
         """
             Recupera los IDs de los préstamos aprobados asociados con un prestatario específico.
@@ -503,10 +1262,10 @@ class BlockchainManager:
             raise ValueError("La dirección del prestatario no es válida.")
         try:
              # Llama directamente a la función del contrato y retorna la lista de IDs
-            prestamo_ids = self.contract.functions.obtenerPrestamosPorPrestatario(
-                self.web3.to_checksum_address(direccion_prestatario)
-            ).call()
-            return prestamo_ids
+            prestamo_ids = self.leer_contrato(
+                'obtenerPrestamosPorPrestatario', self.web3.to_checksum_address(direccion_prestatario)
+            )
+            return list(prestamo_ids)
         except Exception as e:
             logging.error(f"Error al obtener préstamos por prestatario: {e}")
             raise Exception(f"Error al obtener préstamos por prestatario: {e}")
@@ -534,25 +1293,216 @@ class BlockchainManager:
 
         try:
             # Obtener los detalles del préstamo desde el contrato
-            prestamo = self.contract.functions.obtenerDetalleDePrestamo(
-                self.web3.to_checksum_address(direccion_prestatario), prestamo_id).call()
+            prestamo = self.leer_contrato(
+                'obtenerDetalleDePrestamo', self.web3.to_checksum_address(direccion_prestatario), prestamo_id)
 
             if not prestamo:
                 return None
 
-            # Formatear los detalles del préstamo
-            detalle_prestamo = {
-                "id": prestamo[0],
-                "prestatario": self.web3.toChecksumAddress(prestamo[1]),
-                "monto": wei_to_ether(prestamo[2]),
-                "plazo": prestamo[3],
-                "fecha_solicitud": datetime.utcfromtimestamp(prestamo[4]).strftime('%Y-%m-%d %H:%M:%S'),
-                "fecha_limite": datetime.utcfromtimestamp(prestamo[5]).strftime('%Y-%m-%d %H:%M:%S'),
-                "estado": self.mapear_estado_prestamo(prestamo[6])
-            }
-
-            return detalle_prestamo
+            return self.formatear_prestamo(prestamo)
         except Exception as e:
             logging.error(f"Error al obtener detalle de préstamo: {e}")
             raise Exception(f"Error al obtener detalle de préstamo: {e}")
-              
\ No newline at end of file
+
+    def obtener_cliente(self, direccion_cliente):
+        """
+            Consulta el registro de un cliente en el contrato (getter público `clientes`).
+
+            Parámetros:
+            - direccion_cliente: La dirección Ethereum del cliente.
+
+            Retorna:
+            Un diccionario con las claves 'activado' (bool) y 'saldo_garantia' (en ether).
+
+            Excepciones:
+            - ValueError: Se lanza si la dirección no es válida.
+            - Exception: Captura y reporta cualquier otro error que pueda ocurrir durante la consulta.
+        """
+        if not is_valid_ethereum_address(direccion_cliente):
+            raise ValueError("La dirección del cliente no es válida.")
+        try:
+            activado, saldo_garantia = self.leer_contrato('clientes', self.web3.to_checksum_address(direccion_cliente))
+            return {"activado": activado, "saldo_garantia": wei_to_ether(saldo_garantia)}
+        except Exception as e:
+            logging.error(f"Error al obtener el cliente: {e}")
+            raise Exception(f"Error al obtener el cliente: {e}")
+
+    def es_prestamista(self, direccion):
+        """
+            Indica si una dirección está registrada como empleado prestamista (getter público
+            `empleadosPrestamista`).
+
+            Excepciones:
+            - ValueError: Se lanza si la dirección no es válida.
+            - Exception: Captura y reporta cualquier otro error que pueda ocurrir durante la consulta.
+        """
+        if not is_valid_ethereum_address(direccion):
+            raise ValueError("La dirección no es válida.")
+        try:
+            return self.leer_contrato('empleadosPrestamista', self.web3.to_checksum_address(direccion))
+        except Exception as e:
+            logging.error(f"Error al consultar el prestamista: {e}")
+            raise Exception(f"Error al consultar el prestamista: {e}")
+
+    def obtener_socio_principal(self):
+        """
+            Retorna la dirección del socio principal del contrato (getter público `socioPrincipal`).
+
+            Excepciones:
+            - Exception: Captura y reporta cualquier error que pueda ocurrir durante la consulta.
+        """
+        try:
+            return self.leer_contrato('socioPrincipal')
+        except Exception as e:
+            logging.error(f"Error al obtener el socio principal: {e}")
+            raise Exception(f"Error al obtener el socio principal: {e}")
+
+    def iterar_prestamos(self, direccion_prestatario, tamano_pagina=100):
+        """
+            Recorre todos los préstamos de un prestatario de forma perezosa, página a página, usando la
+            vista `obtenerPrestamosPaginados` del contrato.
+
+            Cada página se solicita solo cuando el consumidor ha procesado la anterior, por lo que la memoria
+            utilizada queda acotada por el tamaño de página y el número de llamadas es una por página en
+            lugar de una por préstamo. Todas las páginas se leen sobre el mismo bloque, fijado al empezar.
+
+            Parámetros:
+            - direccion_prestatario: La dirección Ethereum del prestatario.
+            - tamano_pagina (int): El número de préstamos que se solicitan en cada llamada.
+
+            Retorna:
+            Un generador que produce un diccionario por préstamo, con el mismo formato que
+            `obtener_detalle_de_prestamo`.
+
+            Excepciones:
+            - ValueError: Se lanza si la dirección no es válida o el tamaño de página no es positivo.
+            - Exception: Captura y reporta cualquier otro error que pueda ocurrir durante la consulta.
+        """
+        if not is_valid_ethereum_address(direccion_prestatario):
+            raise ValueError("La dirección del prestatario no es válida.")
+        if tamano_pagina <= 0:
+            raise ValueError("El tamaño de página debe ser un número positivo.")
+
+        direccion_prestatario = self.web3.to_checksum_address(direccion_prestatario)
+        try:
+            bloque = self.web3.eth.block_number
+        except Exception as e:
+            logging.error(f"Error al obtener préstamos paginados: {e}")
+            raise Exception(f"Error al obtener préstamos paginados: {e}")
+
+        offset = 0
+        while True:
+            try:
+                pagina = self.contract.functions.obtenerPrestamosPaginados(
+                    direccion_prestatario, offset, tamano_pagina
+                ).call(block_identifier=bloque)
+            except Exception as e:
+                logging.error(f"Error al obtener préstamos paginados: {e}")
+                raise Exception(f"Error al obtener préstamos paginados: {e}")
+
+            for prestamo in pagina:
+                yield self.formatear_prestamo(prestamo)
+
+            if len(pagina) < tamano_pagina:
+                return
+            offset += tamano_pagina
+
+    def obtener_cartera(self, direccion_prestatario):
+        """
+            Obtiene todos los préstamos de un prestatario con sus detalles, consistentes a un mismo bloque.
+
+            En lugar de consultar los detalles préstamo a préstamo, todas las llamadas a
+            `obtenerDetalleDePrestamo` se envían en un único lote JSON-RPC fijado al mismo bloque
+            que la consulta de IDs.
+
+            Parámetros:
+            - direccion_prestatario: La dirección Ethereum del prestatario.
+
+            Retorna:
+            Un diccionario con el número de bloque consultado ('bloque') y la lista de préstamos
+            ('prestamos'), cada uno con el mismo formato que `obtener_detalle_de_prestamo`.
+
+            Excepciones:
+            - ValueError: Se lanza si la dirección del prestatario no es válida.
+            - Exception: Captura y reporta cualquier otro error que pueda ocurrir durante la consulta.
+        """
+        if not is_valid_ethereum_address(direccion_prestatario):
+            raise ValueError("La dirección del prestatario no es válida.")
+
+        try:
+            direccion_prestatario = self.web3.to_checksum_address(direccion_prestatario)
+            bloque = self.web3.eth.block_number
+            prestamo_ids = self.contract.functions.obtenerPrestamosPorPrestatario(
+                direccion_prestatario
+            ).call(block_identifier=bloque)
+
+            prestamos = self.batch_call(
+                [('obtenerDetalleDePrestamo', (direccion_prestatario, prestamo_id)) for prestamo_id in prestamo_ids],
+                bloque,
+            )
+            return {
+                'bloque': bloque,
+                'prestamos': [self.formatear_prestamo(prestamo) for prestamo in prestamos],
+            }
+        except Exception as e:
+            logging.error(f"Error al obtener la cartera del prestatario: {e}")
+            raise Exception(f"Error al obtener la cartera del prestatario: {e}")
+
+    def leer_prestatarios(self, direcciones, incluir_prestamos=True, tamano_lote=None):
+        """
+            Lee de forma agregada el estado de muchos prestatarios: su registro en `clientes`, los IDs de
+            sus préstamos y, opcionalmente, el detalle de cada préstamo.
+
+            Todas las lecturas se agrupan en lotes JSON-RPC de `tamano_lote` llamadas y se evalúan sobre
+            el mismo bloque, de modo que miles de prestatarios se consultan con unas pocas peticiones HTTP
+            y con un resultado consistente.
+
+            Parámetros:
+            - direcciones (list): Las direcciones Ethereum de los prestatarios.
+            - incluir_prestamos (bool): Si es True, también se leen los detalles de todos los préstamos.
+            - tamano_lote (int, opcional): Número máximo de llamadas por petición HTTP. Por defecto
+            se usa `TAMANO_LOTE_RPC`.
+
+            Retorna:
+            Un diccionario {direccion: RegistroCliente}, con las direcciones en formato checksum.
+            Si `incluir_prestamos` es False, el campo `prestamos` de cada registro es una lista vacía.
+
+            Excepciones:
+            - ValueError: Se lanza si alguna dirección no es válida.
+            - Exception: Captura y reporta cualquier otro error que pueda ocurrir durante la consulta.
+        """
+        for direccion in direcciones:
+            if not is_valid_ethereum_address(direccion):
+                raise ValueError(f"La dirección {direccion} no es válida.")
+
+        try:
+            direcciones = [self.web3.to_checksum_address(direccion) for direccion in direcciones]
+            bloque = self.web3.eth.block_number
+
+            llamadas = []
+            for direccion in direcciones:
+                llamadas.append(('clientes', (direccion,)))
+                llamadas.append(('obtenerPrestamosPorPrestatario', (direccion,)))
+            resultados = self.batch_call(llamadas, bloque, tamano_lote)
+
+            registros = {}
+            for indice, direccion in enumerate(direcciones):
+                activado, saldo_garantia = resultados[2 * indice]
+                prestamo_ids = list(resultados[2 * indice + 1])
+                registros[direccion] = RegistroCliente(direccion, activado, saldo_garantia, prestamo_ids, [])
+
+            if incluir_prestamos:
+                llamadas = [
+                    ('obtenerDetalleDePrestamo', (direccion, prestamo_id))
+                    for direccion, registro in registros.items()
+                    for prestamo_id in registro.prestamo_ids
+                ]
+                detalles = self.batch_call(llamadas, bloque, tamano_lote)
+                for (_, (direccion, _)), prestamo in zip(llamadas, detalles):
+                    prestamo = RegistroPrestamo(prestamo[0], self.web3.to_checksum_address(prestamo[1]), *prestamo[2:])
+                    registros[direccion].prestamos.append(prestamo)
+
+            return registros
+        except Exception as e:
+            logging.error(f"Error al leer los prestatarios en lote: {e}")
+            raise Exception(f"Error al leer los prestatarios en lote: {e}")
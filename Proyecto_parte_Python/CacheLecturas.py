@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+
+
+class CacheLecturas:
+    """
+        Caché LRU para los resultados de las funciones de lectura del contrato.
+
+        Las entradas se indexan por (funcion, argumentos, bloque), de modo que un resultado solo se
+        reutiliza mientras la cadena no haya avanzado. Cuando llega un bloque nuevo se descartan las
+        entradas de bloques anteriores, y cuando una transacción propia modifica a un prestatario se
+        descartan las entradas cuyos argumentos incluyen su dirección.
+
+        Atributos:
+        - tamano_maximo (int): Número máximo de entradas; al superarlo se descartan las menos usadas.
+        - aciertos (int): Número de lecturas servidas desde la caché.
+        - fallos (int): Número de lecturas que tuvieron que consultarse al nodo.
+    """
+
+    def __init__(self, tamano_maximo=1024):
+        self.tamano_maximo = tamano_maximo
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._cerrojo = threading.Lock()
+
+    def obtener(self, clave):
+        """
+            Busca una entrada en la caché.
+
+            Retorna:
+            Una tupla (encontrado, valor). Si no se encuentra, el valor es None.
+        """
+        with self._cerrojo:
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return True, self._entradas[clave]
+            self.fallos += 1
+            return False, None
+
+    def guardar(self, clave, valor):
+        """Guarda un resultado, descartando la entrada menos usada si se supera el tamaño máximo."""
+        with self._cerrojo:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.tamano_maximo:
+                self._entradas.popitem(last=False)
+
+    def invalidar_anteriores(self, bloque):
+        """Descarta las entradas leídas en bloques anteriores a `bloque`."""
+        with self._cerrojo:
+            for clave in [clave for clave in self._entradas if clave[2] < bloque]:
+                del self._entradas[clave]
+
+    def invalidar_direccion(self, direccion):
+        """Descarta las entradas cuyos argumentos incluyen la dirección indicada (en formato checksum)."""
+        with self._cerrojo:
+            for clave in [clave for clave in self._entradas if direccion in clave[1]]:
+                del self._entradas[clave]
+
+    def limpiar(self):
+        """Descarta todas las entradas y reinicia los contadores."""
+        with self._cerrojo:
+            self._entradas.clear()
+            self.aciertos = 0
+            self.fallos = 0
+
+    def estadisticas(self):
+        """Retorna un diccionario con el número de entradas, aciertos, fallos y la tasa de aciertos."""
+        with self._cerrojo:
+            total = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / total if total else 0.0,
+            }
@@ -0,0 +1,137 @@
+import os
+import threading
+
+from eth_account import Account
+from web3 import Web3
+
+from BlockchainManager import BlockchainManager
+from ProveedorMultiNodo import crear_sesion
+
+# Versión de solc con la que se compila PrestamoDeFi.sol si no se indica otra
+VERSION_SOLC = '0.8.19'
+
+RUTA_CONTRATO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'PrestamoDeFi.sol')
+RUTA_ABI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'PrestamoDeFi.json')
+
+
+def compilar_contrato(ruta_sol=RUTA_CONTRATO, version=VERSION_SOLC):
+    """
+        Compila PrestamoDeFi.sol con py-solc-x (instalando la versión de solc si hace falta).
+
+        Retorna:
+        El bytecode de despliegue en hexadecimal.
+
+        Excepciones:
+        - ImportError: Se lanza si py-solc-x no está instalado.
+    """
+    import solcx
+
+    if version not in [str(instalada) for instalada in solcx.get_installed_solc_versions()]:
+        solcx.install_solc(version)
+    compilado = solcx.compile_files([ruta_sol], output_values=['bin'], solc_version=version)
+    for nombre, salida in compilado.items():
+        if nombre.endswith(':PrestamoDeFi'):
+            return '0x' + salida['bin']
+    raise ValueError(f"No se encontró el contrato PrestamoDeFi en {ruta_sol}.")
+
+
+def crear_proveedor_en_memoria(tester):
+    """
+        Crea un `EthereumTesterProvider` para `tester` que atiende las peticiones de una en una.
+        eth-tester no admite llamadas concurrentes y `BlockchainManager` las hace desde varios hilos
+        (por ejemplo, el `NotificadorRecibos`).
+    """
+    from web3.providers.eth_tester import EthereumTesterProvider
+
+    class ProveedorEnMemoria(EthereumTesterProvider):
+        def __init__(self, ethereum_tester):
+            super().__init__(ethereum_tester)
+            self._cerrojo = threading.Lock()
+
+        def make_request(self, method, params):
+            with self._cerrojo:
+                return super().make_request(method, params)
+
+    return ProveedorEnMemoria(tester)
+
+
+class BlockchainManagerEnMemoria(BlockchainManager):
+    """`BlockchainManager` conectado a una instancia de Web3 ya creada en lugar de a una URL."""
+
+    def __init__(self, web3, *args, **kwargs):
+        self._web3_en_memoria = web3
+        super().__init__(None, *args, **kwargs)
+
+    def init_web3(self, ganache_url):
+        self.web3 = self._web3_en_memoria
+        self.rpc_session = crear_sesion()
+
+
+class CadenaLocal:
+    """
+        Cadena Ethereum en el propio proceso (eth-tester con py-evm) con el contrato PrestamoDeFi
+        desplegado, para medir el rendimiento sin depender de un nodo externo.
+
+        El contrato se despliega desde una cuenta nueva, que hace de socio principal, y las cuentas
+        que se crean con `crear_cuentas` reciben saldo de las cuentas de prueba de eth-tester.
+
+        Atributos:
+        - tester (EthereumTester): La cadena en memoria (permite minar o avanzar el tiempo).
+        - web3 (Web3): Instancia de Web3 conectada a la cadena.
+        - socio_principal (LocalAccount): La cuenta que desplegó el contrato.
+        - contract_address (str): La dirección del contrato desplegado.
+    """
+
+    def __init__(self, bytecode=None, version_solc=VERSION_SOLC):
+        from eth_tester import EthereumTester
+
+        self.tester = EthereumTester()
+        self.web3 = Web3(crear_proveedor_en_memoria(self.tester))
+        self._cuentas_creadas = 0
+        self.socio_principal = self.crear_cuentas(1)[0]
+
+        bytecode = bytecode or compilar_contrato(version=version_solc)
+        transaccion = {
+            'from': self.socio_principal.address,
+            'data': bytecode,
+            'gas': 5000000,
+            'nonce': 0,
+            'chainId': self.web3.eth.chain_id,
+            'maxFeePerGas': self.web3.to_wei(10, 'gwei'),
+            'maxPriorityFeePerGas': self.web3.to_wei(1, 'gwei'),
+        }
+        firmada = self.socio_principal.sign_transaction(transaccion)
+        recibo = self.web3.eth.wait_for_transaction_receipt(self.web3.eth.send_raw_transaction(firmada.rawTransaction))
+        self.contract_address = recibo['contractAddress']
+
+    def crear_cuentas(self, cantidad, saldo_ether=1000):
+        """Crea `cantidad` cuentas deterministas con `saldo_ether` ether cada una y las retorna (LocalAccount)."""
+        cuentas = []
+        for _ in range(cantidad):
+            self._cuentas_creadas += 1
+            cuenta = Account.from_key(Web3.keccak(text=f"cadena-local-{self._cuentas_creadas}"))
+            self.web3.eth.send_transaction({
+                'from': self.web3.eth.accounts[0],
+                'to': cuenta.address,
+                'value': self.web3.to_wei(saldo_ether, 'ether'),
+            })
+            cuentas.append(cuenta)
+        return cuentas
+
+    @staticmethod
+    def clave(cuenta):
+        """Retorna la clave privada de la cuenta en el formato que espera `BlockchainManager` ('0x...')."""
+        clave = cuenta.key.hex()
+        return clave if clave.startswith('0x') else '0x' + clave
+
+    def crear_manager(self, **kwargs):
+        """Crea un `BlockchainManager` conectado a la cadena, con el socio principal configurado."""
+        kwargs.setdefault('ruta_modelo_gas', None)
+        return BlockchainManagerEnMemoria(
+            self.web3,
+            self.contract_address,
+            RUTA_ABI,
+            self.socio_principal.address,
+            self.clave(self.socio_principal),
+            **kwargs
+        )
@@ -1,5 +1,16 @@
 from web3 import Web3
+import json
 import logging
+import marshal
+import os
+import threading
+
+# ABIs ya cargadas en este proceso, indexadas por (ruta, fecha de modificación, tamaño) del archivo JSON
+_abis_cargadas = {}
+_cerrojo_abis = threading.Lock()
+
+# Carpeta de los archivos que generan los programas (modelo de gas, bases de datos) si no se define DATOS_DIR
+DIRECTORIO_DATOS = os.path.dirname(os.path.abspath(__file__))
 
 def ether_to_wei(amount_in_ether):
     """Convierte un valor de Ether a Wei."""
@@ -27,6 +38,78 @@ def format_transaction_receipt(receipt):
         'contractAddress': receipt.get('contractAddress'),
         'logs': receipt['logs'],
     }
+
+def ruta_datos(ruta):
+    """
+    Resuelve la ruta de un archivo de datos del proyecto.
+
+    Las rutas relativas se interpretan dentro de la carpeta de la variable de entorno `DATOS_DIR` (o,
+    si no se define, la de este proyecto) y no en el directorio actual, para que cada programa
+    encuentre sus archivos aunque se lance desde otra carpeta. Las rutas absolutas, None y
+    ':memory:' se devuelven tal cual.
+    """
+    if not ruta or ruta == ':memory:' or os.path.isabs(ruta):
+        return ruta
+    directorio = os.getenv('DATOS_DIR') or DIRECTORIO_DATOS
+    os.makedirs(directorio, exist_ok=True)
+    return os.path.join(directorio, ruta)
+
+def _abi_type(param):
+    """Convierte un parámetro de la ABI en su tipo canónico, expandiendo las tuplas (structs)."""
+    if param['type'].startswith('tuple'):
+        componentes = ','.join(_abi_type(componente) for componente in param['components'])
+        return f"({componentes}){param['type'][len('tuple'):]}"
+    return param['type']
+
+def abi_output_types(contract_abi, fn_name):
+    """Devuelve la lista de tipos de salida de una función de la ABI, lista para decodificar con eth_abi."""
+    for entrada in contract_abi:
+        if entrada.get('type') == 'function' and entrada.get('name') == fn_name:
+            return [_abi_type(salida) for salida in entrada['outputs']]
+    raise ValueError(f"La función {fn_name} no existe en la ABI del contrato.")
+
+def _ruta_cache_abi(abi_path):
+    directorio, nombre = os.path.split(os.path.abspath(abi_path))
+    return os.path.join(directorio, '__pycache__', nombre + '.marshal')
+
+def load_abi(abi_path):
+    """
+    Carga la ABI de un contrato desde su archivo JSON, reutilizando una versión ya procesada.
+
+    La ABI se guarda en memoria para el resto del proceso y en disco (serializada con `marshal` en
+    la carpeta `__pycache__` junto al JSON), de modo que solo se vuelve a analizar el JSON cuando
+    el archivo cambia.
+    """
+    estado = os.stat(abi_path)
+    sello = (os.path.abspath(abi_path), estado.st_mtime_ns, estado.st_size)
+    with _cerrojo_abis:
+        if sello in _abis_cargadas:
+            return _abis_cargadas[sello]
+
+    ruta_cache = _ruta_cache_abi(abi_path)
+    abi = None
+    try:
+        with open(ruta_cache, 'rb') as archivo_cache:
+            sello_guardado, abi_guardada = marshal.load(archivo_cache)
+        if tuple(sello_guardado) == sello:
+            abi = abi_guardada
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    if abi is None:
+        with open(abi_path, 'r') as abi_file:
+            abi = json.load(abi_file)
+        try:
+            os.makedirs(os.path.dirname(ruta_cache), exist_ok=True)
+            with open(ruta_cache, 'wb') as archivo_cache:
+                marshal.dump((sello, abi), archivo_cache)
+        except OSError as e:
+            logging.warning(f"No se pudo guardar la caché de la ABI: {e}")
+
+    with _cerrojo_abis:
+        _abis_cargadas[sello] = abi
+    return abi
+
 def log_transaction_receipt(receipt):
     """Registra detalles de un recibo de transacción para depuración o información."""
     if receipt.status == 1:
@@ -0,0 +1,95 @@
+import math
+import threading
+
+
+class EstrategiaComisiones:
+    """
+        Calcula las comisiones de gas (EIP-1559) de las transacciones a partir del historial de
+        comisiones de la red (`eth_feeHistory`) y propone comisiones mayores para reemplazar
+        transacciones atascadas.
+
+        - maxPriorityFeePerGas: el percentil configurado de las propinas pagadas en los últimos
+        bloques, con un mínimo de `prioridad_minima`.
+        - maxFeePerGas: la comisión base del siguiente bloque multiplicada por `multiplicador_base`
+        más la propina, lo que deja margen para que la base suba durante varios bloques.
+
+        El cálculo se guarda y se reutiliza mientras no cambie el bloque. Si la red no admite
+        EIP-1559 (sin `baseFeePerGas`), se usa `gasPrice` con el precio que indica el nodo.
+
+        Atributos:
+        - bloques_historial (int): Número de bloques que se consultan en `eth_feeHistory`.
+        - percentil (int): Percentil de las propinas que se utiliza.
+        - multiplicador_base (float): Multiplicador de la comisión base para `maxFeePerGas`.
+        - prioridad_minima (int): Propina mínima en wei.
+        - factor_reemplazo (float): Incremento mínimo de las comisiones al reemplazar una transacción
+        (los nodos exigen al menos un 10 %).
+    """
+
+    def __init__(self, bloques_historial=10, percentil=50, multiplicador_base=2, prioridad_minima=10 ** 9, factor_reemplazo=1.125):
+        self.bloques_historial = bloques_historial
+        self.percentil = percentil
+        self.multiplicador_base = multiplicador_base
+        self.prioridad_minima = prioridad_minima
+        self.factor_reemplazo = factor_reemplazo
+        self._bloque = None
+        self._comisiones = None
+        self._cerrojo = threading.Lock()
+
+    def vigentes(self, bloque):
+        """Retorna las comisiones calculadas para el bloque indicado, o None si hay que recalcularlas."""
+        with self._cerrojo:
+            if self._bloque == bloque:
+                return dict(self._comisiones)
+            return None
+
+    def calcular(self, bloque, historial=None, gas_price=None):
+        """
+            Calcula y guarda las comisiones para el bloque indicado.
+
+            Parámetros:
+            - bloque (int): El bloque para el que se calculan las comisiones.
+            - historial (dict, opcional): La respuesta de `eth_feeHistory` con el percentil configurado.
+            - gas_price (int, opcional): El precio del gas del nodo, usado si la red no admite EIP-1559.
+
+            Retorna:
+            Un diccionario con 'maxFeePerGas' y 'maxPriorityFeePerGas', o con 'gasPrice' en redes sin EIP-1559.
+
+            Excepciones:
+            - ValueError: Se lanza si no hay historial EIP-1559 ni precio del gas.
+        """
+        bases = (historial or {}).get('baseFeePerGas') or []
+        if bases and bases[-1]:
+            propinas = sorted(recompensa[0] for recompensa in historial.get('reward') or [] if recompensa)
+            prioridad = propinas[len(propinas) // 2] if propinas else 0
+            prioridad = max(prioridad, self.prioridad_minima)
+            comisiones = {
+                'maxFeePerGas': math.ceil(bases[-1] * self.multiplicador_base) + prioridad,
+                'maxPriorityFeePerGas': prioridad,
+            }
+        elif gas_price is not None:
+            comisiones = {'gasPrice': gas_price}
+        else:
+            raise ValueError("No se pudieron calcular las comisiones de gas.")
+
+        with self._cerrojo:
+            self._bloque = bloque
+            self._comisiones = comisiones
+        return dict(comisiones)
+
+    def reemplazo(self, transaction, actuales):
+        """
+            Calcula las comisiones para reemplazar una transacción atascada (mismo nonce): el máximo entre
+            las comisiones actuales de la red y las de la transacción incrementadas en `factor_reemplazo`.
+
+            Parámetros:
+            - transaction (dict): La transacción que se quiere reemplazar.
+            - actuales (dict): Las comisiones vigentes de la red (ver `calcular`).
+
+            Retorna:
+            Un diccionario con los campos de comisión de la transacción de reemplazo.
+        """
+        return {
+            campo: max(actuales.get(campo, 0), math.ceil(transaction[campo] * self.factor_reemplazo))
+            for campo in ('maxFeePerGas', 'maxPriorityFeePerGas', 'gasPrice')
+            if campo in transaction
+        }
@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from eth_account import Account
+from hexbytes import HexBytes
+
+
+def _firmar_bloque(bloque):
+    """
+        Firma en un proceso de trabajo una lista de tuplas (transaction, private_key).
+
+        Retorna:
+        Una lista con una tupla (raw_transaction, hash) en bytes por transacción o, si no se pudo
+        firmar, la excepción producida.
+    """
+    firmadas = []
+    for transaction, private_key in bloque:
+        try:
+            signed_txn = Account.sign_transaction(transaction, private_key)
+            firmadas.append((bytes(signed_txn.rawTransaction), bytes(signed_txn.hash)))
+        except Exception as e:
+            firmadas.append(ValueError(f"No se pudo firmar la transacción: {e}"))
+    return firmadas
+
+
+class FirmadorProcesos:
+    """
+        Firma transacciones ya construidas (con nonce) en un pool de procesos, de modo que la firma
+        ECDSA, que se hace en Python puro y retiene el GIL, se reparte entre todos los núcleos.
+
+        Los lotes pequeños se firman en el propio hilo, donde no compensa enviarlos a otro proceso.
+        Los procesos se crean con 'spawn' para no heredar los hilos ni las conexiones del proceso
+        principal, y solo importan eth-account.
+
+        Atributos:
+        - procesos (int): Número de procesos de firma.
+        - tamano_bloque (int): Transacciones que se envían juntas a cada proceso.
+        - minimo_paralelo (int): Tamaño de lote a partir del cual se usa el pool.
+    """
+
+    def __init__(self, procesos=None, tamano_bloque=64, minimo_paralelo=32):
+        self.procesos = procesos or os.cpu_count() or 1
+        self.tamano_bloque = tamano_bloque
+        self.minimo_paralelo = minimo_paralelo
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.procesos, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def firmar(self, transacciones, claves_privadas):
+        """
+            Firma las transacciones, cada una con su clave privada.
+
+            Parámetros:
+            - transacciones (list): Diccionarios de transacción completos, incluido el nonce.
+            - claves_privadas (list): La clave privada de cada transacción, en el mismo orden.
+
+            Retorna:
+            Una lista en el mismo orden con una tupla (raw_transaction, hash) en HexBytes por
+            transacción o, si no se pudo firmar, la excepción producida.
+        """
+        pares = list(zip(transacciones, claves_privadas))
+        if len(pares) < self.minimo_paralelo or self.procesos == 1:
+            bloques = [_firmar_bloque(pares)]
+        else:
+            # Bloques de como mucho `tamano_bloque`, pero suficientes para ocupar todos los procesos
+            tamano = max(1, min(self.tamano_bloque, -(-len(pares) // self.procesos)))
+            bloques = self._pool().map(_firmar_bloque, [pares[i:i + tamano] for i in range(0, len(pares), tamano)])
+
+        resultado = []
+        for bloque in bloques:
+            for firmada in bloque:
+                resultado.append(firmada if isinstance(firmada, Exception) else (HexBytes(firmada[0]), HexBytes(firmada[1])))
+        return resultado
+
+    def cerrar(self):
+        """Detiene los procesos de firma."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
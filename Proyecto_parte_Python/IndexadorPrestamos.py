@@ -0,0 +1,381 @@
+import logging
+import sqlite3
+import threading
+import time
+from eth_utils import event_abi_to_log_topic
+from web3.exceptions import BlockNotFound
+from ContractUtils import ruta_datos
+from Registros import RegistroPrestamo
+from RellenoHistorico import RellenoHistorico
+
+# Códigos de estado emitidos por el contrato (ver BlockchainManager.ESTADOS_PRESTAMO)
+ESTADO_PENDIENTE = 0
+ESTADO_APROBADO = 1
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS prestamos (
+        prestatario TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        monto TEXT NOT NULL,
+        plazo INTEGER NOT NULL,
+        tiempo_solicitud INTEGER NOT NULL,
+        tiempo_limite INTEGER NOT NULL DEFAULT 0,
+        estado INTEGER NOT NULL DEFAULT 0,
+        bloque INTEGER NOT NULL,
+        PRIMARY KEY (prestatario, id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_prestamos_estado ON prestamos (estado, tiempo_limite);
+    CREATE TABLE IF NOT EXISTS cambios_estado (
+        prestatario TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        estado INTEGER NOT NULL,
+        tiempo_limite INTEGER NOT NULL,
+        bloque INTEGER NOT NULL,
+        indice_log INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_cambios_bloque ON cambios_estado (bloque);
+    CREATE INDEX IF NOT EXISTS idx_cambios_prestamo ON cambios_estado (prestatario, id);
+    CREATE TABLE IF NOT EXISTS bloques (
+        numero INTEGER PRIMARY KEY,
+        hash TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS estado_indexador (
+        clave TEXT PRIMARY KEY,
+        valor INTEGER NOT NULL
+    );
+"""
+
+
+class IndexadorPrestamos:
+    """
+        Mantiene una copia local en SQLite del libro de préstamos del contrato a partir de sus eventos
+        `SolicitudPrestamo` y `CambioEstadoPrestamo`.
+
+        El indexador procesa los eventos de forma incremental desde el último bloque procesado, que se
+        guarda en la propia base de datos, por lo que puede detenerse y reanudarse. Para detectar
+        reorganizaciones de la cadena guarda el hash de los bloques procesados más recientes; si alguno
+        deja de coincidir con la red, deshace los cambios posteriores al último bloque común y vuelve
+        a procesarlos.
+
+        Una vez sincronizado, las consultas sobre el libro (préstamos aprobados, vencidos, por prestatario)
+        se resuelven localmente sin peticiones a la red.
+
+        Nota: el ID de cada préstamo se deduce del orden de las solicitudes de cada prestatario (igual que
+        hace el contrato), por lo que el indexador debe empezar en un bloque anterior o igual al
+        despliegue del contrato.
+
+        Atributos:
+        - web3 (Web3): Instancia de Web3 del `BlockchainManager`.
+        - contract (Contract): Instancia del contrato `PrestamoDeFi`.
+        - conexion (sqlite3.Connection): Conexión a la base de datos local (una ruta relativa se resuelve con
+        `ContractUtils.ruta_datos`).
+        - bloque_inicial (int): Primer bloque a indexar.
+        - confirmaciones (int): Número de bloques que se dejan sin procesar en la punta de la cadena.
+        - profundidad_reorg (int): Número de bloques recientes cuyo hash se conserva para detectar reorganizaciones.
+        - tamano_rango (int): Número máximo de bloques por consulta `eth_getLogs` en la sincronización
+        incremental.
+        - max_hilos (int): Consultas simultáneas cuando el índice va muy retrasado (reconstrucción en frío).
+        En ese caso los logs se descargan con `RellenoHistorico`, en paralelo y con tramos adaptativos.
+
+        Métodos:
+        - sincronizar(self): Procesa los eventos nuevos hasta la punta de la cadena.
+        - ejecutar(self, intervalo, detener): Sincroniza periódicamente hasta que se active `detener`.
+        - prestamos_por_estado(self, estado): Consulta local de préstamos por estado.
+        - prestamos_vencidos(self, ahora): Consulta local de préstamos aprobados con el plazo vencido.
+        - prestamos_de(self, prestatario): Consulta local de los préstamos de un prestatario.
+        - cambios_desde(self, bloque): Consulta local de los cambios de estado desde un bloque.
+        - filas_prestamos(self): Consulta local de todo el libro de préstamos, sin convertir a `RegistroPrestamo`.
+    """
+
+    def __init__(self, blockchain_manager, ruta_bd='prestamos.db', bloque_inicial=0, confirmaciones=0, profundidad_reorg=64, tamano_rango=2000, max_hilos=4):
+        self.web3 = blockchain_manager.web3
+        self.contract = blockchain_manager.contract
+        self.bloque_inicial = bloque_inicial
+        self.confirmaciones = confirmaciones
+        self.profundidad_reorg = profundidad_reorg
+        self.tamano_rango = tamano_rango
+        self.max_hilos = max_hilos
+        self._cerrojo = threading.RLock()
+
+        self._eventos = {}
+        for entrada in self.contract.abi:
+            if entrada.get('type') == 'event' and entrada['name'] in ('SolicitudPrestamo', 'CambioEstadoPrestamo'):
+                topic = self.web3.to_hex(event_abi_to_log_topic(entrada))
+                self._eventos[topic] = getattr(self.contract.events, entrada['name'])()
+
+        self.conexion = sqlite3.connect(ruta_datos(ruta_bd), check_same_thread=False)
+        with self.conexion:
+            self.conexion.executescript(ESQUEMA)
+
+    def ultimo_bloque_procesado(self):
+        """Retorna el último bloque procesado, o `bloque_inicial - 1` si todavía no se ha procesado ninguno."""
+        with self._cerrojo:
+            fila = self.conexion.execute(
+                "SELECT valor FROM estado_indexador WHERE clave = 'ultimo_bloque'"
+            ).fetchone()
+        return fila[0] if fila else self.bloque_inicial - 1
+
+    def _guardar_ultimo_bloque(self, numero):
+        self.conexion.execute(
+            "INSERT OR REPLACE INTO estado_indexador (clave, valor) VALUES ('ultimo_bloque', ?)", (numero,)
+        )
+
+    def obtener_logs(self, desde, hasta):
+        """
+            Obtiene los logs de los eventos indexados del contrato entre dos bloques (ambos incluidos).
+
+            Retorna:
+            La lista de logs ordenada por bloque e índice de log.
+        """
+        return self.web3.eth.get_logs({
+            'address': self.contract.address,
+            'fromBlock': desde,
+            'toBlock': hasta,
+            'topics': [list(self._eventos)],
+        })
+
+    def obtener_logs_y_marcas(self, desde, hasta):
+        """
+            Obtiene los logs de un rango junto con la marca de tiempo de cada bloque que contiene eventos,
+            para que la reconstrucción en paralelo también reparta estas consultas entre los hilos.
+
+            Retorna:
+            Una tupla (logs, marcas_de_tiempo), donde `marcas_de_tiempo` es un diccionario {bloque: timestamp}.
+        """
+        logs = self.obtener_logs(desde, hasta)
+        marcas_de_tiempo = {}
+        for log in logs:
+            if log['blockNumber'] not in marcas_de_tiempo:
+                marcas_de_tiempo[log['blockNumber']] = self.web3.eth.get_block(log['blockNumber'])['timestamp']
+        return logs, marcas_de_tiempo
+
+    def sincronizar(self):
+        """
+            Procesa todos los eventos nuevos desde el último bloque procesado hasta la punta de la cadena
+            (menos las confirmaciones configuradas), comprobando antes si ha habido una reorganización.
+
+            Retorna:
+            El número de eventos procesados.
+
+            Excepciones:
+            - Exception: Se lanza si falla la comunicación con el nodo. El progreso ya confirmado se conserva.
+        """
+        with self._cerrojo:
+            try:
+                self._comprobar_reorganizacion()
+                cabeza = self.web3.eth.block_number - self.confirmaciones
+                desde = self.ultimo_bloque_procesado() + 1
+                procesados = 0
+                if cabeza - desde >= self.tamano_rango and self.max_hilos > 1:
+                    relleno = RellenoHistorico(
+                        self.obtener_logs_y_marcas,
+                        medir=lambda resultado: len(resultado[0]),
+                        max_hilos=self.max_hilos,
+                        tamano_inicial=self.tamano_rango,
+                    )
+                    for inicio, fin, (logs, marcas_de_tiempo) in relleno.rangos(desde, cabeza):
+                        reciente = fin >= cabeza - self.profundidad_reorg
+                        procesados += self.procesar_rango(inicio, fin, logs, marcas_de_tiempo=marcas_de_tiempo, guardar_hash=reciente)
+                    return procesados
+                while desde <= cabeza:
+                    hasta = min(desde + self.tamano_rango - 1, cabeza)
+                    logs = self.obtener_logs(desde, hasta)
+                    procesados += self.procesar_rango(desde, hasta, logs)
+                    desde = hasta + 1
+                return procesados
+            except Exception as e:
+                logging.error(f"Error al sincronizar el indexador de préstamos: {e}")
+                raise
+
+    def procesar_rango(self, desde, hasta, logs, hash_hasta=None, marcas_de_tiempo=None, guardar_hash=True):
+        """
+            Aplica en una única transacción de SQLite los logs de un rango de bloques y marca el rango
+            como procesado.
+
+            Parámetros:
+            - desde (int): Primer bloque del rango. Debe ser el siguiente al último bloque procesado.
+            - hasta (int): Último bloque del rango.
+            - logs (list): Los logs del rango, ordenados por bloque e índice de log.
+            - hash_hasta (str, opcional): Hash del bloque `hasta`; si no se indica se consulta al nodo.
+            - marcas_de_tiempo (dict, opcional): Marcas de tiempo ya conocidas {bloque: timestamp}.
+            - guardar_hash (bool): Si es False no se guarda el hash de `hasta` (rangos antiguos, fuera del
+            alcance de una reorganización), ahorrando una consulta.
+
+            Retorna:
+            El número de eventos aplicados.
+        """
+        with self._cerrojo:
+            if desde != self.ultimo_bloque_procesado() + 1:
+                raise ValueError(f"El rango debe empezar en el bloque {self.ultimo_bloque_procesado() + 1}.")
+            if hash_hasta is None and guardar_hash:
+                hash_hasta = self.web3.to_hex(self.web3.eth.get_block(hasta)['hash'])
+
+            marcas_de_tiempo = dict(marcas_de_tiempo or {})
+            with self.conexion:
+                bloques_con_eventos = set()
+                for log in logs:
+                    numero = log['blockNumber']
+                    if numero not in marcas_de_tiempo:
+                        marcas_de_tiempo[numero] = self.web3.eth.get_block(numero)['timestamp']
+                    if guardar_hash and numero not in bloques_con_eventos:
+                        bloques_con_eventos.add(numero)
+                        self._guardar_hash(numero, self.web3.to_hex(log['blockHash']))
+                    self._aplicar_log(log, marcas_de_tiempo[numero])
+
+                if guardar_hash:
+                    self._guardar_hash(hasta, hash_hasta)
+                self._guardar_ultimo_bloque(hasta)
+                self.conexion.execute(
+                    "DELETE FROM bloques WHERE numero < ?", (hasta - self.profundidad_reorg,)
+                )
+            return len(logs)
+
+    def _guardar_hash(self, numero, hash_bloque):
+        self.conexion.execute("INSERT OR REPLACE INTO bloques (numero, hash) VALUES (?, ?)", (numero, hash_bloque))
+
+    def _aplicar_log(self, log, marca_de_tiempo):
+        evento = self._eventos[self.web3.to_hex(log['topics'][0])].process_log(log)
+        args = evento['args']
+        prestatario = args['prestatario']
+
+        if evento['event'] == 'SolicitudPrestamo':
+            (cantidad,) = self.conexion.execute(
+                "SELECT COUNT(*) FROM prestamos WHERE prestatario = ?", (prestatario,)
+            ).fetchone()
+            self.conexion.execute(
+                "INSERT INTO prestamos (prestatario, id, monto, plazo, tiempo_solicitud, tiempo_limite, estado, bloque) "
+                "VALUES (?, ?, ?, ?, ?, 0, ?, ?)",
+                (prestatario, cantidad + 1, str(args['monto']), args['plazo'], marca_de_tiempo, ESTADO_PENDIENTE, log['blockNumber']),
+            )
+            return
+
+        fila = self.conexion.execute(
+            "SELECT plazo, tiempo_limite FROM prestamos WHERE prestatario = ? AND id = ?", (prestatario, args['id'])
+        ).fetchone()
+        if fila is None:
+            logging.error(f"Cambio de estado de un préstamo no indexado: {prestatario} #{args['id']}")
+            return
+        plazo, tiempo_limite = fila
+        if args['estado'] == ESTADO_APROBADO:
+            tiempo_limite = marca_de_tiempo + plazo
+
+        self.conexion.execute(
+            "UPDATE prestamos SET estado = ?, tiempo_limite = ? WHERE prestatario = ? AND id = ?",
+            (args['estado'], tiempo_limite, prestatario, args['id']),
+        )
+        self.conexion.execute(
+            "INSERT INTO cambios_estado (prestatario, id, estado, tiempo_limite, bloque, indice_log) VALUES (?, ?, ?, ?, ?, ?)",
+            (prestatario, args['id'], args['estado'], tiempo_limite, log['blockNumber'], log['logIndex']),
+        )
+
+    def _comprobar_reorganizacion(self):
+        """
+            Compara los hashes guardados, del más reciente al más antiguo, con los de la red. Si el más
+            reciente no coincide, deshace todo lo procesado después del último bloque que sí coincide.
+        """
+        marcas = self.conexion.execute("SELECT numero, hash FROM bloques ORDER BY numero DESC").fetchall()
+        for posicion, (numero, hash_guardado) in enumerate(marcas):
+            try:
+                hash_red = self.web3.to_hex(self.web3.eth.get_block(numero)['hash'])
+            except BlockNotFound:
+                hash_red = None
+            if hash_red == hash_guardado:
+                if posicion > 0:
+                    logging.error(f"Reorganización detectada: se deshacen los bloques posteriores a {numero}")
+                    self._revertir_hasta(numero)
+                return
+        if marcas:
+            logging.error("Reorganización más profunda que los bloques guardados: se reconstruye el índice")
+            self._revertir_hasta(self.bloque_inicial - 1)
+
+    def _revertir_hasta(self, numero):
+        """Deshace los eventos aplicados después del bloque `numero` y recalcula los préstamos afectados."""
+        with self.conexion:
+            afectados = self.conexion.execute(
+                "SELECT DISTINCT prestatario, id FROM cambios_estado WHERE bloque > ?", (numero,)
+            ).fetchall()
+            self.conexion.execute("DELETE FROM prestamos WHERE bloque > ?", (numero,))
+            self.conexion.execute("DELETE FROM cambios_estado WHERE bloque > ?", (numero,))
+            self.conexion.execute("DELETE FROM bloques WHERE numero > ?", (numero,))
+            for prestatario, prestamo_id in afectados:
+                ultimo = self.conexion.execute(
+                    "SELECT estado, tiempo_limite FROM cambios_estado WHERE prestatario = ? AND id = ? "
+                    "ORDER BY bloque DESC, indice_log DESC LIMIT 1",
+                    (prestatario, prestamo_id),
+                ).fetchone()
+                estado, tiempo_limite = ultimo if ultimo else (ESTADO_PENDIENTE, 0)
+                self.conexion.execute(
+                    "UPDATE prestamos SET estado = ?, tiempo_limite = ? WHERE prestatario = ? AND id = ?",
+                    (estado, tiempo_limite, prestatario, prestamo_id),
+                )
+            self._guardar_ultimo_bloque(numero)
+
+    def ejecutar(self, intervalo=2, detener=None):
+        """
+            Sincroniza el índice de forma continua cada `intervalo` segundos hasta que se active el
+            evento `detener` (threading.Event). Los errores de red se registran y se reintenta en la
+            siguiente iteración.
+        """
+        detener = detener or threading.Event()
+        while not detener.is_set():
+            try:
+                self.sincronizar()
+            except Exception:
+                pass
+            detener.wait(intervalo)
+
+    def _consultar(self, condicion, parametros):
+        with self._cerrojo:
+            filas = self.conexion.execute(
+                "SELECT id, prestatario, monto, plazo, tiempo_solicitud, tiempo_limite, estado FROM prestamos "
+                f"WHERE {condicion}",
+                parametros,
+            ).fetchall()
+        return [RegistroPrestamo(fila[0], fila[1], int(fila[2]), *fila[3:]) for fila in filas]
+
+    def prestamos_por_estado(self, estado):
+        """Retorna los préstamos indexados con el código de estado indicado, como `RegistroPrestamo`."""
+        return self._consultar("estado = ? ORDER BY prestatario, id", (estado,))
+
+    def prestamos_vencidos(self, ahora=None):
+        """
+            Retorna los préstamos aprobados cuyo tiempo límite ya ha pasado (liquidables), ordenados
+            por tiempo límite.
+
+            Parámetros:
+            - ahora (int, opcional): Marca de tiempo Unix de referencia. Por defecto, la hora actual.
+        """
+        ahora = int(time.time()) if ahora is None else ahora
+        return self._consultar("estado = ? AND tiempo_limite < ? ORDER BY tiempo_limite", (ESTADO_APROBADO, ahora))
+
+    def filas_prestamos(self):
+        """
+            Retorna todos los préstamos indexados como tuplas en el orden de los campos de `RegistroPrestamo`,
+            sin ordenar y con el monto ya convertido a REAL por SQLite, para cargas masivas como la de
+            `AnaliticaCartera.CarteraPrestamos`.
+        """
+        with self._cerrojo:
+            return self.conexion.execute(
+                "SELECT id, prestatario, CAST(monto AS REAL), plazo, tiempo_solicitud, tiempo_limite, estado FROM prestamos"
+            ).fetchall()
+
+    def cambios_desde(self, bloque):
+        """
+            Retorna los cambios de estado indexados desde el bloque indicado (incluido), en el orden en
+            que se produjeron, como tuplas (prestatario, id, estado, tiempo_limite, bloque).
+        """
+        with self._cerrojo:
+            return self.conexion.execute(
+                "SELECT prestatario, id, estado, tiempo_limite, bloque FROM cambios_estado "
+                "WHERE bloque >= ? ORDER BY bloque, indice_log",
+                (bloque,),
+            ).fetchall()
+
+    def prestamos_de(self, prestatario):
+        """Retorna todos los préstamos indexados de un prestatario, ordenados por ID."""
+        return self._consultar("prestatario = ? ORDER BY id", (self.web3.to_checksum_address(prestatario),))
+
+    def cerrar(self):
+        """Cierra la conexión con la base de datos."""
+        with self._cerrojo:
+            self.conexion.close()
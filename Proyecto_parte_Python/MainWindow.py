@@ -1,12 +1,12 @@
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QMessageBox, QLabel
-from PyQt5.QtCore import Qt, QDate
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QMessageBox, QLabel, QListWidget, QListWidgetItem
+from PyQt5.QtCore import Qt, QDate, QThreadPool, pyqtSignal
 from PyQt5.QtGui import QFont, QColor
 
-from DatosDialog import DatosDialog
-from CredencialesDialog import CredencialesDialog
 from MensajesDialog import MensajesDialog
-from BlockchainManager import BlockchainManager
-from web3 import Web3 
+from OperacionEnSegundoPlano import OperacionEnSegundoPlano
+
+# web3 (y los diálogos que lo usan) se importan al usarse por primera vez: su importación tarda
+# más que crear toda la ventana, y cuando se pulsa una acción ya lo ha cargado la conexión
 
 class HoverButton(QPushButton):
     def __init__(self, text, parent=None):
@@ -40,9 +40,35 @@ class HoverExitButton(QPushButton):
         self.setFont(self.defaultFont)
 
 class MainWindow(QMainWindow):
-    def __init__(self, blockchainManager):
+    # Número máximo de operaciones que se ejecutan a la vez en segundo plano
+    MAX_OPERACIONES_SIMULTANEAS = 4
+
+    FASES_OPERACION = {
+        'firmada': 'Firmada',
+        'enviada': 'Enviada',
+        'reemplazada': 'Reenviada con más comisión',
+        'minada': 'Minada',
+    }
+
+    # Se emite en el hilo de la interfaz cuando la conexión en segundo plano termina bien
+    conectada = pyqtSignal()
+    # Se emite con el mensaje de error si la conexión falla
+    conexionFallida = pyqtSignal(str)
+
+    def __init__(self, blockchainManager=None):
+        """
+            Crea la ventana. Si no se indica `blockchainManager`, las acciones quedan desactivadas hasta
+            que `conectar` lo crea en segundo plano, de modo que la ventana se muestra sin esperar al nodo.
+        """
         super().__init__()
         self.blockchainManager = blockchainManager
+        self.crearBlockchainManager = None
+        self.botonesAccion = []
+        # Las operaciones se ejecutan fuera del hilo de la interfaz para que la ventana no se congele
+        self.poolOperaciones = QThreadPool(self)
+        self.poolOperaciones.setMaxThreadCount(self.MAX_OPERACIONES_SIMULTANEAS)
+        self.operaciones = {}
+        self.siguienteIdOperacion = 1
         self.setWindowTitle('Aplicación DeFi - Gestión de Préstamos')
         self.setGeometry(100, 100, 800, 600)
         self.initUI()
@@ -67,6 +93,27 @@ class MainWindow(QMainWindow):
             btn = HoverButton(action, self)
             btn.clicked.connect(lambda checked, a=action: self.onActionClicked(a))
             layout.addWidget(btn)
+            self.botonesAccion.append(btn)
+
+        # Estado de la conexión con el nodo
+        self.estadoConexionLabel = QLabel("", self)
+        self.estadoConexionLabel.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.estadoConexionLabel)
+        self.reintentarButton = HoverButton('Reintentar conexión', self)
+        self.reintentarButton.clicked.connect(lambda: self.conectar(self.crearBlockchainManager))
+        self.reintentarButton.hide()
+        layout.addWidget(self.reintentarButton)
+        self.setAccionesActivas(self.blockchainManager is not None)
+
+        # Operaciones en curso y su progreso
+        layout.addWidget(QLabel("Operaciones:", self))
+        self.listaOperaciones = QListWidget(self)
+        self.listaOperaciones.setMaximumHeight(120)
+        layout.addWidget(self.listaOperaciones)
+
+        cancelarButton = HoverButton('Cancelar espera de la operación seleccionada', self)
+        cancelarButton.clicked.connect(self.cancelarOperacionSeleccionada)
+        layout.addWidget(cancelarButton)
 
         # Botón de Salida
         exitButton = HoverExitButton('Salir', self)
@@ -87,16 +134,46 @@ class MainWindow(QMainWindow):
         # Cambiar el color de fondo de la ventana principal
         self.setStyleSheet("background-color: #f0f0f0;")
                 
+    def setAccionesActivas(self, activas):
+        for boton in self.botonesAccion:
+            boton.setEnabled(activas)
+
+    def conectar(self, crearBlockchainManager):
+        """
+            Crea el BlockchainManager en segundo plano llamando a `crearBlockchainManager` (conexión con
+            el nodo, carga del contrato y comprobación de la sesión). Las acciones se activan al terminar.
+        """
+        self.crearBlockchainManager = crearBlockchainManager
+        self.setAccionesActivas(False)
+        self.reintentarButton.hide()
+        self.estadoConexionLabel.setText("Conectando con el nodo...")
+
+        self.operacionConexion = OperacionEnSegundoPlano(0, None, crearBlockchainManager)
+        self.operacionConexion.senales.terminada.connect(self.onConexionEstablecida)
+        self.operacionConexion.senales.fallida.connect(self.onConexionFallida)
+        self.poolOperaciones.start(self.operacionConexion)
+
+    def onConexionEstablecida(self, idOperacion, blockchainManager):
+        self.blockchainManager = blockchainManager
+        self.estadoConexionLabel.setText("")
+        self.setAccionesActivas(True)
+        self.conectada.emit()
+
+    def onConexionFallida(self, idOperacion, mensaje, cancelada):
+        self.estadoConexionLabel.setText(f"No se pudo conectar: {mensaje}")
+        self.reintentarButton.show()
+        self.conexionFallida.emit(mensaje)
+
     def onActionClicked(self, action):
+        from web3 import Web3
+        from DatosDialog import DatosDialog
+        from CredencialesDialog import CredencialesDialog
+
         if action == "Alta de Prestamista":
             datosDialog = DatosDialog(action, self)
             if datosDialog.exec_():
                 datos = datosDialog.getDatos()
-                try:
-                    self.blockchainManager.alta_prestamista(datos['direccion'])
-                    MensajesDialog("Éxito", "La acción se completó con éxito.", self).exec_()
-                except Exception as e:
-                    MensajesDialog("Error", str(e), self).exec_()
+                self.lanzarOperacion(action, lambda: self.blockchainManager.alta_prestamista(datos['direccion']))
         else:
             credDialog = CredencialesDialog(self)
             if credDialog.exec_():
@@ -108,26 +185,23 @@ class MainWindow(QMainWindow):
 
                     try:
                         if action == "Alta de Cliente":
-                            self.blockchainManager.alta_cliente(direccion, clavePrivada, datos['direccionCliente']) 
-                            MensajesDialog("Éxito", "La acción se completó con éxito.", self).exec_()
+                            self.lanzarOperacion(action, lambda: self.blockchainManager.alta_cliente(direccion, clavePrivada, datos['direccionCliente']))
                         elif action == "Depositar Garantía":
                             valorWei = Web3.to_wei(float(datos['valorDeposito']), 'ether')
-                            self.blockchainManager.depositar_garantia(direccion, clavePrivada, valorWei)
-                            MensajesDialog("Éxito", "La acción se completó con éxito.", self).exec_()
+                            self.lanzarOperacion(action, lambda: self.blockchainManager.depositar_garantia(direccion, clavePrivada, valorWei))
                         elif action == "Solicitar Préstamo":
                             montoWei = Web3.to_wei(float(datos['montoPrestamo']), 'ether')
                             plazoSegundos = int(datos['plazoPrestamo'])
-                            self.blockchainManager.solicitar_prestamo(direccion, clavePrivada, montoWei, plazoSegundos)
-                            MensajesDialog("Éxito", "La acción se completó con éxito.", self).exec_()
+                            self.lanzarOperacion(action, lambda: self.blockchainManager.solicitar_prestamo(direccion, clavePrivada, montoWei, plazoSegundos))
                         elif action == "Reembolsar Préstamo":
-                            self.blockchainManager.reembolsar_prestamo(direccion, clavePrivada, int(datos['idPrestamoReembolso']))
-                            MensajesDialog("Éxito", "La acción se completó con éxito.", self).exec_()
+                            idPrestamo = int(datos['idPrestamoReembolso'])
+                            self.lanzarOperacion(action, lambda: self.blockchainManager.reembolsar_prestamo(direccion, clavePrivada, idPrestamo))
                         elif action == "Liquidar Garantía":
-                            self.blockchainManager.liquidar_garantia(direccion, clavePrivada, datos['direccionPrestatarioLiquidar'], int(datos['idPrestamoLiquidar']))
-                            MensajesDialog("Éxito", "La acción se completó con éxito.", self).exec_()
+                            idPrestamo = int(datos['idPrestamoLiquidar'])
+                            self.lanzarOperacion(action, lambda: self.blockchainManager.liquidar_garantia(direccion, clavePrivada, datos['direccionPrestatarioLiquidar'], idPrestamo))
                         elif action == "Aceptar Préstamo":
-                            self.blockchainManager.aprobar_prestamo(direccion, clavePrivada, datos['direccionPrestatarioAceptar'], int(datos['idPrestamoAceptar']))
-                            MensajesDialog("Éxito", "La acción se completó con éxito.", self).exec_()
+                            idPrestamo = int(datos['idPrestamoAceptar'])
+                            self.lanzarOperacion(action, lambda: self.blockchainManager.aprobar_prestamo(direccion, clavePrivada, datos['direccionPrestatarioAceptar'], idPrestamo))
                         elif action == "Obtener préstamos por prestatario":
                             self.procesarPrestamosPorPrestatario(datos['direccionPrestatarioObtener'])
                         elif action == "Obtener detalle de préstamo":
@@ -136,7 +210,58 @@ class MainWindow(QMainWindow):
                     except Exception as e:
                         MensajesDialog("Error", str(e), self).exec_()
 
+    def lanzarOperacion(self, action, funcion, alTerminar=None):
+        """
+            Ejecuta `funcion` en el pool de operaciones y muestra su progreso en la lista de operaciones.
+            Al terminar se llama a `alTerminar` con el resultado, en el hilo de la interfaz; si no se
+            indica, se muestra el mensaje de éxito.
+        """
+        idOperacion = self.siguienteIdOperacion
+        self.siguienteIdOperacion += 1
+
+        item = QListWidgetItem(f"#{idOperacion} {action}: En cola")
+        item.setData(Qt.UserRole, idOperacion)
+        self.listaOperaciones.addItem(item)
+
+        operacion = OperacionEnSegundoPlano(idOperacion, self.blockchainManager, funcion)
+        operacion.senales.progreso.connect(self.onOperacionProgreso)
+        operacion.senales.terminada.connect(self.onOperacionTerminada)
+        operacion.senales.fallida.connect(self.onOperacionFallida)
+        self.operaciones[idOperacion] = (operacion, item, action, alTerminar)
+        self.poolOperaciones.start(operacion)
+
+    def onOperacionProgreso(self, idOperacion, fase, txnHash):
+        if idOperacion in self.operaciones:
+            _, item, action, _ = self.operaciones[idOperacion]
+            item.setText(f"#{idOperacion} {action}: {self.FASES_OPERACION.get(fase, fase)} ({txnHash[:10]}...)")
+
+    def onOperacionTerminada(self, idOperacion, resultado):
+        _, item, action, alTerminar = self.operaciones.pop(idOperacion)
+        item.setText(f"#{idOperacion} {action}: Completada")
+        if alTerminar is not None:
+            alTerminar(resultado)
+        else:
+            MensajesDialog("Éxito", f"La acción \"{action}\" se completó con éxito.", self).show()
+
+    def onOperacionFallida(self, idOperacion, mensaje, cancelada):
+        _, item, action, _ = self.operaciones.pop(idOperacion)
+        if cancelada:
+            item.setText(f"#{idOperacion} {action}: Espera cancelada")
+        else:
+            item.setText(f"#{idOperacion} {action}: Error")
+            MensajesDialog("Error", f"{action}: {mensaje}", self).show()
+
+    def cancelarOperacionSeleccionada(self):
+        item = self.listaOperaciones.currentItem()
+        if item is None:
+            return
+        idOperacion = item.data(Qt.UserRole)
+        if idOperacion in self.operaciones:
+            self.operaciones[idOperacion][0].cancelar()
+
     def procesarPrestamosPorPrestatario(self, direccionPrestatario):
+        from web3 import Web3
+
         try:
             # Comprueba que la dirección no esté vacía.
             if not direccionPrestatario:
@@ -144,23 +269,25 @@ class MainWindow(QMainWindow):
             if not Web3.is_address(direccionPrestatario):
                 raise ValueError("La dirección del prestatario proporcionada no es válida.")
 
-            # Llama a la función de BlockchainManager para obtener los IDs de préstamos.
-            prestamo_ids = self.blockchainManager.obtener_prestamos_por_prestatario(direccionPrestatario)
-
-            # Comprueba si se encontraron préstamos.
-            if not prestamo_ids:
-                QMessageBox.information(self, "Préstamos por Prestatario", "No se encontraron préstamos para el prestatario especificado.")
-            else:
-                # Convierte los IDs de préstamos a cadena para mostrarlos.
-                prestamos_str = ', '.join(map(str, prestamo_ids))
-                MensajesDialog("Préstamos por Prestatario", "IDs de préstamos: " + prestamos_str, self).exec_()
+            # Llama en segundo plano a la función de BlockchainManager para obtener los IDs de préstamos.
+            self.lanzarOperacion("Obtener préstamos por prestatario",
+                                 lambda: self.blockchainManager.obtener_prestamos_por_prestatario(direccionPrestatario),
+                                 self.mostrarPrestamosPorPrestatario)
         except ValueError as ve:
             QMessageBox.warning(self, "Error de Validación", str(ve))
-        except Exception as e:
-            QMessageBox.critical(self, "Error", "Ha ocurrido un error inesperado: " + str(e))
-            
+
+    def mostrarPrestamosPorPrestatario(self, prestamo_ids):
+        # Comprueba si se encontraron préstamos.
+        if not prestamo_ids:
+            QMessageBox.information(self, "Préstamos por Prestatario", "No se encontraron préstamos para el prestatario especificado.")
+        else:
+            # Convierte los IDs de préstamos a cadena para mostrarlos.
+            prestamos_str = ', '.join(map(str, prestamo_ids))
+            MensajesDialog("Préstamos por Prestatario", "IDs de préstamos: " + prestamos_str, self).show()
   
     def procesarDetallePrestamo(self, direccionPrestatario, idPrestamo):
+        from web3 import Web3
+
         try:
             if idPrestamo <= 0:
                 raise ValueError("El ID del préstamo debe ser un número positivo.")
@@ -168,22 +295,27 @@ class MainWindow(QMainWindow):
             if not Web3.is_address(direccionPrestatario):
                 raise ValueError("La dirección del prestatario proporcionada no es válida.")
 
-            detalle = self.blockchainManager.obtener_detalle_de_prestamo(direccionPrestatario, idPrestamo)
-
-            if not detalle:
-                QMessageBox.information(self, "Detalle del Préstamo", "No se encontró el préstamo especificado.")
-            else:
-                MensajesDialog("Detalle del Préstamo", str(detalle), self).exec_()
+            self.lanzarOperacion("Obtener detalle de préstamo",
+                                 lambda: self.blockchainManager.obtener_detalle_de_prestamo(direccionPrestatario, idPrestamo),
+                                 self.mostrarDetallePrestamo)
         except ValueError as ve:
             QMessageBox.warning(self, "Error de Validación", str(ve))
-        except Exception as e:
-            QMessageBox.critical(self, "Error", "Ha ocurrido un error inesperado: " + str(e))
+
+    def mostrarDetallePrestamo(self, detalle):
+        if not detalle:
+            QMessageBox.information(self, "Detalle del Préstamo", "No se encontró el préstamo especificado.")
+        else:
+            MensajesDialog("Detalle del Préstamo", str(detalle), self).show()
                                         
     def closeApplication(self):
         reply = QMessageBox.question(self, 'Salir', '¿Estás seguro de que quieres salir?',
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
         if reply == QMessageBox.Yes:
+            # Interrumpe las esperas pendientes para que los hilos de trabajo terminen
+            for operacion, _, _, _ in self.operaciones.values():
+                operacion.cancelar()
+            self.poolOperaciones.waitForDone(2000)
             QMessageBox.information(self, "Despedida", "Gracias por usar la aplicación. ¡Hasta la próxima!")
             QApplication.instance().quit() 
                     
\ No newline at end of file
@@ -0,0 +1,236 @@
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites superiores (en segundos) de las cubetas de los histogramas de latencia
+CUBETAS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Límites superiores de las cubetas del histograma de gas consumido por transacción
+CUBETAS_GAS = (21000, 30000, 50000, 75000, 100000, 150000, 200000, 300000, 500000, 1000000, 3000000)
+
+# Descripción de cada métrica, para la ayuda (# HELP) del formato de Prometheus
+DESCRIPCIONES = {
+    'rpc_peticiones_total': "Peticiones JSON-RPC enviadas al nodo, por método y resultado.",
+    'rpc_llamadas_en_lote_total': "Llamadas JSON-RPC enviadas dentro de peticiones por lotes.",
+    'rpc_latencia_segundos': "Latencia de las peticiones JSON-RPC, por método.",
+    'transacciones_total': "Transacciones enviadas, por función del contrato y resultado.",
+    'transaccion_duracion_segundos': "Duración completa de una transacción (construir, firmar, difundir y esperar), por función.",
+    'confirmacion_segundos': "Tiempo desde la difusión de una transacción hasta obtener su recibo.",
+    'gas_usado': "Gas consumido por transacción, por función.",
+    'reversiones_total': "Transacciones minadas con estado fallido (revertidas), por función.",
+    'lecturas_total': "Lecturas del contrato, por función y origen (cache o nodo).",
+    'lectura_latencia_segundos': "Latencia de las lecturas del contrato que llegan al nodo, por función.",
+    'recibos_pendientes': "Transacciones difundidas cuyo recibo aún no se ha obtenido.",
+    'liquidaciones_programadas': "Préstamos aprobados cuya liquidación está programada para su vencimiento.",
+}
+
+
+class Histograma:
+    """Histograma acumulativo con cubetas fijas, como los de Prometheus."""
+
+    def __init__(self, cubetas):
+        self.cubetas = cubetas
+        self.cuentas = [0] * (len(cubetas) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.cuentas[bisect.bisect_left(self.cubetas, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    def acumuladas(self):
+        """Retorna una lista de tuplas (límite, observaciones <= límite), terminando en '+Inf'."""
+        acumulado = 0
+        resultado = []
+        for limite, cuenta in zip(list(self.cubetas) + ['+Inf'], self.cuentas):
+            acumulado += cuenta
+            resultado.append((limite, acumulado))
+        return resultado
+
+
+class Metricas:
+    """
+        Registro de métricas en memoria (contadores, histogramas e indicadores) con etiquetas, seguro
+        para usar desde varios hilos.
+
+        Las métricas se consultan con `instantanea` (un diccionario) o en el formato de texto de
+        Prometheus con `formato_prometheus`, que es lo que sirve el endpoint HTTP de `servir`.
+
+        Atributos:
+        - cubetas (dict): Cubetas de cada histograma por nombre. Los que no aparecen usan `CUBETAS_LATENCIA`.
+    """
+
+    def __init__(self, cubetas=None):
+        self.cubetas = {'gas_usado': CUBETAS_GAS, **(cubetas or {})}
+        self._contadores = {}
+        self._histogramas = {}
+        self._indicadores = {}
+        self._cerrojo = threading.Lock()
+
+    @staticmethod
+    def _clave(nombre, etiquetas):
+        return nombre, tuple(sorted(etiquetas.items()))
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        """Suma `valor` al contador `nombre` con las etiquetas indicadas."""
+        clave = self._clave(nombre, etiquetas)
+        with self._cerrojo:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        """Añade `valor` al histograma `nombre` con las etiquetas indicadas."""
+        clave = self._clave(nombre, etiquetas)
+        with self._cerrojo:
+            if clave not in self._histogramas:
+                self._histogramas[clave] = Histograma(self.cubetas.get(nombre, CUBETAS_LATENCIA))
+            self._histogramas[clave].observar(valor)
+
+    def indicador(self, nombre, funcion, **etiquetas):
+        """Registra un indicador cuyo valor se obtiene llamando a `funcion` cada vez que se consultan las métricas."""
+        with self._cerrojo:
+            self._indicadores[self._clave(nombre, etiquetas)] = funcion
+
+    def cronometrar(self, nombre, **etiquetas):
+        """Retorna un contexto que observa en el histograma `nombre` los segundos que tarda su bloque."""
+        return _Cronometro(self, nombre, etiquetas)
+
+    def _valores_indicadores(self):
+        with self._cerrojo:
+            indicadores = list(self._indicadores.items())
+        valores = []
+        for clave, funcion in indicadores:
+            try:
+                valores.append((clave, funcion()))
+            except Exception as e:
+                logging.error(f"Error al calcular la métrica {clave[0]}: {e}")
+        return valores
+
+    def instantanea(self):
+        """
+            Retorna el estado actual de todas las métricas.
+
+            Retorna:
+            Un diccionario {'contadores': ..., 'histogramas': ..., 'indicadores': ...} en el que cada
+            entrada es una lista de diccionarios con 'nombre', 'etiquetas' y sus valores. Los histogramas
+            incluyen 'total', 'suma' y las 'cubetas' acumuladas.
+        """
+        with self._cerrojo:
+            contadores = [
+                {'nombre': nombre, 'etiquetas': dict(etiquetas), 'valor': valor}
+                for (nombre, etiquetas), valor in sorted(self._contadores.items())
+            ]
+            histogramas = [
+                {
+                    'nombre': nombre,
+                    'etiquetas': dict(etiquetas),
+                    'total': histograma.total,
+                    'suma': histograma.suma,
+                    'cubetas': histograma.acumuladas(),
+                }
+                for (nombre, etiquetas), histograma in sorted(self._histogramas.items())
+            ]
+        indicadores = [
+            {'nombre': nombre, 'etiquetas': dict(etiquetas), 'valor': valor}
+            for (nombre, etiquetas), valor in sorted(self._valores_indicadores())
+        ]
+        return {'contadores': contadores, 'histogramas': histogramas, 'indicadores': indicadores}
+
+    def formato_prometheus(self):
+        """Retorna las métricas en el formato de texto de exposición de Prometheus (versión 0.0.4)."""
+        instantanea = self.instantanea()
+        lineas = []
+        cabeceras = set()
+
+        def cabecera(nombre, tipo):
+            if nombre not in cabeceras:
+                cabeceras.add(nombre)
+                if nombre in DESCRIPCIONES:
+                    lineas.append(f"# HELP {nombre} {DESCRIPCIONES[nombre]}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+
+        for contador in instantanea['contadores']:
+            cabecera(contador['nombre'], 'counter')
+            lineas.append(f"{contador['nombre']}{_etiquetas(contador['etiquetas'])} {contador['valor']}")
+        for indicador in instantanea['indicadores']:
+            cabecera(indicador['nombre'], 'gauge')
+            lineas.append(f"{indicador['nombre']}{_etiquetas(indicador['etiquetas'])} {indicador['valor']}")
+        for histograma in instantanea['histogramas']:
+            nombre, etiquetas = histograma['nombre'], histograma['etiquetas']
+            cabecera(nombre, 'histogram')
+            for limite, acumulado in histograma['cubetas']:
+                lineas.append(f"{nombre}_bucket{_etiquetas(dict(etiquetas, le=limite))} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {histograma['suma']}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {histograma['total']}")
+        return '\n'.join(lineas) + '\n'
+
+    def servir(self, puerto=9100, direccion='127.0.0.1'):
+        """
+            Sirve las métricas por HTTP en formato Prometheus (ruta /metrics) desde un hilo en segundo plano.
+
+            Retorna:
+            El servidor (ThreadingHTTPServer); `shutdown()` lo detiene.
+        """
+        metricas = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                cuerpo = metricas.formato_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, formato, *args):
+                pass
+
+        servidor = ThreadingHTTPServer((direccion, puerto), Manejador)
+        servidor.daemon_threads = True
+        threading.Thread(target=servidor.serve_forever, name='metricas-http', daemon=True).start()
+        logging.info(f"Métricas disponibles en http://{direccion}:{servidor.server_port}/metrics")
+        return servidor
+
+    def middleware_rpc(self, make_request, web3):
+        """Middleware de Web3 que cuenta y cronometra cada petición JSON-RPC por método."""
+        def middleware(method, params):
+            inicio = time.perf_counter()
+            try:
+                respuesta = make_request(method, params)
+            except Exception:
+                self.incrementar('rpc_peticiones_total', metodo=method, resultado='excepcion')
+                raise
+            finally:
+                self.observar('rpc_latencia_segundos', time.perf_counter() - inicio, metodo=method)
+            self.incrementar('rpc_peticiones_total', metodo=method, resultado='error' if 'error' in respuesta else 'ok')
+            return respuesta
+        return middleware
+
+
+class _Cronometro:
+    def __init__(self, metricas, nombre, etiquetas):
+        self.metricas = metricas
+        self.nombre = nombre
+        self.etiquetas = etiquetas
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excepcion):
+        self.metricas.observar(self.nombre, time.perf_counter() - self.inicio, **self.etiquetas)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in etiquetas.items()) + '}'
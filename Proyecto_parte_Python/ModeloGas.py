@@ -0,0 +1,156 @@
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+import weakref
+
+from ContractUtils import ruta_datos
+
+# Límites de gas admitidos, los mismos que valida BlockchainManager.build_transaction
+GAS_MINIMO = 21000
+GAS_MAXIMO = 8000000
+
+# Modelos con archivo cuyas actualizaciones pendientes se guardan al terminar el proceso. El conjunto
+# no los mantiene vivos: un modelo que ya no se usa se libera y deja de guardarse
+_modelos_persistentes = weakref.WeakSet()
+
+
+def _guardar_modelos():
+    for modelo in list(_modelos_persistentes):
+        modelo.guardar()
+
+
+atexit.register(_guardar_modelos)
+
+
+class ModeloGas:
+    """
+        Aprende el límite de gas adecuado para cada función del contrato a partir de los recibos.
+
+        Cada función se identifica por la dirección del contrato y su selector (los 4 primeros bytes
+        de los datos de la llamada). La primera vez se siembra con `estimate_gas`; a partir de ahí se
+        actualiza con el `gasUsed` de los recibos y el límite propuesto es el mayor consumo reciente
+        más un margen de seguridad. Así se evita pedir una estimación al nodo en cada envío y no se
+        reserva mucho más saldo del necesario para gas.
+
+        El consumo de algunas funciones depende del estado del contrato, así que un caso caro puede
+        salir de la ventana de consumos recientes. Por eso cada función conserva, fuera de la ventana,
+        un mínimo: la mayor estimación del nodo con la que se ha sembrado (y el límite de cualquier
+        transacción que lo agotó). El límite propuesto nunca baja de ese mínimo.
+
+        El modelo se guarda en un archivo JSON para conservarlo entre ejecuciones.
+
+        Atributos:
+        - ruta (str): Ruta del archivo JSON en el que se persiste el modelo (None para no persistirlo). Una
+        ruta relativa se resuelve con `ContractUtils.ruta_datos`.
+        - margen (float): Margen de seguridad sobre el consumo observado (0.2 = 20 %).
+        - muestras_maximas (int): Número de consumos recientes que se conservan por función.
+        - intervalo_guardado (float): Segundos mínimos entre dos escrituras del archivo.
+    """
+
+    def __init__(self, ruta='modelo_gas.json', margen=0.2, muestras_maximas=20, intervalo_guardado=5.0):
+        self.ruta = ruta_datos(ruta)
+        self.margen = margen
+        self.muestras_maximas = muestras_maximas
+        self.intervalo_guardado = intervalo_guardado
+        self._funciones = {}
+        # Mínimo de cada función, fuera de la ventana de consumos recientes: {clave: gas}
+        self._minimos = {}
+        self._ultimo_guardado = 0.0
+        self._cerrojo = threading.Lock()
+        self._cargar()
+        if self.ruta:
+            _modelos_persistentes.add(self)
+
+    @staticmethod
+    def clave(function_call):
+        """Retorna la clave del modelo para una llamada a función del contrato: 'direccion:selector'."""
+        return f"{function_call.address}:{function_call.selector}"
+
+    def _cargar(self):
+        if not self.ruta or not os.path.exists(self.ruta):
+            return
+        try:
+            with open(self.ruta, 'r') as archivo:
+                datos = json.load(archivo)
+            if 'muestras' in datos:
+                self._funciones = datos['muestras']
+                self._minimos = datos.get('minimos', {})
+            else:
+                # Formato anterior: solo las muestras de cada función
+                self._funciones = datos
+        except (OSError, ValueError) as e:
+            logging.error(f"Error al cargar el modelo de gas: {e}")
+
+    def _con_margen(self, gas):
+        return min(max(math.ceil(gas * (1 + self.margen)), GAS_MINIMO), GAS_MAXIMO)
+
+    def limite(self, clave):
+        """
+            Retorna el límite de gas propuesto para la función, o None si todavía no hay datos y es
+            necesario sembrarla con una estimación.
+        """
+        with self._cerrojo:
+            muestras = self._funciones.get(clave)
+            if not muestras:
+                return None
+            return self._con_margen(max(max(muestras), self._minimos.get(clave, 0)))
+
+    def sembrar(self, clave, estimacion):
+        """
+            Registra la estimación de gas de una función sin datos previos. La estimación también eleva
+            el mínimo de la función.
+
+            Retorna:
+            El límite de gas propuesto (la estimación, o el mínimo si es mayor, más el margen de seguridad).
+        """
+        with self._cerrojo:
+            self._funciones[clave] = [estimacion]
+            minimo = self._minimos[clave] = max(self._minimos.get(clave, 0), estimacion)
+        self._guardar_si_procede()
+        return self._con_margen(minimo)
+
+    def registrar(self, clave, gas_usado, gas_limite):
+        """
+            Actualiza el modelo con el gas consumido por una transacción minada.
+
+            Si la transacción agotó todo su límite de gas, el consumo real es desconocido, así que se
+            descartan los consumos recientes de la función para que la próxima vez se vuelva a estimar,
+            y su mínimo pasa a ser al menos ese límite.
+
+            Parámetros:
+            - clave (str): La clave de la función (ver `clave`).
+            - gas_usado (int): El `gasUsed` del recibo.
+            - gas_limite (int): El límite de gas con el que se envió la transacción.
+        """
+        with self._cerrojo:
+            if gas_usado >= gas_limite:
+                self._funciones.pop(clave, None)
+                self._minimos[clave] = max(self._minimos.get(clave, 0), gas_limite)
+            else:
+                muestras = self._funciones.setdefault(clave, [])
+                muestras.append(gas_usado)
+                del muestras[:-self.muestras_maximas]
+        self._guardar_si_procede()
+
+    def _guardar_si_procede(self):
+        if time.monotonic() - self._ultimo_guardado >= self.intervalo_guardado:
+            self.guardar()
+
+    def guardar(self):
+        """Escribe el modelo en su archivo JSON."""
+        if not self.ruta:
+            return
+        with self._cerrojo:
+            datos = json.dumps({'muestras': self._funciones, 'minimos': self._minimos})
+            self._ultimo_guardado = time.monotonic()
+        try:
+            ruta_temporal = self.ruta + '.tmp'
+            with open(ruta_temporal, 'w') as archivo:
+                archivo.write(datos)
+            os.replace(ruta_temporal, self.ruta)
+        except OSError as e:
+            logging.error(f"Error al guardar el modelo de gas: {e}")
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import threading
+
+# Fragmentos de los mensajes de error que devuelven los nodos (Ganache, Geth, etc.) cuando el nonce
+# de una transacción no coincide con el que esperan para la cuenta.
+ERRORES_DE_NONCE = (
+    'nonce too low',
+    'nonce too high',
+    'already known',
+    'known transaction',
+    'replacement transaction underpriced',
+    "doesn't have the correct nonce",
+)
+
+
+def es_error_de_nonce(error):
+    """Indica si el error devuelto por el nodo se debe a un nonce desincronizado."""
+    mensaje = str(error).lower()
+    return any(fragmento in mensaje for fragmento in ERRORES_DE_NONCE)
+
+
+class NonceManager:
+    """
+        Asigna nonces de forma local para cada cuenta emisora, evitando consultar
+        `eth_getTransactionCount` al nodo antes de cada transacción.
+
+        El primer nonce de cada cuenta se obtiene del nodo (incluyendo las transacciones pendientes)
+        y, a partir de ahí, se incrementa localmente. Esto permite firmar y difundir varias
+        transacciones seguidas de la misma cuenta sin esperar a que se mine la anterior.
+
+        Si el envío de una transacción falla, el nonce se devuelve cuando es el último asignado;
+        en cualquier otro caso (huecos o errores de nonce del nodo) la cuenta se resincroniza
+        con el estado pendiente de la red.
+
+        Atributos:
+        - web3 (Web3): Instancia de Web3 utilizada para consultar el nonce en la red.
+
+        Métodos:
+        - asignar(self, cuenta): Reserva y devuelve el siguiente nonce de la cuenta.
+        - descartar(self, cuenta, nonce, error=None): Informa de que un nonce asignado no llegó a la red.
+        - sincronizar(self, cuenta): Vuelve a leer el nonce pendiente de la cuenta desde el nodo.
+        - envio(self, cuenta): Cerrojo para difundir las transacciones de la cuenta en orden de nonce.
+    """
+
+    def __init__(self, web3):
+        self.web3 = web3
+        self._siguientes = {}
+        self._cerrojos = {}
+        self._envios = {}
+        self._cerrojo_global = threading.Lock()
+
+    def _cerrojo(self, cuenta):
+        with self._cerrojo_global:
+            if cuenta not in self._cerrojos:
+                self._cerrojos[cuenta] = threading.Lock()
+            return self._cerrojos[cuenta]
+
+    def envio(self, cuenta):
+        """
+            Retorna el cerrojo de envío de la cuenta. Si varios hilos envían transacciones de la misma
+            cuenta, deben asignar el nonce, firmar y difundir con este cerrojo adquirido para que las
+            transacciones lleguen al nodo en orden de nonce (algunos nodos rechazan los nonces con hueco).
+        """
+        with self._cerrojo_global:
+            if cuenta not in self._envios:
+                self._envios[cuenta] = threading.Lock()
+            return self._envios[cuenta]
+
+    def _nonce_en_red(self, cuenta):
+        return self.web3.eth.get_transaction_count(cuenta, 'pending')
+
+    def asignar(self, cuenta):
+        """
+            Reserva el siguiente nonce disponible para la cuenta.
+
+            Parámetros:
+            - cuenta (str): Dirección Ethereum (checksum) de la cuenta emisora.
+
+            Retorna:
+            El nonce (int) que debe usarse en la próxima transacción de la cuenta.
+        """
+        with self._cerrojo(cuenta):
+            if cuenta not in self._siguientes:
+                self._siguientes[cuenta] = self._nonce_en_red(cuenta)
+            nonce = self._siguientes[cuenta]
+            self._siguientes[cuenta] = nonce + 1
+            return nonce
+
+    def descartar(self, cuenta, nonce, error=None):
+        """
+            Informa de que la transacción con el nonce indicado no llegó a difundirse.
+
+            Si el nonce es el último asignado a la cuenta simplemente se devuelve. Si ya se habían
+            asignado nonces posteriores (quedaría un hueco) o el nodo rechazó la transacción por un
+            problema de nonce, se resincroniza la cuenta con la red.
+
+            Parámetros:
+            - cuenta (str): Dirección Ethereum (checksum) de la cuenta emisora.
+            - nonce (int): El nonce que no llegó a utilizarse.
+            - error (Exception, opcional): El error producido al enviar la transacción.
+        """
+        with self._cerrojo(cuenta):
+            if error is None or not es_error_de_nonce(error):
+                if self._siguientes.get(cuenta) == nonce + 1:
+                    self._siguientes[cuenta] = nonce
+                    return
+        self.sincronizar(cuenta)
+
+    def sincronizar(self, cuenta):
+        """
+            Descarta el estado local de la cuenta y vuelve a leer su nonce pendiente desde el nodo.
+
+            Parámetros:
+            - cuenta (str): Dirección Ethereum (checksum) de la cuenta a resincronizar.
+        """
+        with self._cerrojo(cuenta):
+            try:
+                self._siguientes[cuenta] = self._nonce_en_red(cuenta)
+            except Exception as e:
+                # Si el nodo no responde se olvida el estado local y se consultará en la próxima asignación
+                logging.error(f"Error al sincronizar el nonce de {cuenta}: {e}")
+                self._siguientes.pop(cuenta, None)
+
+
+class AsyncNonceManager:
+    """
+        Variante de `NonceManager` para código asíncrono (asyncio). Mantiene la misma política de
+        asignación local y resincronización, pero consulta el nodo con una instancia de `AsyncWeb3`
+        y protege cada cuenta con un `asyncio.Lock`.
+
+        Atributos:
+        - web3 (AsyncWeb3): Instancia asíncrona de Web3 utilizada para consultar el nonce en la red.
+    """
+
+    def __init__(self, web3):
+        self.web3 = web3
+        self._siguientes = {}
+        self._cerrojos = {}
+        self._envios = {}
+
+    def _cerrojo(self, cuenta):
+        if cuenta not in self._cerrojos:
+            self._cerrojos[cuenta] = asyncio.Lock()
+        return self._cerrojos[cuenta]
+
+    def envio(self, cuenta):
+        """
+            Retorna el cerrojo de envío (`asyncio.Lock`) de la cuenta. Las corrutinas que envían
+            transacciones de la misma cuenta deben asignar el nonce, firmar y difundir con él adquirido,
+            igual que con `NonceManager.envio`.
+        """
+        if cuenta not in self._envios:
+            self._envios[cuenta] = asyncio.Lock()
+        return self._envios[cuenta]
+
+    async def _nonce_en_red(self, cuenta):
+        return await self.web3.eth.get_transaction_count(cuenta, 'pending')
+
+    async def asignar(self, cuenta):
+        """Reserva y devuelve el siguiente nonce disponible para la cuenta."""
+        async with self._cerrojo(cuenta):
+            if cuenta not in self._siguientes:
+                self._siguientes[cuenta] = await self._nonce_en_red(cuenta)
+            nonce = self._siguientes[cuenta]
+            self._siguientes[cuenta] = nonce + 1
+            return nonce
+
+    async def descartar(self, cuenta, nonce, error=None):
+        """Informa de que el nonce indicado no llegó a difundirse (ver `NonceManager.descartar`)."""
+        async with self._cerrojo(cuenta):
+            if error is None or not es_error_de_nonce(error):
+                if self._siguientes.get(cuenta) == nonce + 1:
+                    self._siguientes[cuenta] = nonce
+                    return
+        await self.sincronizar(cuenta)
+
+    async def sincronizar(self, cuenta):
+        """Vuelve a leer el nonce pendiente de la cuenta desde el nodo."""
+        async with self._cerrojo(cuenta):
+            try:
+                self._siguientes[cuenta] = await self._nonce_en_red(cuenta)
+            except Exception as e:
+                logging.error(f"Error al sincronizar el nonce de {cuenta}: {e}")
+                self._siguientes.pop(cuenta, None)
@@ -0,0 +1,188 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from web3._utils.method_formatters import receipt_formatter
+from web3.datastructures import AttributeDict
+
+
+class NotificadorRecibos:
+    """
+        Obtiene de forma compartida los recibos de todas las transacciones pendientes, en lugar de que
+        cada espera consulte `eth_getTransactionReceipt` por su cuenta.
+
+        Un único hilo sigue la cabeza de la cadena mientras haya transacciones registradas. Por cada
+        bloque nuevo se leen los hashes de sus transacciones y solo se piden, en un único lote JSON-RPC,
+        los recibos de las transacciones registradas que aparecen en él. Así el nodo recibe una consulta
+        por bloque, independientemente del número de transacciones pendientes.
+
+        Cada transacción registrada se representa con un `concurrent.futures.Future` que se completa
+        con su recibo; se pueden esperar con `Future.result` o `concurrent.futures.wait`, o añadirles
+        callbacks con `add_done_callback`.
+
+        Los `Future` de las transacciones minadas más recientes se conservan, de modo que registrar de
+        nuevo una transacción ya resuelta (por ejemplo, al esperar uno a uno los recibos de un lote)
+        devuelve su recibo sin consultar al nodo.
+
+        Atributos:
+        - blockchain_manager (BlockchainManager): Gestor con la conexión al nodo y `rpc_batch`.
+        - intervalo (float): Segundos entre dos consultas de la cabeza de la cadena.
+        - max_resueltos (int): Número de recibos recientes que se conservan.
+    """
+
+    def __init__(self, blockchain_manager, intervalo=0.2, max_resueltos=1024):
+        self.blockchain_manager = blockchain_manager
+        self.intervalo = intervalo
+        self.max_resueltos = max_resueltos
+        self._pendientes = {}
+        self._resueltos = OrderedDict()
+        self._por_verificar = set()
+        self._ultimo_bloque = None
+        self._cerrojo = threading.Lock()
+        self._hay_pendientes = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    @staticmethod
+    def _normalizar(txn_hash):
+        if isinstance(txn_hash, (bytes, bytearray)):
+            txn_hash = txn_hash.hex()
+        txn_hash = txn_hash.lower()
+        return txn_hash if txn_hash.startswith('0x') else '0x' + txn_hash
+
+    def registrar(self, txn_hash):
+        """
+            Registra una transacción difundida para recibir su recibo.
+
+            Parámetros:
+            - txn_hash (HexBytes | str): El hash de la transacción.
+
+            Retorna:
+            Un `Future` que se completa con el recibo (TxReceipt) cuando la transacción se mina. Si el
+            hash ya estaba registrado, se devuelve el mismo `Future`.
+        """
+        clave = self._normalizar(txn_hash)
+        with self._cerrojo:
+            futuro = self._pendientes.get(clave) or self._resueltos.get(clave)
+            if futuro is None:
+                futuro = Future()
+                self._pendientes[clave] = futuro
+                # Puede haberse minado en un bloque ya procesado, así que se consulta una vez directamente
+                self._por_verificar.add(clave)
+            self._iniciar()
+        self._hay_pendientes.set()
+        return futuro
+
+    def cancelar(self, txn_hash):
+        """Deja de seguir una transacción y cancela su `Future` si aún no se había completado."""
+        with self._cerrojo:
+            futuro = self._pendientes.pop(self._normalizar(txn_hash), None)
+            self._por_verificar.discard(self._normalizar(txn_hash))
+        if futuro is not None:
+            futuro.cancel()
+
+    def pendientes(self):
+        """Retorna el número de transacciones registradas cuyo recibo aún no se ha obtenido."""
+        with self._cerrojo:
+            return len(self._pendientes)
+
+    def _iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._ejecutar, name='NotificadorRecibos', daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        """Detiene el hilo de seguimiento. Las transacciones registradas se conservan."""
+        self._detener.set()
+        self._hay_pendientes.set()
+        if self._hilo is not None:
+            self._hilo.join()
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            self._hay_pendientes.wait()
+            if self._detener.is_set():
+                break
+            try:
+                self.comprobar()
+            except Exception as e:
+                logging.error(f"Error al comprobar los recibos pendientes: {e}")
+            with self._cerrojo:
+                if not self._pendientes:
+                    self._hay_pendientes.clear()
+                    # Sin pendientes no se siguen los bloques: al registrar otra transacción se empieza
+                    # desde la cabeza (la consulta directa de `registrar` cubre los bloques anteriores)
+                    self._ultimo_bloque = None
+            self._detener.wait(self.intervalo)
+
+    def comprobar(self):
+        """
+            Procesa los bloques nuevos desde la última comprobación y completa los `Future` de las
+            transacciones registradas que se han minado en ellos. Lo llama el hilo de seguimiento,
+            pero también puede llamarse directamente.
+        """
+        manager = self.blockchain_manager
+        # La cabeza se lee antes de consultar los recibos directamente: una transacción minada entre
+        # ambas consultas queda en un bloque posterior a `bloque`, que se recorre a continuación
+        bloque = manager.web3.eth.block_number
+        with self._cerrojo:
+            por_verificar = list(self._por_verificar)
+        recibos = {}
+        if por_verificar:
+            respuestas = manager.rpc_batch([('eth_getTransactionReceipt', [clave]) for clave in por_verificar])
+            recibos.update((clave, recibo) for clave, recibo in zip(por_verificar, respuestas) if recibo)
+            # Solo se dan por verificadas cuando el lote ha tenido éxito; si falla, se reintentan
+            with self._cerrojo:
+                self._por_verificar.difference_update(por_verificar)
+
+        with self._cerrojo:
+            if self._ultimo_bloque is None:
+                self._ultimo_bloque = bloque
+            ultimo_bloque = self._ultimo_bloque
+        # Los bloques se piden en lotes de TAMANO_LOTE_RPC y se avanza tras cada lote, de modo que un
+        # hueco grande no se reenvía entero en cada iteración si falla
+        while ultimo_bloque < bloque:
+            hasta = min(ultimo_bloque + manager.TAMANO_LOTE_RPC, bloque)
+            bloques = manager.rpc_batch([
+                ('eth_getBlockByNumber', [hex(numero), False])
+                for numero in range(ultimo_bloque + 1, hasta + 1)
+            ])
+            # Un nodo que aún no tiene el bloque lo devuelve vacío: se procesa hasta el anterior y el
+            # resto se vuelve a pedir en la siguiente comprobación
+            incompleto = None in bloques
+            if incompleto:
+                bloques = bloques[:bloques.index(None)]
+                hasta = ultimo_bloque + len(bloques)
+            with self._cerrojo:
+                minadas = [
+                    clave
+                    for datos_bloque in bloques
+                    for clave in map(self._normalizar, datos_bloque.get('transactions', []))
+                    if clave in self._pendientes and clave not in recibos
+                ]
+            if minadas:
+                respuestas = manager.rpc_batch([('eth_getTransactionReceipt', [clave]) for clave in minadas])
+                recibos.update((clave, recibo) for clave, recibo in zip(minadas, respuestas) if recibo)
+                # Los recibos que el nodo aún no tiene se piden de nuevo en la siguiente comprobación
+                with self._cerrojo:
+                    self._por_verificar.update(clave for clave, recibo in zip(minadas, respuestas) if not recibo)
+            ultimo_bloque = hasta
+            with self._cerrojo:
+                # Otra llamada simultánea puede haber avanzado ya más; el cursor nunca retrocede
+                if self._ultimo_bloque is None or self._ultimo_bloque < hasta:
+                    self._ultimo_bloque = hasta
+            if incompleto:
+                break
+
+        for clave, recibo in recibos.items():
+            with self._cerrojo:
+                futuro = self._pendientes.pop(clave, None)
+                if futuro is None:
+                    continue
+                self._resueltos[clave] = futuro
+                while len(self._resueltos) > self.max_resueltos:
+                    self._resueltos.popitem(last=False)
+            if not futuro.done():
+                futuro.set_result(AttributeDict.recursive(receipt_formatter(recibo)))
@@ -0,0 +1,69 @@
+import logging
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+
+class SenalesOperacion(QObject):
+    """
+        Señales de una `OperacionEnSegundoPlano`. Se emiten desde el hilo de trabajo y Qt las entrega
+        en el hilo de la interfaz, donde es seguro actualizar los widgets.
+
+        - progreso(idOperacion, fase, txnHash): una transacción de la operación cambió de fase
+        ('firmada', 'enviada', 'reemplazada' o 'minada').
+        - terminada(idOperacion, resultado): la operación terminó correctamente.
+        - fallida(idOperacion, mensaje, cancelada): la operación terminó con un error o se canceló.
+    """
+    progreso = pyqtSignal(int, str, str)
+    terminada = pyqtSignal(int, object)
+    fallida = pyqtSignal(int, str, bool)
+
+
+class OperacionEnSegundoPlano(QRunnable):
+    """
+        Ejecuta una operación de `BlockchainManager` en un hilo de `QThreadPool` para que la ventana
+        siga respondiendo mientras se firma, se difunde y se espera el recibo de la transacción.
+
+        El progreso de las transacciones se obtiene con `BlockchainManager.seguimiento`, y `cancelar`
+        interrumpe la espera del recibo (la transacción ya difundida puede minarse igualmente).
+        Con `blockchainManager` a None se ejecuta una tarea sin seguimiento de transacciones, como la
+        conexión inicial con el nodo.
+
+        Atributos:
+        - idOperacion (int): Identificador de la operación en la ventana.
+        - senales (SenalesOperacion): Señales con el progreso y el resultado.
+    """
+
+    def __init__(self, idOperacion, blockchainManager, funcion):
+        super().__init__()
+        # La ventana conserva la referencia hasta que la operación termina
+        self.setAutoDelete(False)
+        self.idOperacion = idOperacion
+        self.senales = SenalesOperacion()
+        self._blockchainManager = blockchainManager
+        self._funcion = funcion
+        self._cancelacion = threading.Event()
+
+    def cancelar(self):
+        self._cancelacion.set()
+
+    def cancelada(self):
+        return self._cancelacion.is_set()
+
+    def _notificarProgreso(self, fase, txnHash):
+        self.senales.progreso.emit(self.idOperacion, fase, txnHash.hex() if txnHash is not None else '')
+
+    def run(self):
+        try:
+            if self._cancelacion.is_set():
+                raise RuntimeError("Operación cancelada antes de empezar.")
+            if self._blockchainManager is None:
+                resultado = self._funcion()
+            else:
+                with self._blockchainManager.seguimiento(self._notificarProgreso, self._cancelacion):
+                    resultado = self._funcion()
+        except Exception as e:
+            logging.error(f"Error en la operación {self.idOperacion}: {e}")
+            self.senales.fallida.emit(self.idOperacion, str(e), self._cancelacion.is_set())
+        else:
+            self.senales.terminada.emit(self.idOperacion, resultado)
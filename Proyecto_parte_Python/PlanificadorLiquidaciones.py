@@ -0,0 +1,375 @@
+import heapq
+import logging
+import threading
+import time
+import requests
+from IndexadorPrestamos import ESTADO_APROBADO
+
+# Número máximo de préstamos liquidados o abandonados que se recuerdan para no volver a programarlos
+MAX_DESCARTADOS = 100000
+
+
+class PlanificadorLiquidaciones:
+    """
+        Liquida las garantías de los préstamos aprobados en cuanto vence su plazo, sin recorrer
+        periódicamente todos los préstamos.
+
+        Los préstamos aprobados se guardan en un montículo (heapq) ordenado por el momento en que se
+        pueden liquidar (`tiempoLimite + margen`, o el del siguiente reintento), de modo que programar
+        un préstamo cuesta O(log n) y el siguiente vencimiento se conoce en O(1). El hilo
+        de `ejecutar` duerme hasta ese vencimiento (o hasta que se programa uno anterior), extrae todos
+        los préstamos vencidos y envía sus `liquidarGarantia` juntos con `BlockchainManager.submit_many`.
+
+        Los préstamos se obtienen del contrato (`cargar_desde_cadena`) o de un `IndexadorPrestamos`, cuyos
+        cambios de estado se aplican de forma incremental en cada sincronización: las aprobaciones se
+        programan y los reembolsos y liquidaciones se cancelan. Las cancelaciones son perezosas: la entrada
+        se ignora al salir del montículo, que se reconstruye si acumula demasiadas entradas obsoletas.
+
+        Antes de enviar un lote se comprueba en el contrato, con una sola petición por lotes, que cada
+        préstamo sigue aprobado, de modo que no se envían transacciones que revertirían por un reembolso
+        aún no indexado o una reorganización de la cadena.
+
+        Atributos:
+        - blockchain_manager (BlockchainManager): Gestor con el que se leen y liquidan los préstamos.
+        - direccion_prestamista (str): Cuenta con el rol de prestamista que firma las liquidaciones.
+        - indexador (IndexadorPrestamos, opcional): Fuente de los préstamos aprobados y sus cambios de estado.
+        - tamano_lote (int): Número máximo de liquidaciones que se envían juntas.
+        - margen (int): Segundos que se espera tras `tiempoLimite`, ya que el contrato exige
+        `block.timestamp > tiempoLimite`.
+        - reintento (float): Segundos tras los que se reintenta una liquidación fallida.
+        - max_reintentos (int): Número de reintentos antes de abandonar una liquidación. Los errores de
+        conexión con el nodo no cuentan como intentos: se reintentan con una espera que se duplica en
+        cada fallo seguido, hasta `reintento_maximo` segundos.
+        - reintento_maximo (float): Espera máxima entre dos reintentos tras errores de conexión.
+        - al_liquidar (callable, opcional): Se llama con (prestatario, prestamo_id, resultado) por cada
+        liquidación enviada; `resultado` es el recibo formateado o la excepción producida.
+
+        Métodos:
+        - programar(self, prestatario, prestamo_id, tiempo_limite): Añade o actualiza un préstamo.
+        - cancelar(self, prestatario, prestamo_id): Deja de seguir un préstamo.
+        - cargar_desde_indexador(self): Programa los préstamos aprobados del indexador.
+        - cargar_desde_cadena(self, direcciones): Programa los préstamos aprobados leyendo el contrato.
+        - liquidar_vencidos(self, ahora): Envía las liquidaciones de los préstamos vencidos.
+        - ejecutar(self, detener, intervalo_sincronizacion): Liquida los préstamos a medida que vencen.
+    """
+
+    def __init__(self, blockchain_manager, direccion_prestamista, clave_privada, indexador=None, tamano_lote=50, margen=1, reintento=30, max_reintentos=3, al_liquidar=None, reintento_maximo=300):
+        self.blockchain_manager = blockchain_manager
+        self.direccion_prestamista = direccion_prestamista
+        self.clave_privada = clave_privada
+        self.indexador = indexador
+        self.tamano_lote = tamano_lote
+        self.margen = margen
+        self.reintento = reintento
+        self.max_reintentos = max_reintentos
+        self.reintento_maximo = reintento_maximo
+        self.al_liquidar = al_liquidar
+        # Entradas (momento, prestatario, prestamo_id), con el momento en que se intentará la liquidación
+        self._monticulo = []
+        # Préstamo (prestatario, id) -> (momento, tiempo límite) vigentes; las entradas del montículo con otro momento están obsoletas
+        self._programados = {}
+        self._reintentos = {}
+        # Préstamos que se están liquidando, y préstamos ya liquidados, no liquidables o abandonados tras
+        # `max_reintentos` -> último bloque sincronizado al descartarlos. `programar` ignora ambos aunque
+        # vuelvan a aparecer en los cambios del indexador, salvo una aprobación de un bloque posterior
+        self._en_curso = set()
+        self._descartados = {}
+        # Errores de conexión seguidos al comprobar los préstamos vencidos, para espaciar los reintentos
+        self._fallos_red = 0
+        self._ultimo_bloque = None
+        self._cerrojo = threading.Lock()
+        self._despertar = threading.Event()
+        blockchain_manager.metricas.indicador('liquidaciones_programadas', self.pendientes)
+
+    def pendientes(self):
+        """Retorna el número de préstamos programados."""
+        return len(self._programados)
+
+    def proximo_vencimiento(self):
+        """Retorna el momento (marca de tiempo Unix) de la próxima liquidación programada, o None si no hay ninguna."""
+        with self._cerrojo:
+            self._descartar_obsoletos()
+            return self._monticulo[0][0] if self._monticulo else None
+
+    def _descartar_obsoletos(self):
+        while self._monticulo:
+            momento, prestatario, prestamo_id = self._monticulo[0]
+            programado = self._programados.get((prestatario, prestamo_id))
+            if programado is not None and programado[0] == momento:
+                return
+            heapq.heappop(self._monticulo)
+
+    def programar(self, prestatario, prestamo_id, tiempo_limite, bloque=None):
+        """
+            Programa la liquidación de un préstamo aprobado para cuando venza `tiempo_limite` (marca de
+            tiempo Unix). Si el préstamo ya estaba programado con otro tiempo límite, se actualiza.
+
+            Si ya estaba programado con el mismo tiempo límite se conserva su momento (que puede ser el
+            de un reintento), y se ignoran los préstamos que se están liquidando, los ya liquidados y los
+            abandonados, de modo que volver a aplicar los mismos cambios de estado no adelanta reintentos
+            ni repite liquidaciones.
+
+            Parámetros:
+            - bloque (int, opcional): Bloque de la aprobación. Si es posterior al momento en que se
+            descartó el préstamo (por ejemplo, porque una reorganización deshizo la liquidación y la
+            aprobación se volvió a minar), el préstamo se programa de nuevo.
+        """
+        clave = (prestatario, prestamo_id)
+        with self._cerrojo:
+            if clave in self._en_curso:
+                return
+            if clave in self._descartados:
+                descartado_en = self._descartados[clave]
+                if bloque is None or descartado_en is None or bloque <= descartado_en:
+                    return
+                del self._descartados[clave]
+            programado = self._programados.get(clave)
+            if programado is not None and programado[1] == tiempo_limite:
+                return
+            momento = tiempo_limite + self.margen
+            # Un préstamo pendiente de reintento no se adelanta
+            if programado is not None and clave in self._reintentos:
+                momento = max(momento, programado[0])
+        self._insertar(clave, momento, tiempo_limite)
+
+    def _insertar(self, clave, momento, tiempo_limite):
+        prestatario, prestamo_id = clave
+        with self._cerrojo:
+            anterior = self._monticulo[0][0] if self._monticulo else None
+            self._programados[clave] = (momento, tiempo_limite)
+            heapq.heappush(self._monticulo, (momento, prestatario, prestamo_id))
+        # Si vence antes que el que se estaba esperando, el hilo de `ejecutar` debe despertarse antes
+        if anterior is None or momento < anterior:
+            self._despertar.set()
+
+    def _descartar(self, clave):
+        with self._cerrojo:
+            self._descartados.pop(clave, None)
+            self._descartados[clave] = self._ultimo_bloque
+            while len(self._descartados) > MAX_DESCARTADOS:
+                del self._descartados[next(iter(self._descartados))]
+
+    def _revisar_descartados(self, desde):
+        """
+            Olvida los préstamos descartados antes del bloque `desde`, cuyos cambios ya no se vuelven a
+            aplicar, y programa de nuevo los que el indexador sigue dando por aprobados: liquidaciones que
+            una reorganización ha deshecho o préstamos abandonados, que se vuelven a intentar.
+        """
+        with self._cerrojo:
+            antiguos = {
+                clave for clave, descartado_en in self._descartados.items()
+                if descartado_en is not None and descartado_en < desde
+            }
+            for clave in antiguos:
+                del self._descartados[clave]
+        for prestatario in {prestatario for prestatario, _ in antiguos}:
+            for prestamo in self.indexador.prestamos_de(prestatario):
+                if (prestatario, prestamo.id) in antiguos and prestamo.estado == ESTADO_APROBADO:
+                    logging.info(f"Se vuelve a programar la liquidación del préstamo {prestamo.id} de {prestatario}.")
+                    self.programar(prestatario, prestamo.id, prestamo.tiempo_limite)
+
+    def cancelar(self, prestatario, prestamo_id):
+        """Deja de seguir un préstamo (por ejemplo, porque se ha reembolsado)."""
+        with self._cerrojo:
+            self._programados.pop((prestatario, prestamo_id), None)
+            self._reintentos.pop((prestatario, prestamo_id), None)
+            # Se reconstruye el montículo cuando la mayoría de sus entradas están obsoletas
+            if len(self._monticulo) > 2 * len(self._programados) + 64:
+                self._monticulo = [
+                    (momento, prestatario, prestamo_id)
+                    for (prestatario, prestamo_id), (momento, _) in self._programados.items()
+                ]
+                heapq.heapify(self._monticulo)
+
+    def cargar_desde_indexador(self):
+        """
+            Programa todos los préstamos aprobados del indexador y anota el último bloque procesado, a
+            partir del cual `sincronizar` aplica los cambios de estado.
+
+            Retorna:
+            El número de préstamos programados.
+        """
+        self._ultimo_bloque = self.indexador.ultimo_bloque_procesado()
+        prestamos = self.indexador.prestamos_por_estado(ESTADO_APROBADO)
+        for prestamo in prestamos:
+            self.programar(prestamo.prestatario, prestamo.id, prestamo.tiempo_limite)
+        return len(prestamos)
+
+    def cargar_desde_cadena(self, direcciones, tamano_lote=None):
+        """
+            Programa los préstamos aprobados de los prestatarios indicados, leídos del contrato en lotes
+            JSON-RPC con `BlockchainManager.leer_prestatarios`.
+
+            Retorna:
+            El número de préstamos programados.
+        """
+        registros = self.blockchain_manager.leer_prestatarios(direcciones, True, tamano_lote)
+        programados = 0
+        for registro in registros.values():
+            for prestamo in registro.prestamos:
+                if prestamo.estado == ESTADO_APROBADO:
+                    self.programar(prestamo.prestatario, prestamo.id, prestamo.tiempo_limite)
+                    programados += 1
+        return programados
+
+    def sincronizar(self):
+        """
+            Sincroniza el indexador y aplica los cambios de estado nuevos: programa los préstamos aprobados
+            y cancela los que han dejado de estarlo. Los cambios de los últimos `profundidad_reorg` bloques
+            se vuelven a aplicar en cada llamada (es idempotente), para recoger los que el indexador haya
+            rehecho tras una reorganización. La primera vez se cargan todos los préstamos aprobados (ver
+            `cargar_desde_indexador`).
+
+            Retorna:
+            El número de cambios de estado (o de préstamos, la primera vez) aplicados.
+        """
+        self.indexador.sincronizar()
+        if self._ultimo_bloque is None:
+            return self.cargar_desde_indexador()
+        ultimo_bloque = self.indexador.ultimo_bloque_procesado()
+        desde = self._ultimo_bloque + 1 - self.indexador.profundidad_reorg
+        cambios = self.indexador.cambios_desde(desde)
+        for prestatario, prestamo_id, estado, tiempo_limite, bloque in cambios:
+            if estado == ESTADO_APROBADO:
+                self.programar(prestatario, prestamo_id, tiempo_limite, bloque)
+            else:
+                self.cancelar(prestatario, prestamo_id)
+        self._ultimo_bloque = ultimo_bloque
+        self._revisar_descartados(ultimo_bloque + 1 - self.indexador.profundidad_reorg)
+        return len(cambios)
+
+    def extraer_vencidos(self, ahora=None):
+        """
+            Saca del montículo como mucho `tamano_lote` préstamos cuyo momento de liquidación ya ha llegado.
+
+            Retorna:
+            Una lista de tuplas (prestatario, prestamo_id, tiempo_limite), de la más antigua a la más reciente.
+        """
+        ahora = time.time() if ahora is None else ahora
+        vencidos = []
+        with self._cerrojo:
+            while len(vencidos) < self.tamano_lote:
+                self._descartar_obsoletos()
+                if not self._monticulo or self._monticulo[0][0] > ahora:
+                    break
+                _, prestatario, prestamo_id = heapq.heappop(self._monticulo)
+                _, tiempo_limite = self._programados.pop((prestatario, prestamo_id))
+                self._en_curso.add((prestatario, prestamo_id))
+                vencidos.append((prestatario, prestamo_id, tiempo_limite))
+        return vencidos
+
+    def liquidar_vencidos(self, ahora=None):
+        """
+            Envía en un único lote las liquidaciones de los préstamos vencidos que siguen aprobados en el
+            contrato. Las que fallan se vuelven a programar `reintento` segundos más tarde, hasta
+            `max_reintentos` veces.
+
+            Retorna:
+            Una lista de tuplas (prestatario, prestamo_id, resultado) con las liquidaciones enviadas.
+        """
+        vencidos = self.extraer_vencidos(ahora)
+        if not vencidos:
+            return []
+        try:
+            return self._liquidar(vencidos)
+        finally:
+            with self._cerrojo:
+                self._en_curso.difference_update((prestatario, prestamo_id) for prestatario, prestamo_id, _ in vencidos)
+
+    def _liquidar(self, vencidos):
+        bm = self.blockchain_manager
+        try:
+            detalles = bm.batch_call([('obtenerDetalleDePrestamo', (prestatario, prestamo_id)) for prestatario, prestamo_id, _ in vencidos])
+        except Exception as e:
+            logging.error(f"Error al comprobar los préstamos vencidos: {e}")
+            if self._es_error_de_red(e):
+                self._fallos_red += 1
+            for prestatario, prestamo_id, tiempo_limite in vencidos:
+                self._reprogramar(prestatario, prestamo_id, tiempo_limite, e)
+            return []
+        self._fallos_red = 0
+
+        liquidables = []
+        for (prestatario, prestamo_id, tiempo_limite), detalle in zip(vencidos, detalles):
+            tiempo_limite_contrato, estado = detalle[5], detalle[6]
+            if estado != ESTADO_APROBADO:
+                self._reintentos.pop((prestatario, prestamo_id), None)
+                self._descartar((prestatario, prestamo_id))
+            elif tiempo_limite_contrato != tiempo_limite:
+                self._insertar((prestatario, prestamo_id), tiempo_limite_contrato + self.margen, tiempo_limite_contrato)
+            else:
+                liquidables.append((prestatario, prestamo_id, tiempo_limite))
+        if not liquidables:
+            return []
+
+        resultados = bm.submit_many([
+            {
+                'function_call': bm.contract.functions.liquidarGarantia(prestatario, prestamo_id),
+                'account_address': self.direccion_prestamista,
+                'private_key': self.clave_privada,
+            }
+            for prestatario, prestamo_id, _ in liquidables
+        ])
+
+        enviadas = []
+        for (prestatario, prestamo_id, tiempo_limite), resultado in zip(liquidables, resultados):
+            if isinstance(resultado, Exception):
+                self._reprogramar(prestatario, prestamo_id, tiempo_limite, resultado)
+            else:
+                self._reintentos.pop((prestatario, prestamo_id), None)
+                self._descartar((prestatario, prestamo_id))
+                logging.info(f"Garantía del préstamo {prestamo_id} de {prestatario} liquidada.")
+            if self.al_liquidar is not None:
+                self.al_liquidar(prestatario, prestamo_id, resultado)
+            enviadas.append((prestatario, prestamo_id, resultado))
+        return enviadas
+
+    @staticmethod
+    def _es_error_de_red(error):
+        return isinstance(error, (ConnectionError, TimeoutError, requests.RequestException))
+
+    def _reprogramar(self, prestatario, prestamo_id, tiempo_limite, error):
+        clave = (prestatario, prestamo_id)
+        if self._es_error_de_red(error):
+            # Con el nodo caído no se gasta un intento: se espera más tras cada fallo seguido
+            espera = min(self.reintento * 2 ** max(self._fallos_red - 1, 0), self.reintento_maximo)
+            self._insertar(clave, time.time() + espera, tiempo_limite)
+            return
+        intentos = self._reintentos.get(clave, 0) + 1
+        if intentos > self.max_reintentos:
+            logging.error(f"Se abandona la liquidación del préstamo {prestamo_id} de {prestatario} tras {self.max_reintentos} reintentos: {error}")
+            self._reintentos.pop(clave, None)
+            self._descartar(clave)
+            return
+        self._reintentos[clave] = intentos
+        self._insertar(clave, time.time() + self.reintento, tiempo_limite)
+
+    def ejecutar(self, detener=None, intervalo_sincronizacion=2):
+        """
+            Liquida los préstamos a medida que vencen hasta que se active el evento `detener`
+            (threading.Event). El hilo duerme hasta el próximo vencimiento o, si hay indexador, como
+            mucho `intervalo_sincronizacion` segundos, tras los que aplica los cambios de estado nuevos.
+            Los errores se registran y se reintenta en la siguiente iteración.
+        """
+        detener = detener or threading.Event()
+        siguiente_sincronizacion = 0
+        while not detener.is_set():
+            if self.indexador is not None and time.monotonic() >= siguiente_sincronizacion:
+                siguiente_sincronizacion = time.monotonic() + intervalo_sincronizacion
+                try:
+                    self.sincronizar()
+                except Exception as e:
+                    logging.error(f"Error al sincronizar el planificador de liquidaciones: {e}")
+
+            try:
+                if self.liquidar_vencidos():
+                    continue
+            except Exception as e:
+                logging.error(f"Error al liquidar los préstamos vencidos: {e}")
+
+            espera = intervalo_sincronizacion
+            proximo = self.proximo_vencimiento()
+            if proximo is not None:
+                espera = min(espera, max(0, proximo - time.time()))
+            self._despertar.wait(espera)
+            self._despertar.clear()
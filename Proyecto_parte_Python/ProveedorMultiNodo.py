@@ -0,0 +1,269 @@
+import json
+import logging
+import threading
+import time
+
+import requests
+from eth_utils import keccak, to_hex
+from hexbytes import HexBytes
+from requests.adapters import HTTPAdapter
+from web3.providers.base import JSONBaseProvider
+
+# Métodos que dependen del estado pendiente (mempool) del nodo. Se envían siempre al nodo de escritura
+# para que los nonces y las transacciones difundidas sean coherentes entre sí.
+METODOS_ESCRITURA = frozenset({
+    'eth_sendRawTransaction',
+    'eth_sendTransaction',
+    'eth_getTransactionCount',
+})
+
+# Métodos que no se pueden repetir sin más en otro nodo: solo se reenvían si la petición no llegó a
+# salir (error al conectar), porque un nodo que no responde a tiempo puede haberla difundido ya
+METODOS_NO_REPETIBLES = frozenset({
+    'eth_sendRawTransaction',
+    'eth_sendTransaction',
+})
+
+
+def _numero(valor):
+    """Convierte un número de una respuesta JSON-RPC (cadena hexadecimal o entero) a int."""
+    return int(valor, 16) if isinstance(valor, str) else int(valor)
+
+
+def crear_sesion(tamano_pool=32):
+    """
+        Crea una sesión HTTP con conexiones persistentes (keep-alive) y un pool del tamaño indicado, de
+        modo que varios hilos puedan hacer peticiones al mismo nodo sin abrir una conexión nueva cada vez.
+        Los reintentos los gestiona quien usa la sesión, así que el adaptador no reintenta.
+    """
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=tamano_pool, max_retries=0)
+    sesion.mount('http://', adaptador)
+    sesion.mount('https://', adaptador)
+    return sesion
+
+
+class NodoRPC:
+    """
+        Estado de un nodo JSON-RPC dentro de `ProveedorMultiNodo`: su sesión HTTP, la latencia observada
+        (media móvil exponencial) y el estado de su cortocircuito.
+
+        El cortocircuito se abre tras `fallos_maximos` fallos seguidos; mientras está abierto el nodo
+        no recibe peticiones. Pasado el tiempo de reapertura se le permite una petición de prueba: si
+        responde, vuelve a usarse con normalidad; si falla, se abre de nuevo.
+    """
+
+    def __init__(self, url, tamano_pool):
+        self.url = url
+        self.sesion = crear_sesion(tamano_pool)
+        self.latencia = None
+        self.fallos = 0
+        self.abierto_hasta = None
+        self.en_prueba = False
+        # Último bloque que ha devuelto el nodo en `eth_blockNumber` y cuándo (time.monotonic())
+        self.bloque = None
+        self.bloque_en = None
+
+    def __repr__(self):
+        return f"NodoRPC({self.url}, latencia={self.latencia}, fallos={self.fallos})"
+
+
+class ProveedorMultiNodo(JSONBaseProvider):
+    """
+        Proveedor de Web3 que reparte las peticiones entre varios nodos JSON-RPC por HTTP.
+
+        - Las lecturas se envían al nodo disponible con menor latencia observada y, si fallan por un
+        problema de conexión, se reintentan en el siguiente. No se leen de un nodo cuyo último bloque
+        conocido (`eth_blockNumber`) es anterior al más alto visto en otro nodo, para no pedir un bloque
+        o un recibo que ese nodo todavía no tiene; pasados `vigencia_bloque` segundos se vuelve a probar.
+        - Las escrituras y las consultas de nonce (`METODOS_ESCRITURA`) se envían siempre al mismo nodo,
+        que solo cambia si este deja de estar disponible. Las transacciones solo se reenvían a otro nodo
+        si no se pudo conectar con el primero; si se reenvían y el nodo ya las conoce ('already known'),
+        se da por buena la difusión y se retorna su hash.
+        - Cada petición tiene un plazo máximo (`timeout`). Los nodos que fallan de forma repetida se
+        apartan durante `tiempo_reapertura` segundos y después se vuelven a probar.
+
+        Los errores JSON-RPC (por ejemplo, una transacción revertida) son respuestas válidas del nodo y
+        no cuentan como fallos.
+
+        Atributos:
+        - nodos (list): Los `NodoRPC`, en el orden de preferencia para las escrituras.
+        - timeout (float): Segundos máximos de cada petición.
+        - fallos_maximos (int): Fallos seguidos tras los que se abre el cortocircuito de un nodo.
+        - tiempo_reapertura (float): Segundos que un nodo permanece apartado antes de volver a probarlo.
+        - suavizado (float): Peso de la última medida en la media móvil de la latencia.
+        - vigencia_bloque (float): Segundos durante los que un nodo retrasado no recibe lecturas.
+    """
+
+    def __init__(self, urls, timeout=10, fallos_maximos=3, tiempo_reapertura=30.0, tamano_pool=32, suavizado=0.2, vigencia_bloque=15.0):
+        super().__init__()
+        if not urls:
+            raise ValueError("Se necesita al menos una URL de nodo.")
+        self.nodos = [NodoRPC(url, tamano_pool) for url in urls]
+        self.timeout = timeout
+        self.fallos_maximos = fallos_maximos
+        self.tiempo_reapertura = tiempo_reapertura
+        self.suavizado = suavizado
+        self.vigencia_bloque = vigencia_bloque
+        self._bloque_maximo = None
+        self._nodo_escritura = self.nodos[0]
+        self._cerrojo = threading.Lock()
+
+    def __str__(self):
+        return f"ProveedorMultiNodo({', '.join(nodo.url for nodo in self.nodos)})"
+
+    @property
+    def endpoint_uri(self):
+        """URL del nodo de escritura actual."""
+        return self._nodo_escritura.url
+
+    def _disponible(self, nodo, ahora):
+        if nodo.abierto_hasta is None:
+            return True
+        # Cortocircuito abierto: tras el tiempo de reapertura se permite una única petición de prueba
+        if ahora >= nodo.abierto_hasta and not nodo.en_prueba:
+            return True
+        return False
+
+    def _retrasado(self, nodo, ahora):
+        return (
+            nodo.bloque is not None and nodo.bloque < self._bloque_maximo
+            and ahora - nodo.bloque_en < self.vigencia_bloque
+        )
+
+    def _candidatos(self, escritura):
+        """Retorna los nodos a los que enviar una petición, en orden de preferencia."""
+        ahora = time.monotonic()
+        with self._cerrojo:
+            disponibles = [nodo for nodo in self.nodos if self._disponible(nodo, ahora)]
+            if escritura:
+                if self._nodo_escritura in disponibles:
+                    disponibles.remove(self._nodo_escritura)
+                    disponibles.insert(0, self._nodo_escritura)
+            else:
+                # Los nodos retrasados solo se usan si no queda otro
+                al_dia = [nodo for nodo in disponibles if not self._retrasado(nodo, ahora)]
+                disponibles = al_dia or disponibles
+                # Los nodos sin medidas se prueban primero para conocer su latencia
+                disponibles.sort(key=lambda nodo: -1 if nodo.latencia is None else nodo.latencia)
+            if not disponibles:
+                # Todos apartados: se intenta con el que antes vaya a reabrirse en lugar de fallar sin probar
+                disponibles = [min(self.nodos, key=lambda nodo: nodo.abierto_hasta)]
+            return disponibles
+
+    def _reservar(self, nodo, forzar):
+        """Comprueba justo antes de usarlo que el nodo sigue disponible y, si está en reapertura, reserva su petición de prueba."""
+        with self._cerrojo:
+            if nodo.abierto_hasta is None:
+                return True
+            if forzar or (time.monotonic() >= nodo.abierto_hasta and not nodo.en_prueba):
+                nodo.en_prueba = True
+                return True
+            return False
+
+    def _registrar_exito(self, nodo, latencia, escritura):
+        with self._cerrojo:
+            nodo.latencia = latencia if nodo.latencia is None else (1 - self.suavizado) * nodo.latencia + self.suavizado * latencia
+            nodo.fallos = 0
+            nodo.abierto_hasta = None
+            nodo.en_prueba = False
+            if escritura and self._nodo_escritura is not nodo:
+                logging.info(f"Las escrituras pasan al nodo {nodo.url}.")
+                self._nodo_escritura = nodo
+
+    def _registrar_fallo(self, nodo, error):
+        with self._cerrojo:
+            nodo.fallos += 1
+            if nodo.en_prueba or nodo.fallos >= self.fallos_maximos:
+                nodo.abierto_hasta = time.monotonic() + self.tiempo_reapertura
+                logging.error(f"Nodo {nodo.url} apartado durante {self.tiempo_reapertura} s: {error}")
+            nodo.en_prueba = False
+
+    def _registrar_bloque(self, nodo, bloque):
+        with self._cerrojo:
+            nodo.bloque = bloque
+            nodo.bloque_en = time.monotonic()
+            if self._bloque_maximo is None or bloque > self._bloque_maximo:
+                self._bloque_maximo = bloque
+
+    def _enviar(self, datos, escritura, repetible=True):
+        """
+            Envía la petición al primer candidato que responda.
+
+            Retorna:
+            Una tupla (nodo, contenido de la respuesta, reenviada), donde `reenviada` indica si antes se
+            intentó con otro nodo.
+        """
+        ultimo_error = None
+        reenviada = False
+        candidatos = self._candidatos(escritura)
+        for nodo in candidatos:
+            if not self._reservar(nodo, forzar=len(candidatos) == 1):
+                continue
+            inicio = time.monotonic()
+            try:
+                respuesta = nodo.sesion.post(
+                    nodo.url,
+                    data=datos,
+                    headers={'Content-Type': 'application/json'},
+                    timeout=self.timeout,
+                )
+                respuesta.raise_for_status()
+                contenido = respuesta.content
+            except requests.RequestException as e:
+                self._registrar_fallo(nodo, e)
+                ultimo_error = e
+                # Sin respuesta del nodo no se sabe si difundió la transacción: no se envía a otro
+                if not repetible and not isinstance(e, requests.ConnectionError):
+                    raise ConnectionError(f"El nodo {nodo.url} no ha confirmado la transacción: {e}") from e
+                reenviada = True
+                continue
+            self._registrar_exito(nodo, time.monotonic() - inicio, escritura)
+            return nodo, contenido, reenviada
+        raise ConnectionError(f"Ningún nodo ha respondido: {ultimo_error}")
+
+    def make_request(self, method, params):
+        datos = self.encode_rpc_request(method, params)
+        nodo, contenido, reenviada = self._enviar(datos, method in METODOS_ESCRITURA, method not in METODOS_NO_REPETIBLES)
+        respuesta = self.decode_rpc_response(contenido)
+        if method == 'eth_blockNumber' and 'result' in respuesta:
+            self._registrar_bloque(nodo, _numero(respuesta['result']))
+        elif method == 'eth_sendRawTransaction' and reenviada and 'already known' in str(respuesta.get('error', '')).lower():
+            # El nodo anterior llegó a difundirla antes de fallar: son los mismos bytes y el mismo hash
+            respuesta = {'jsonrpc': '2.0', 'id': respuesta.get('id'), 'result': to_hex(keccak(HexBytes(params[0])))}
+        return respuesta
+
+    def enviar_lote(self, lote):
+        """
+            Envía una petición JSON-RPC por lotes (lista de peticiones) y retorna la lista de respuestas.
+            El lote se trata como una escritura si contiene algún método de `METODOS_ESCRITURA`.
+        """
+        escritura = any(peticion['method'] in METODOS_ESCRITURA for peticion in lote)
+        repetible = not any(peticion['method'] in METODOS_NO_REPETIBLES for peticion in lote)
+        nodo, contenido, _ = self._enviar(json.dumps(lote), escritura, repetible)
+        respuestas = json.loads(contenido)
+        if isinstance(respuestas, list):
+            metodos = {peticion['id']: peticion['method'] for peticion in lote}
+            bloques = [
+                _numero(respuesta['result']) for respuesta in respuestas
+                if metodos.get(respuesta.get('id')) == 'eth_blockNumber' and 'result' in respuesta
+            ]
+            if bloques:
+                self._registrar_bloque(nodo, max(bloques))
+        return respuestas
+
+    def estado(self):
+        """Retorna una lista con la URL, la latencia media, los fallos seguidos y si está apartado cada nodo."""
+        ahora = time.monotonic()
+        with self._cerrojo:
+            return [
+                {
+                    'url': nodo.url,
+                    'latencia': nodo.latencia,
+                    'fallos': nodo.fallos,
+                    'apartado': nodo.abierto_hasta is not None and ahora < nodo.abierto_hasta,
+                    'escritura': nodo is self._nodo_escritura,
+                    'bloque': nodo.bloque,
+                }
+                for nodo in self.nodos
+            ]
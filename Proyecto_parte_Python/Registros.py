@@ -0,0 +1,28 @@
+from typing import NamedTuple
+
+
+class RegistroPrestamo(NamedTuple):
+    """
+        Préstamo tal y como lo almacena el contrato, con los valores en crudo: montos en wei,
+        tiempos como marcas de tiempo Unix y el estado como código numérico (ver
+        `BlockchainManager.ESTADOS_PRESTAMO`).
+    """
+    id: int
+    prestatario: str
+    monto: int
+    plazo: int
+    tiempo_solicitud: int
+    tiempo_limite: int
+    estado: int
+
+
+class RegistroCliente(NamedTuple):
+    """
+        Estado de un cliente en el contrato: si está activado, su saldo de garantía en wei, los IDs de
+        sus préstamos y, opcionalmente, los préstamos completos como `RegistroPrestamo`.
+    """
+    direccion: str
+    activado: bool
+    saldo_garantia: int
+    prestamo_ids: list
+    prestamos: list
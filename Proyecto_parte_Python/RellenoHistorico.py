@@ -0,0 +1,108 @@
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class RellenoHistorico:
+    """
+        Descarga en paralelo los logs de un rango grande de bloques, dividiéndolo en tramos que se
+        consultan de forma concurrente desde un conjunto acotado de hilos.
+
+        El tamaño de los tramos se adapta sobre la marcha: crece mientras las respuestas son pequeñas y
+        se reduce cuando contienen demasiados resultados o el nodo devuelve un error (por ejemplo, por
+        superar su límite de resultados o por tiempo de espera). Un tramo que falla se divide en dos
+        mitades que se vuelven a solicitar. Aunque los tramos terminen en cualquier orden, los resultados
+        se entregan siempre en orden de bloque.
+
+        Atributos:
+        - obtener_logs (callable): Función (desde, hasta) -> resultado que consulta un tramo de bloques.
+        - medir (callable): Función que devuelve el número de elementos de un resultado (por defecto `len`).
+        - max_hilos (int): Número máximo de consultas simultáneas.
+        - tamano_inicial, tamano_minimo, tamano_maximo (int): Tamaños de tramo, en bloques.
+        - objetivo_resultados (int): Número de resultados por tramo que se intenta alcanzar.
+        - max_reintentos (int): Reintentos de un tramo de un solo bloque antes de abandonar.
+        - max_en_espera (int): Número máximo de tramos terminados que se mantienen en memoria esperando
+        a que termine un tramo anterior.
+    """
+
+    def __init__(self, obtener_logs, medir=len, max_hilos=4, tamano_inicial=2000, tamano_minimo=1,
+                 tamano_maximo=100000, objetivo_resultados=5000, max_reintentos=5, max_en_espera=None):
+        self.obtener_logs = obtener_logs
+        self.medir = medir
+        self.max_hilos = max_hilos
+        self.tamano = tamano_inicial
+        self.tamano_minimo = tamano_minimo
+        self.tamano_maximo = tamano_maximo
+        self.objetivo_resultados = objetivo_resultados
+        self.max_reintentos = max_reintentos
+        self.max_en_espera = max_en_espera or max_hilos * 4
+
+    def _ajustar_tamano(self, resultados):
+        if resultados > self.objetivo_resultados:
+            self.tamano = max(self.tamano // 2, self.tamano_minimo)
+        elif resultados < self.objetivo_resultados // 2:
+            self.tamano = min(self.tamano * 2, self.tamano_maximo)
+
+    def rangos(self, desde, hasta):
+        """
+            Recorre el rango de bloques [desde, hasta] y produce los resultados en orden de bloque.
+
+            Parámetros:
+            - desde (int): Primer bloque.
+            - hasta (int): Último bloque (incluido).
+
+            Retorna:
+            Un generador de tuplas (desde_tramo, hasta_tramo, resultado) consecutivas que cubren todo el rango.
+
+            Excepciones:
+            - Exception: Se lanza el último error si un tramo de un solo bloque falla más de `max_reintentos` veces.
+        """
+        siguiente = desde
+        emitir_desde = desde
+        reintentos = deque()
+        terminados = {}
+        en_curso = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_hilos) as executor:
+            while emitir_desde <= hasta:
+                # Los reintentos se lanzan aunque el búfer esté lleno: pueden ser los que bloquean la entrega
+                while len(en_curso) < self.max_hilos and (reintentos or len(terminados) < self.max_en_espera):
+                    if reintentos:
+                        inicio, fin, intentos = reintentos.popleft()
+                    elif siguiente <= hasta:
+                        inicio, fin, intentos = siguiente, min(siguiente + self.tamano - 1, hasta), 0
+                        siguiente = fin + 1
+                    else:
+                        break
+                    en_curso[executor.submit(self.obtener_logs, inicio, fin)] = (inicio, fin, intentos)
+
+                completados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in completados:
+                    inicio, fin, intentos = en_curso.pop(futuro)
+                    try:
+                        resultado = futuro.result()
+                    except Exception as e:
+                        self.tamano = max(self.tamano // 2, self.tamano_minimo)
+                        if fin > inicio:
+                            mitad = (inicio + fin) // 2
+                            logging.error(f"Error al obtener los logs {inicio}-{fin}, se divide el tramo: {e}")
+                            reintentos.appendleft((mitad + 1, fin, 0))
+                            reintentos.appendleft((inicio, mitad, 0))
+                        elif intentos < self.max_reintentos:
+                            logging.error(f"Error al obtener los logs del bloque {inicio}, reintento {intentos + 1}: {e}")
+                            time.sleep(min(2 ** intentos * 0.1, 5))
+                            reintentos.appendleft((inicio, fin, intentos + 1))
+                        else:
+                            for pendiente in en_curso:
+                                pendiente.cancel()
+                            raise
+                        continue
+
+                    self._ajustar_tamano(self.medir(resultado))
+                    terminados[inicio] = (fin, resultado)
+
+                while emitir_desde in terminados:
+                    fin, resultado = terminados.pop(emitir_desde)
+                    yield emitir_desde, fin, resultado
+                    emitir_desde = fin + 1
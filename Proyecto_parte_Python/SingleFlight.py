@@ -0,0 +1,60 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+        Agrupa las peticiones idénticas que están en curso al mismo tiempo para que solo una de ellas
+        llegue al nodo.
+
+        El primer hilo que solicita una clave ejecuta la consulta; los hilos que solicitan la misma clave
+        mientras tanto esperan y reciben el mismo resultado (o la misma excepción). Una vez terminada la
+        consulta, la clave se libera y la siguiente petición vuelve a consultar al nodo.
+
+        Atributos:
+        - compartidas (int): Número de peticiones que se resolvieron reutilizando una consulta en curso.
+    """
+
+    def __init__(self):
+        self.compartidas = 0
+        self._en_curso = {}
+        self._cerrojo = threading.Lock()
+
+    def ejecutar(self, clave, funcion):
+        """
+            Ejecuta `funcion` para la clave indicada, o espera el resultado de la ejecución en curso
+            si otro hilo ya la está realizando.
+
+            Parámetros:
+            - clave: Identificador hashable de la petición, por ejemplo (funcion, argumentos, bloque).
+            - funcion (callable): Función sin argumentos que realiza la consulta.
+
+            Retorna:
+            El resultado de la consulta.
+
+            Excepciones:
+            - Exception: Se propaga la excepción producida por la consulta a todos los que la esperaban.
+        """
+        with self._cerrojo:
+            llamada = self._en_curso.get(clave)
+            lider = llamada is None
+            if lider:
+                llamada = Future()
+                self._en_curso[clave] = llamada
+            else:
+                self.compartidas += 1
+
+        if not lider:
+            return llamada.result()
+
+        try:
+            resultado = funcion()
+        except BaseException as e:
+            llamada.set_exception(e)
+            raise
+        else:
+            llamada.set_result(resultado)
+            return resultado
+        finally:
+            with self._cerrojo:
+                del self._en_curso[clave]
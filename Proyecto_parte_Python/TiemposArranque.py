@@ -0,0 +1,31 @@
+import json
+import time
+from datetime import datetime
+
+
+class TiemposArranque:
+    """
+        Registra los hitos del arranque de la aplicación (importaciones, ventana visible, conexión
+        lista) en milisegundos desde el inicio, para seguir la evolución del tiempo de arranque.
+
+        Atributos:
+        - inicio (float): Instante de referencia (`time.perf_counter`), normalmente el inicio de main.py.
+        - marcas (dict): Milisegundos transcurridos hasta cada hito, en el orden en que se alcanzaron.
+    """
+
+    def __init__(self, inicio=None):
+        self.inicio = time.perf_counter() if inicio is None else inicio
+        self.marcas = {}
+
+    def marcar(self, hito):
+        """Registra que se ha alcanzado `hito` en este instante. Puede llamarse desde cualquier hilo."""
+        self.marcas[hito] = round((time.perf_counter() - self.inicio) * 1000, 1)
+
+    def informe(self):
+        """Retorna una línea legible con los hitos y sus tiempos."""
+        return ', '.join(f"{hito} {ms:.0f} ms" for hito, ms in self.marcas.items())
+
+    def guardar(self, ruta):
+        """Añade los tiempos de este arranque como una línea JSON al final de `ruta`."""
+        with open(ruta, 'a', encoding='utf-8') as archivo:
+            archivo.write(json.dumps({'fecha': datetime.now().isoformat(timespec='seconds'), **self.marcas}) + '\n')
@@ -0,0 +1,162 @@
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class _TramoNulo:
+    """Tramo que no registra nada, para cuando la traza está desactivada."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        return False
+
+    def anotar(self, **argumentos):
+        pass
+
+
+_TRAMO_NULO = _TramoNulo()
+
+
+class _Tramo:
+    def __init__(self, trazador, nombre, categoria, argumentos):
+        self.trazador = trazador
+        self.nombre = nombre
+        self.categoria = categoria
+        self.argumentos = argumentos
+
+    def anotar(self, **argumentos):
+        """Añade argumentos al tramo (por ejemplo, el hash de la transacción cuando ya se conoce)."""
+        self.argumentos.update(argumentos)
+
+    def __enter__(self):
+        self.inicio = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        fin = time.perf_counter_ns()
+        if tipo is not None:
+            self.argumentos['error'] = f"{tipo.__name__}: {valor}"
+        self.trazador._registrar(self.nombre, self.categoria, self.inicio, fin - self.inicio, self.argumentos)
+        return False
+
+
+class Trazador:
+    """
+        Registra tramos (spans) con el tiempo de cada fase de las operaciones y los exporta en el
+        formato de eventos de traza de Chrome, que se puede abrir en chrome://tracing o en Perfetto.
+
+        Si no se indica `ruta` la traza está desactivada y `tramo` no registra nada. Con `perfilar` se
+        puede ejecutar además cProfile alrededor de las operaciones indicadas (por nombre de función del
+        contrato, por ejemplo 'depositarGarantia'); cada perfil se guarda junto a la traza como
+        `<traza>.<operacion>.<n>.prof` y se abre con `python -m pstats` o snakeviz. Solo se perfila una
+        operación a la vez: si otra ya se está perfilando, la nueva se ejecuta sin perfil.
+
+        Atributos:
+        - ruta (str): Archivo JSON en el que `exportar` escribe la traza.
+        - activo (bool): Si se registran los tramos.
+        - operaciones_perfiladas (frozenset): Operaciones alrededor de las que se ejecuta cProfile.
+        - max_eventos (int): Número máximo de tramos que se conservan; los siguientes se descartan.
+    """
+
+    def __init__(self, ruta=None, perfilar=(), max_eventos=1000000):
+        self.ruta = ruta
+        self.activo = ruta is not None
+        self.operaciones_perfiladas = frozenset(perfilar)
+        self.max_eventos = max_eventos
+        self.descartados = 0
+        self._eventos = []
+        self._hilos = {}
+        self._perfiles = 0
+        self._cerrojo = threading.Lock()
+        self._cerrojo_perfil = threading.Lock()
+        self._pid = os.getpid()
+        self._origen = time.perf_counter_ns()
+
+    def tramo(self, nombre, categoria='blockchain', **argumentos):
+        """
+            Retorna un contexto que registra la duración de su bloque como un tramo.
+
+            Parámetros:
+            - nombre (str): Nombre del tramo, por ejemplo 'firma' o 'transaccion:altaCliente'.
+            - categoria (str): Categoría del tramo en la traza ('transaccion', 'lectura', 'rpc', ...).
+            - argumentos: Datos adicionales que se muestran con el tramo.
+        """
+        if not self.activo:
+            return _TRAMO_NULO
+        return _Tramo(self, nombre, categoria, argumentos)
+
+    def _registrar(self, nombre, categoria, inicio, duracion, argumentos):
+        hilo = threading.current_thread()
+        evento = {
+            'name': nombre,
+            'cat': categoria,
+            'ph': 'X',
+            'ts': (inicio - self._origen) / 1000,
+            'dur': duracion / 1000,
+            'pid': self._pid,
+            'tid': hilo.ident,
+            'args': {clave: str(valor) if not isinstance(valor, (int, float, str, bool)) else valor for clave, valor in argumentos.items()},
+        }
+        with self._cerrojo:
+            if len(self._eventos) >= self.max_eventos:
+                self.descartados += 1
+                return
+            self._eventos.append(evento)
+            self._hilos[hilo.ident] = hilo.name
+
+    @contextmanager
+    def perfilar(self, operacion):
+        """Ejecuta el bloque bajo cProfile si `operacion` está entre las operaciones perfiladas."""
+        if operacion not in self.operaciones_perfiladas or not self._cerrojo_perfil.acquire(blocking=False):
+            yield
+            return
+        try:
+            perfil = cProfile.Profile()
+            perfil.enable()
+            try:
+                yield
+            finally:
+                perfil.disable()
+                self._perfiles += 1
+                ruta = f"{os.path.splitext(self.ruta or 'traza')[0]}.{operacion}.{self._perfiles}.prof"
+                perfil.dump_stats(ruta)
+                logging.info(f"Perfil de {operacion} guardado en {ruta}")
+        finally:
+            self._cerrojo_perfil.release()
+
+    def middleware_rpc(self, make_request, web3):
+        """Middleware de Web3 que registra un tramo por cada petición JSON-RPC."""
+        def middleware(method, params):
+            with self.tramo(method, 'rpc'):
+                return make_request(method, params)
+        return middleware
+
+    def exportar(self, ruta=None):
+        """
+            Escribe los tramos registrados en formato de eventos de traza de Chrome.
+
+            Parámetros:
+            - ruta (str, opcional): Archivo de destino. Por defecto, `ruta`.
+
+            Retorna:
+            El número de tramos exportados.
+        """
+        ruta = ruta or self.ruta
+        with self._cerrojo:
+            eventos = list(self._eventos)
+            hilos = dict(self._hilos)
+        metadatos = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid, 'args': {'name': nombre}}
+            for tid, nombre in hilos.items()
+        ]
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            json.dump({'traceEvents': metadatos + eventos, 'displayTimeUnit': 'ms'}, archivo)
+        if self.descartados:
+            logging.error(f"Se descartaron {self.descartados} tramos al superar el máximo de {self.max_eventos}.")
+        return len(eventos)
@@ -0,0 +1,267 @@
+import argparse
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import web3
+from eth_account import Account
+from web3 import Web3
+
+from CadenaLocal import CadenaLocal, RUTA_ABI, VERSION_SOLC
+from ContractUtils import ether_to_wei, wei_to_ether, is_valid_ethereum_address, format_transaction_receipt, abi_output_types, load_abi
+from main_lotes import percentil
+
+# Recibo de ejemplo para medir `format_transaction_receipt` cuando no se puede desplegar el contrato
+RECIBO_EJEMPLO = {
+    'transactionHash': bytes(32),
+    'blockHash': bytes(32),
+    'blockNumber': 1,
+    'from': '0x0000000000000000000000000000000000000001',
+    'to': '0x0000000000000000000000000000000000000002',
+    'gasUsed': 50000,
+    'status': 1,
+    'cumulativeGasUsed': 50000,
+    'contractAddress': None,
+    'logs': [],
+}
+
+
+def medir(funcion, repeticiones, calentamiento=1, preparar=None):
+    """
+        Mide el tiempo de `funcion(i)` para i = 0 .. repeticiones - 1, tras `calentamiento` ejecuciones
+        que no se cuentan. Si se indica `preparar(i)`, se ejecuta antes de cada medida, fuera del tiempo.
+
+        Retorna:
+        Un diccionario con el número de medidas y el mínimo, la mediana, la media, el p95 y la desviación
+        típica en microsegundos, o con el error si la función falla.
+    """
+    try:
+        for i in range(calentamiento):
+            if preparar:
+                preparar(repeticiones + i)
+            funcion(repeticiones + i)
+        tiempos = []
+        for i in range(repeticiones):
+            if preparar:
+                preparar(i)
+            inicio = time.perf_counter_ns()
+            funcion(i)
+            tiempos.append((time.perf_counter_ns() - inicio) / 1000)
+    except Exception as e:
+        return {'error': str(e)}
+    return resumir_tiempos(tiempos)
+
+
+def resumir_tiempos(tiempos):
+    ordenados = sorted(tiempos)
+    return {
+        'n': len(ordenados),
+        'min_us': round(ordenados[0], 2),
+        'mediana_us': round(statistics.median(ordenados), 2),
+        'media_us': round(statistics.fmean(ordenados), 2),
+        'p95_us': round(percentil(ordenados, 95), 2),
+        'desviacion_us': round(statistics.pstdev(ordenados), 2),
+    }
+
+
+def medir_utilidades(repeticiones, recibo):
+    """Mide las funciones auxiliares de ContractUtils."""
+    direccion = Account.from_key(Web3.keccak(text='benchmark')).address
+    return {
+        'ContractUtils.ether_to_wei': medir(lambda i: ether_to_wei(1.5), repeticiones),
+        'ContractUtils.wei_to_ether': medir(lambda i: wei_to_ether(1500000000000000000), repeticiones),
+        'ContractUtils.is_valid_ethereum_address': medir(lambda i: is_valid_ethereum_address(direccion), repeticiones),
+        'ContractUtils.format_transaction_receipt': medir(lambda i: format_transaction_receipt(recibo), repeticiones),
+        'ContractUtils.abi_output_types': medir(lambda i: abi_output_types(load_abi(RUTA_ABI), 'obtenerDetalleDePrestamo'), repeticiones),
+        'ContractUtils.load_abi': medir(lambda i: load_abi(RUTA_ABI), repeticiones),
+    }
+
+
+def medir_fases_transaccion(cadena, manager, repeticiones):
+    """
+        Reproduce paso a paso `sign_and_send_transaction` (con altaCliente) y mide cada fase por separado:
+        checksum de la dirección, codificación de los datos de la llamada, construcción de la transacción
+        (límite de gas y comisiones), firma, difusión, espera del recibo, procesado del recibo y formateo.
+    """
+    socio = cadena.socio_principal
+    clave = cadena.clave(socio)
+    fases = {nombre: [] for nombre in (
+        'checksum', 'codificar_calldata', 'build_transaction', 'firmar', 'difundir',
+        'esperar_recibo', 'finalizar_transaccion', 'format_transaction_receipt',
+    )}
+    recibo = None
+
+    def fase(nombre, funcion):
+        inicio = time.perf_counter_ns()
+        resultado = funcion()
+        fases[nombre].append((time.perf_counter_ns() - inicio) / 1000)
+        return resultado
+
+    for i in range(repeticiones + 1):
+        nuevo_cliente = Account.from_key(Web3.keccak(text=f"benchmark-fases-{i}")).address
+        direccion = fase('checksum', lambda: manager.web3.to_checksum_address(socio.address.lower()))
+        fase('codificar_calldata', lambda: manager.contract.encodeABI(fn_name='altaCliente', args=[nuevo_cliente]))
+        function_call = manager.contract.functions.altaCliente(nuevo_cliente)
+        transaction, _ = fase('build_transaction', lambda: manager.build_transaction(function_call, direccion))
+        transaction = dict(transaction, nonce=manager.nonce_manager.asignar(direccion))
+        firmada = fase('firmar', lambda: manager.web3.eth.account.sign_transaction(transaction, clave))
+        txn_hash = fase('difundir', lambda: manager.web3.eth.send_raw_transaction(firmada.rawTransaction))
+        recibo = fase('esperar_recibo', lambda: manager.esperar_recibo(transaction, txn_hash, clave))
+        fase('finalizar_transaccion', lambda: manager.finalizar_transaccion(function_call, transaction, recibo))
+        fase('format_transaction_receipt', lambda: format_transaction_receipt(recibo))
+        if i == 0:
+            # La primera iteración siembra el modelo de gas y las cachés: se descarta
+            for tiempos in fases.values():
+                tiempos.clear()
+
+    return {f"sign_and_send_transaction.{nombre}": resumir_tiempos(tiempos) for nombre, tiempos in fases.items()}, recibo
+
+
+def medir_operaciones(cadena, manager, repeticiones):
+    """
+        Mide las operaciones públicas de BlockchainManager siguiendo el ciclo de vida de un préstamo.
+        Cada repetición usa un cliente distinto, de modo que todas las operaciones son válidas.
+    """
+    socio = cadena.socio_principal.address
+    clave_socio = cadena.clave(cadena.socio_principal)
+    total = repeticiones + 1
+    clientes = cadena.crear_cuentas(total, saldo_ether=10)
+    prestamistas = [Account.from_key(Web3.keccak(text=f"benchmark-prestamista-{i}")).address for i in range(total)]
+    garantia = Web3.to_wei(1, 'ether')
+    monto = Web3.to_wei(0.1, 'ether')
+
+    def cliente(i):
+        return clientes[i].address, cadena.clave(clientes[i])
+
+    def limpiar_cache(i):
+        manager.cache_lecturas.limpiar()
+
+    resultados = {
+        'alta_prestamista': medir(lambda i: manager.alta_prestamista(prestamistas[i]), repeticiones),
+        'alta_cliente': medir(lambda i: manager.alta_cliente(socio, clave_socio, cliente(i)[0]), repeticiones),
+        'depositar_garantia': medir(lambda i: manager.depositar_garantia(*cliente(i), garantia), repeticiones),
+        'solicitar_prestamo': medir(lambda i: manager.solicitar_prestamo(*cliente(i), monto, 3600), repeticiones),
+        'aprobar_prestamo': medir(lambda i: manager.aprobar_prestamo(socio, clave_socio, cliente(i)[0], 1), repeticiones),
+        'obtener_prestamos_por_prestatario': medir(lambda i: manager.obtener_prestamos_por_prestatario(cliente(i)[0]), repeticiones, preparar=limpiar_cache),
+        'obtener_prestamos_por_prestatario.cache': medir(lambda i: manager.obtener_prestamos_por_prestatario(cliente(0)[0]), repeticiones),
+        'obtener_detalle_de_prestamo': medir(lambda i: manager.obtener_detalle_de_prestamo(cliente(i)[0], 1), repeticiones, preparar=limpiar_cache),
+        'obtener_cliente': medir(lambda i: manager.obtener_cliente(cliente(i)[0]), repeticiones, preparar=limpiar_cache),
+        'es_prestamista': medir(lambda i: manager.es_prestamista(prestamistas[i]), repeticiones, preparar=limpiar_cache),
+        'obtener_cartera': medir(lambda i: manager.obtener_cartera(cliente(i)[0]), repeticiones, preparar=limpiar_cache),
+        'leer_prestatarios': medir(lambda i: manager.leer_prestatarios([c.address for c in clientes]), repeticiones),
+        'batch_call': medir(lambda i: manager.batch_call([('obtenerPrestamosPorPrestatario', (c.address,)) for c in clientes]), repeticiones),
+        'reembolsar_prestamo': medir(lambda i: manager.reembolsar_prestamo(*cliente(i), 1), repeticiones),
+    }
+
+    # Para liquidar hace falta un préstamo aprobado y vencido: se prepara fuera de la medida
+    def preparar_liquidacion(i):
+        manager.solicitar_prestamo(*cliente(i), monto, 1)
+        manager.aprobar_prestamo(socio, clave_socio, cliente(i)[0], 2)
+        cadena.tester.time_travel(cadena.web3.eth.get_block('latest')['timestamp'] + 10)
+        cadena.tester.mine_blocks(1)
+
+    resultados['liquidar_garantia'] = medir(
+        lambda i: manager.liquidar_garantia(socio, clave_socio, cliente(i)[0], 2),
+        repeticiones, preparar=preparar_liquidacion
+    )
+    return resultados
+
+
+def metadatos():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'web3': web3.__version__,
+        'plataforma': platform.platform(),
+    }
+
+
+def comparar(resultados, base, tolerancia):
+    """
+        Compara la mediana de cada medida con la de una ejecución base.
+
+        Retorna:
+        Una lista de tuplas (nombre, mediana_base, mediana_actual, variacion) ordenada de mayor a menor
+        variación, y la lista de nombres cuya mediana empeora más de `tolerancia` (0.2 = 20 %).
+    """
+    filas = []
+    regresiones = []
+    for nombre, actual in resultados.items():
+        anterior = base.get(nombre)
+        if not anterior or 'mediana_us' not in anterior or 'mediana_us' not in actual:
+            continue
+        variacion = actual['mediana_us'] / anterior['mediana_us'] - 1 if anterior['mediana_us'] else 0.0
+        filas.append((nombre, anterior['mediana_us'], actual['mediana_us'], variacion))
+        if variacion > tolerancia:
+            regresiones.append(nombre)
+    filas.sort(key=lambda fila: fila[3], reverse=True)
+    return filas, regresiones
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Mide el rendimiento de BlockchainManager sobre una cadena local en memoria (eth-tester).")
+    parser.add_argument('-n', '--repeticiones', type=int, default=20, help="Medidas por operación.")
+    parser.add_argument('-o', '--salida', default='benchmark.json', help="Archivo JSON con los resultados.")
+    parser.add_argument('--base', help="Archivo JSON de una ejecución anterior con el que comparar.")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="Empeoramiento de la mediana a partir del cual se considera regresión (0.2 = 20 %%).")
+    parser.add_argument('--bytecode', help="Archivo con el bytecode de despliegue del contrato en hexadecimal (si no, se compila con py-solc-x).")
+    parser.add_argument('--solc', default=VERSION_SOLC, help="Versión de solc con la que compilar el contrato.")
+    args = parser.parse_args(argumentos)
+
+    # El recibo de cada transacción se registra con nivel INFO (ver ContractUtils); aquí solo interesan los tiempos
+    logging.getLogger().setLevel(logging.WARNING)
+
+    resultados = {}
+    recibo = RECIBO_EJEMPLO
+    try:
+        bytecode = None
+        if args.bytecode:
+            with open(args.bytecode, 'r') as archivo:
+                bytecode = archivo.read().strip()
+        cadena = CadenaLocal(bytecode, args.solc)
+    except Exception as e:
+        # Sin py-solc-x ni bytecode solo se pueden medir las funciones auxiliares
+        print(f"No se ha podido desplegar el contrato ({e}); se miden solo las funciones auxiliares.", file=sys.stderr)
+    else:
+        manager = cadena.crear_manager()
+        fases, recibo = medir_fases_transaccion(cadena, manager, args.repeticiones)
+        resultados.update(fases)
+        resultados.update(medir_operaciones(cadena, manager, args.repeticiones))
+        manager.notificador_recibos.detener()
+    resultados.update(medir_utilidades(args.repeticiones * 50, recibo))
+
+    with open(args.salida, 'w') as archivo:
+        json.dump({'metadatos': metadatos(), 'resultados': resultados}, archivo, indent=2)
+
+    for nombre, medida in resultados.items():
+        if 'error' in medida:
+            print(f"{nombre:55} ERROR: {medida['error']}")
+        else:
+            print(f"{nombre:55} mediana {medida['mediana_us']:>12.1f} us   p95 {medida['p95_us']:>12.1f} us")
+
+    if args.base:
+        with open(args.base, 'r') as archivo:
+            base = json.load(archivo)['resultados']
+        filas, regresiones = comparar(resultados, base, args.tolerancia)
+        print(f"\nComparación con {args.base}:")
+        for nombre, anterior, actual, variacion in filas:
+            marca = '  <-- regresión' if nombre in regresiones else ''
+            print(f"{nombre:55} {anterior:>12.1f} -> {actual:>12.1f} us ({variacion:+.1%}){marca}")
+        if regresiones:
+            print(f"\n{len(regresiones)} medidas empeoran más de un {args.tolerancia:.0%}.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,353 @@
+import argparse
+import heapq
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from web3 import Web3
+
+from CadenaLocal import CadenaLocal, VERSION_SOLC
+from NonceManager import es_error_de_nonce
+from main_lotes import resumir
+
+# Operaciones de escritura (transacciones); el resto son lecturas
+ESCRITURAS = frozenset({
+    'alta_cliente', 'depositar_garantia', 'solicitar_prestamo',
+    'aprobar_prestamo', 'reembolsar_prestamo', 'liquidar_garantia',
+})
+
+# Ciclo de vida de cada prestatario: tras el alta se repite depositar, solicitar, aprobar y
+# reembolsar (o liquidar, si el préstamo se deja vencer)
+SIGUIENTE_ETAPA = {
+    'alta_cliente': 'depositar_garantia',
+    'depositar_garantia': 'solicitar_prestamo',
+    'solicitar_prestamo': 'aprobar_prestamo',
+    'reembolsar_prestamo': 'depositar_garantia',
+    'liquidar_garantia': 'depositar_garantia',
+}
+
+
+def clasificar_error(error):
+    """Clasifica un error de una operación en: revertida, nonce, tiempo_agotado, conexion u otro."""
+    mensaje = str(error).lower()
+    if es_error_de_nonce(mensaje):
+        return 'nonce'
+    if 'revert' in mensaje or 'la transacción falló' in mensaje:
+        return 'revertida'
+    if 'is not in the chain after' in mensaje or 'timed out' in mensaje or 'timeout' in mensaje:
+        return 'tiempo_agotado'
+    if 'connection' in mensaje or 'ningún nodo ha respondido' in mensaje:
+        return 'conexion'
+    return 'otro'
+
+
+class Prestatario:
+    """Estado de un prestatario simulado: su cuenta, la siguiente operación y el préstamo en curso."""
+
+    def __init__(self, cuenta, clave):
+        self.cuenta = cuenta
+        self.clave = clave
+        self.etapa = 'alta_cliente'
+        self.prestamos = 0
+        self.impago = False
+
+    @property
+    def direccion(self):
+        return self.cuenta.address
+
+
+class GeneradorCarga:
+    """
+        Genera una carga mixta sobre el contrato PrestamoDeFi a través de `BlockchainManager`.
+
+        Cada prestatario recorre su ciclo de vida (ver `SIGUIENTE_ETAPA`) y solo tiene una operación
+        en curso a la vez, como un usuario real. Los préstamos que se dejan vencer se guardan en un
+        montículo ordenado por el momento en que pueden liquidarse. Una fracción de las operaciones
+        son lecturas sobre prestatarios al azar.
+
+        Las operaciones se lanzan a un ritmo objetivo con llegadas de Poisson (carga abierta): la
+        latencia se mide desde el momento en que la operación debía empezar, de modo que incluye el
+        tiempo de cola cuando el sistema no da abasto.
+
+        Atributos:
+        - blockchain_manager (BlockchainManager): El gestor contra el que se lanza la carga.
+        - prestamistas (list): Tuplas (dirección, clave privada) de los prestamistas que aprueban y liquidan.
+        - prestatarios (list): Los `Prestatario` simulados.
+        - fraccion_lecturas (float): Proporción de operaciones que son lecturas.
+        - fraccion_impagos (float): Proporción de préstamos que se dejan vencer y se liquidan.
+    """
+
+    def __init__(self, blockchain_manager, prestamistas, prestatarios, fraccion_lecturas=0.2, fraccion_impagos=0.2,
+                 garantia=Web3.to_wei(1, 'ether'), monto=Web3.to_wei(0.1, 'ether'), plazo=3600, plazo_impago=2, semilla=None):
+        self.blockchain_manager = blockchain_manager
+        self.prestamistas = prestamistas
+        self.prestatarios = prestatarios
+        self.fraccion_lecturas = fraccion_lecturas
+        self.fraccion_impagos = fraccion_impagos
+        self.garantia = garantia
+        self.monto = monto
+        self.plazo = plazo
+        self.plazo_impago = plazo_impago
+        self._azar = random.Random(semilla)
+        self._listos = deque(prestatarios)
+        self._vencimientos = []
+        self._registrados = []
+        self._cerrojo = threading.Lock()
+
+    def _prestamista(self):
+        return self._azar.choice(self.prestamistas)
+
+    def siguiente_tarea(self):
+        """
+            Elige la siguiente operación a lanzar.
+
+            Retorna:
+            Una tupla (nombre_operacion, prestatario, funcion) o None si ningún prestatario tiene
+            una operación disponible en este momento.
+        """
+        with self._cerrojo:
+            if self._registrados and self._azar.random() < self.fraccion_lecturas:
+                prestatario = self._azar.choice(self._registrados)
+                if prestatario.prestamos and self._azar.random() < 0.5:
+                    prestamo_id = self._azar.randint(1, prestatario.prestamos)
+                    return 'obtener_detalle_de_prestamo', None, lambda: self.blockchain_manager.obtener_detalle_de_prestamo(prestatario.direccion, prestamo_id)
+                return 'obtener_prestamos_por_prestatario', None, lambda: self.blockchain_manager.obtener_prestamos_por_prestatario(prestatario.direccion)
+
+            if self._vencimientos and self._vencimientos[0][0] <= time.monotonic():
+                _, _, prestatario = heapq.heappop(self._vencimientos)
+            elif self._listos:
+                prestatario = self._listos.popleft()
+            else:
+                return None
+
+        return prestatario.etapa, prestatario, self._operacion(prestatario)
+
+    def _operacion(self, prestatario):
+        bm = self.blockchain_manager
+        direccion, clave = prestatario.direccion, prestatario.clave
+        etapa = prestatario.etapa
+        if etapa == 'alta_cliente':
+            return lambda: bm.alta_cliente(*self._prestamista(), direccion)
+        if etapa == 'depositar_garantia':
+            return lambda: bm.depositar_garantia(direccion, clave, self.garantia)
+        if etapa == 'solicitar_prestamo':
+            prestatario.impago = self._azar.random() < self.fraccion_impagos
+            plazo = self.plazo_impago if prestatario.impago else self.plazo
+            return lambda: bm.solicitar_prestamo(direccion, clave, self.monto, plazo)
+        prestamo_id = prestatario.prestamos + 1 if etapa == 'aprobar_prestamo' else prestatario.prestamos
+        if etapa == 'aprobar_prestamo':
+            return lambda: bm.aprobar_prestamo(*self._prestamista(), direccion, prestamo_id)
+        if etapa == 'reembolsar_prestamo':
+            return lambda: bm.reembolsar_prestamo(direccion, clave, prestamo_id)
+        return lambda: bm.liquidar_garantia(*self._prestamista(), direccion, prestamo_id)
+
+    def terminada(self, prestatario, exito):
+        """Actualiza el estado del prestatario cuando termina su operación y lo vuelve a dejar disponible."""
+        with self._cerrojo:
+            if exito:
+                if prestatario.etapa == 'alta_cliente':
+                    self._registrados.append(prestatario)
+                if prestatario.etapa == 'aprobar_prestamo':
+                    prestatario.prestamos += 1
+                    if prestatario.impago:
+                        prestatario.etapa = 'liquidar_garantia'
+                        vence = time.monotonic() + self.plazo_impago + 1
+                        heapq.heappush(self._vencimientos, (vence, id(prestatario), prestatario))
+                        return
+                    prestatario.etapa = 'reembolsar_prestamo'
+                else:
+                    prestatario.etapa = SIGUIENTE_ETAPA[prestatario.etapa]
+            elif prestatario.etapa == 'liquidar_garantia':
+                # Normalmente, el préstamo aún no ha vencido en la cadena: se reintenta más tarde
+                heapq.heappush(self._vencimientos, (time.monotonic() + 1, id(prestatario), prestatario))
+                return
+            self._listos.append(prestatario)
+
+
+class RegistroCarga:
+    """Acumula las latencias y los errores de una etapa de carga, por operación."""
+
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.clases_error = defaultdict(int)
+        self.descartadas = 0
+        self.sin_trabajo = 0
+        self._cerrojo = threading.Lock()
+
+    def registrar(self, operacion, latencia, error=None):
+        with self._cerrojo:
+            self.latencias[operacion].append(latencia)
+            if error is not None:
+                self.errores[operacion] += 1
+                self.clases_error[clasificar_error(error)] += 1
+
+    def resumen(self, tasa_objetivo, duracion):
+        """
+            Retorna el resumen de la etapa: el ritmo objetivo y el conseguido, las transacciones por
+            segundo completadas con éxito, los errores por clase y, por operación, el resumen de
+            `main_lotes.resumir` (latencias p50, p95, p99...).
+        """
+        por_operacion = {
+            operacion: resumir(latencias, self.errores[operacion], duracion)
+            for operacion, latencias in sorted(self.latencias.items())
+        }
+        total = sum(len(latencias) for latencias in self.latencias.values())
+        transacciones = sum(
+            len(latencias) - self.errores[operacion]
+            for operacion, latencias in self.latencias.items() if operacion in ESCRITURAS
+        )
+        return {
+            'tasa_objetivo': tasa_objetivo,
+            'duracion': round(duracion, 3),
+            'operaciones_por_segundo': round(total / duracion, 3) if duracion > 0 else 0.0,
+            'transacciones_por_segundo': round(transacciones / duracion, 3) if duracion > 0 else 0.0,
+            'errores': sum(self.errores.values()),
+            'clases_error': dict(self.clases_error),
+            'descartadas': self.descartadas,
+            'sin_trabajo': self.sin_trabajo,
+            'por_operacion': por_operacion,
+        }
+
+
+def ejecutar_etapa(generador, executor, tasa, duracion, max_en_curso, azar=random):
+    """
+        Lanza operaciones del generador a un ritmo medio de `tasa` por segundo durante `duracion`
+        segundos y espera a que terminen las que quedan en curso.
+
+        Si hay `max_en_curso` operaciones pendientes, las nuevas se descartan (y se cuentan) en lugar
+        de acumularse sin límite: es la señal de que se ha superado el punto de saturación.
+
+        Retorna:
+        El resumen de la etapa (ver `RegistroCarga.resumen`).
+    """
+    registro = RegistroCarga()
+    en_curso = set()
+    cerrojo = threading.Lock()
+
+    def ejecutar(nombre, prestatario, funcion, programada):
+        error = None
+        try:
+            funcion()
+        except Exception as e:
+            error = e
+        registro.registrar(nombre, time.perf_counter() - programada, error)
+        if prestatario is not None:
+            generador.terminada(prestatario, error is None)
+
+    def retirar(futuro):
+        with cerrojo:
+            en_curso.discard(futuro)
+
+    inicio = time.perf_counter()
+    programada = inicio
+    while programada - inicio < duracion:
+        espera = programada - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+        with cerrojo:
+            saturado = len(en_curso) >= max_en_curso
+        if saturado:
+            registro.descartadas += 1
+        else:
+            tarea = generador.siguiente_tarea()
+            if tarea is None:
+                registro.sin_trabajo += 1
+            else:
+                futuro = executor.submit(ejecutar, *tarea, programada)
+                with cerrojo:
+                    en_curso.add(futuro)
+                futuro.add_done_callback(retirar)
+        programada += azar.expovariate(tasa)
+
+    with cerrojo:
+        pendientes = set(en_curso)
+    wait(pendientes)
+    return registro.resumen(tasa, time.perf_counter() - inicio)
+
+
+def preparar_cadena(args):
+    """Despliega el contrato en una cadena en memoria, crea las cuentas y da de alta a los prestamistas."""
+    bytecode = None
+    if args.bytecode:
+        with open(args.bytecode, 'r') as archivo:
+            bytecode = archivo.read().strip()
+    cadena = CadenaLocal(bytecode, args.solc)
+    blockchain_manager = cadena.crear_manager()
+
+    cuentas_prestamistas = cadena.crear_cuentas(args.prestamistas, saldo_ether=10)
+    for cuenta in cuentas_prestamistas:
+        blockchain_manager.alta_prestamista(cuenta.address)
+    prestamistas = [(cuenta.address, cadena.clave(cuenta)) for cuenta in cuentas_prestamistas]
+
+    prestatarios = [Prestatario(cuenta, cadena.clave(cuenta)) for cuenta in cadena.crear_cuentas(args.prestatarios)]
+    return cadena, blockchain_manager, prestamistas, prestatarios
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Genera carga mixta sobre PrestamoDeFi en una cadena en memoria y mide latencias, rendimiento y errores.")
+    parser.add_argument('-p', '--prestatarios', type=int, default=200, help="Número de prestatarios simulados.")
+    parser.add_argument('--prestamistas', type=int, default=4, help="Número de prestamistas que aprueban y liquidan.")
+    parser.add_argument('-t', '--tasas', default='5,10,20,40', help="Ritmos objetivo (operaciones por segundo) separados por comas; se ejecuta una etapa por ritmo.")
+    parser.add_argument('-d', '--duracion', type=float, default=30, help="Segundos de cada etapa.")
+    parser.add_argument('-c', '--concurrencia', type=int, default=16, help="Operaciones simultáneas como máximo.")
+    parser.add_argument('--lecturas', type=float, default=0.2, help="Proporción de operaciones de lectura.")
+    parser.add_argument('--impagos', type=float, default=0.2, help="Proporción de préstamos que se dejan vencer y se liquidan.")
+    parser.add_argument('--semilla', type=int, help="Semilla para reproducir la misma secuencia de operaciones.")
+    parser.add_argument('-o', '--salida', help="Archivo JSON en el que guardar el informe.")
+    parser.add_argument('--bytecode', help="Archivo con el bytecode de despliegue del contrato en hexadecimal (si no, se compila con py-solc-x).")
+    parser.add_argument('--solc', default=VERSION_SOLC, help="Versión de solc con la que compilar el contrato.")
+    args = parser.parse_args(argumentos)
+
+    # El recibo de cada transacción se registra con nivel INFO (ver ContractUtils)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"Preparando {args.prestatarios} prestatarios y {args.prestamistas} prestamistas...", file=sys.stderr)
+    cadena, blockchain_manager, prestamistas, prestatarios = preparar_cadena(args)
+    generador = GeneradorCarga(
+        blockchain_manager, prestamistas, prestatarios,
+        fraccion_lecturas=args.lecturas, fraccion_impagos=args.impagos, semilla=args.semilla
+    )
+
+    llegadas = random.Random(args.semilla)
+    etapas = []
+    with ThreadPoolExecutor(max_workers=args.concurrencia) as executor:
+        for tasa in [float(tasa) for tasa in args.tasas.split(',')]:
+            resumen = ejecutar_etapa(generador, executor, tasa, args.duracion, 4 * args.concurrencia, llegadas)
+            etapas.append(resumen)
+            print(
+                f"\nObjetivo {tasa:g} op/s: {resumen['operaciones_por_segundo']} op/s, "
+                f"{resumen['transacciones_por_segundo']} tx/s, {resumen['errores']} errores {resumen['clases_error']}, "
+                f"{resumen['descartadas']} descartadas, {resumen['sin_trabajo']} sin prestatario disponible.",
+                file=sys.stderr
+            )
+            for operacion, datos in resumen['por_operacion'].items():
+                print(
+                    f"  {operacion:35} {datos['operaciones']:>6}  p50 {datos['latencia_p50']:.3f} s  "
+                    f"p95 {datos['latencia_p95']:.3f} s  p99 {datos['latencia_p99']:.3f} s  errores {datos['errores']}",
+                    file=sys.stderr
+                )
+    blockchain_manager.notificador_recibos.detener()
+
+    # Primera etapa que no alcanza el 90 % del ritmo objetivo o que descarta operaciones
+    saturacion = next(
+        (etapa['tasa_objetivo'] for etapa in etapas
+         if etapa['descartadas'] or etapa['operaciones_por_segundo'] < 0.9 * etapa['tasa_objetivo']),
+        None
+    )
+    if saturacion is not None:
+        print(f"\nSaturación a partir de {saturacion:g} op/s.", file=sys.stderr)
+
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            json.dump({'parametros': vars(args), 'saturacion': saturacion, 'etapas': etapas}, archivo, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
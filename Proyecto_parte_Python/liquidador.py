@@ -0,0 +1,60 @@
+import argparse
+import os
+import signal
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+from BlockchainManager import BlockchainManager
+from IndexadorPrestamos import IndexadorPrestamos
+from PlanificadorLiquidaciones import PlanificadorLiquidaciones
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Liquida las garantías de los préstamos de PrestamoDeFi en cuanto vence su plazo.")
+    parser.add_argument('--bd', default='prestamos.db', help="Base de datos del indexador de préstamos (una ruta relativa se interpreta dentro de DATOS_DIR).")
+    parser.add_argument('--bloque-inicial', type=int, default=0, help="Bloque desde el que se indexa el contrato si la base de datos está vacía.")
+    parser.add_argument('--lote', type=int, default=50, help="Número máximo de liquidaciones que se envían juntas.")
+    parser.add_argument('--intervalo', type=float, default=2, help="Segundos entre dos sincronizaciones del indexador.")
+    parser.add_argument('--puerto-metricas', type=int, help="Sirve las métricas en formato Prometheus en este puerto (por defecto, METRICAS_PUERTO).")
+    args = parser.parse_args(argumentos)
+
+    # Misma configuración que la aplicación gráfica (ver main.py). Las liquidaciones las firma la cuenta
+    # de PRESTAMISTA_ADDRESS / PRESTAMISTA_PRIVATE_KEY o, si no se indica, el socio principal
+    load_dotenv()
+    blockchainManager = BlockchainManager(
+        ganache_url=os.getenv('GANACHE_URL'),
+        contract_address=os.getenv('CONTRACT_ADDRESS'),
+        abi_path=os.getenv('ABI_PATH'),
+        socio_principal_address=os.getenv('SOCIO_PRINCIPAL_ADDRESS'),
+        socio_principal_private_key=os.getenv('SOCIO_PRINCIPAL_PRIVATE_KEY'),
+        contract_code_hash=os.getenv('CONTRACT_CODE_HASH'),
+        # Modelo de gas propio, para no sobrescribir el de la aplicación gráfica si se ejecutan a la vez
+        ruta_modelo_gas='modelo_gas_liquidador.json'
+    )
+    puerto_metricas = args.puerto_metricas or os.getenv('METRICAS_PUERTO')
+    if puerto_metricas:
+        blockchainManager.metricas.servir(int(puerto_metricas))
+
+    indexador = IndexadorPrestamos(blockchainManager, args.bd, bloque_inicial=args.bloque_inicial)
+    planificador = PlanificadorLiquidaciones(
+        blockchainManager,
+        os.getenv('PRESTAMISTA_ADDRESS') or blockchainManager.socio_principal_address,
+        os.getenv('PRESTAMISTA_PRIVATE_KEY') or blockchainManager.socio_principal_private_key,
+        indexador=indexador,
+        tamano_lote=args.lote,
+    )
+
+    detener = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: detener.set())
+    signal.signal(signal.SIGTERM, lambda *_: detener.set())
+    try:
+        planificador.ejecutar(detener, args.intervalo)
+    finally:
+        indexador.cerrar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,33 +1,74 @@
-from PyQt5.QtWidgets import QApplication
-from MainWindow import MainWindow
-from BlockchainManager import BlockchainManager
+import time
+# Referencia para los tiempos de arranque: se toma antes de cualquier otra importación
+INICIO = time.perf_counter()
+
+import argparse
+import logging
 import os
+import sys
+
 from dotenv import load_dotenv
+from PyQt5.QtWidgets import QApplication
+
+from MainWindow import MainWindow
+from TiemposArranque import TiemposArranque
+from Trazas import Trazador
+
+def crearBlockchainManager(configuracion, tiempos):
+    # web3 y BlockchainManager se importan aquí, en segundo plano, para no retrasar la ventana
+    from BlockchainManager import BlockchainManager
+    tiempos.marcar('web3_importado')
+    blockchainManager = BlockchainManager(**configuracion)
+    tiempos.marcar('contrato_cargado')
+    if os.getenv('METRICAS_PUERTO'):
+        blockchainManager.metricas.servir(int(os.getenv('METRICAS_PUERTO')))
+    return blockchainManager
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Aplicación DeFi de gestión de préstamos.")
+    parser.add_argument('--tiempos-arranque', metavar='RUTA', help="Añade los tiempos de este arranque como una línea JSON al archivo indicado.")
+    parser.add_argument('--salir-tras-arranque', action='store_true', help="Cierra la aplicación en cuanto está lista (para medir el arranque).")
+    args = parser.parse_args(argumentos)
+    tiempos = TiemposArranque(INICIO)
 
-def main():
     # Carga las variables de entorno desde el archivo .env
     load_dotenv()
 
     # Extrae las variables de entorno necesarias
-    ganache_url = os.getenv('GANACHE_URL')
-    contract_address = os.getenv('CONTRACT_ADDRESS')
-    abi_path = os.getenv('ABI_PATH')
-    socio_principal_address = os.getenv('SOCIO_PRINCIPAL_ADDRESS')
-    socio_principal_private_key = os.getenv('SOCIO_PRINCIPAL_PRIVATE_KEY')
-
-    # Inicializa la aplicación Qt y BlockchainManager con las configuraciones
-    app = QApplication([])
-    
-    blockchainManager = BlockchainManager(
-        ganache_url=ganache_url,
-        contract_address=contract_address,
-        abi_path=abi_path,
-        socio_principal_address=socio_principal_address,
-        socio_principal_private_key=socio_principal_private_key  
-    )
-    mainWindow = MainWindow(blockchainManager)
+    configuracion = {
+        'ganache_url': os.getenv('GANACHE_URL'),
+        'contract_address': os.getenv('CONTRACT_ADDRESS'),
+        'abi_path': os.getenv('ABI_PATH'),
+        'socio_principal_address': os.getenv('SOCIO_PRINCIPAL_ADDRESS'),
+        'socio_principal_private_key': os.getenv('SOCIO_PRINCIPAL_PRIVATE_KEY'),
+        'contract_code_hash': os.getenv('CONTRACT_CODE_HASH'),
+        # Traza de las operaciones (TRAZA_RUTA) y funciones del contrato a perfilar (PERFILAR, separadas por comas)
+        'trazador': Trazador(os.getenv('TRAZA_RUTA'), [nombre for nombre in os.getenv('PERFILAR', '').split(',') if nombre]),
+    }
+
+    # La ventana se muestra de inmediato; la conexión con el nodo y la carga del contrato se hacen
+    # en segundo plano y las acciones se activan cuando terminan
+    app = QApplication(sys.argv[:1])
+    mainWindow = MainWindow()
     mainWindow.show()
-    app.exec_()
+    app.processEvents()
+    tiempos.marcar('ventana_visible')
+
+    def alTerminarArranque(error=None):
+        tiempos.marcar('listo' if error is None else 'conexion_fallida')
+        logging.info(f"Tiempos de arranque: {tiempos.informe()}")
+        if args.tiempos_arranque:
+            tiempos.guardar(args.tiempos_arranque)
+        if args.salir_tras_arranque:
+            app.exit(0 if error is None else 1)
+
+    mainWindow.conectada.connect(alTerminarArranque)
+    mainWindow.conexionFallida.connect(alTerminarArranque)
+    mainWindow.conectar(lambda: crearBlockchainManager(configuracion, tiempos))
+    codigo = app.exec_()
+    if configuracion['trazador'].activo:
+        configuracion['trazador'].exportar()
+    return codigo
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
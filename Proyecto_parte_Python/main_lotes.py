@@ -0,0 +1,389 @@
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from dotenv import load_dotenv
+from web3 import Web3
+
+from BlockchainManager import BlockchainManager
+from FirmadorProcesos import FirmadorProcesos
+from Trazas import Trazador
+
+# Operaciones admitidas en los archivos de entrada. Cada una indica el método de BlockchainManager
+# y cómo se obtienen sus argumentos a partir de los campos de la fila.
+OPERACIONES = {
+    'alta_prestamista': lambda bm, f: bm.alta_prestamista(f['nueva_direccion']),
+    'alta_cliente': lambda bm, f: bm.alta_cliente(f['direccion'], f['clave_privada'], f['nueva_direccion']),
+    'depositar_garantia': lambda bm, f: bm.depositar_garantia(f['direccion'], f['clave_privada'], Web3.to_wei(float(f['valor']), 'ether')),
+    'solicitar_prestamo': lambda bm, f: bm.solicitar_prestamo(f['direccion'], f['clave_privada'], Web3.to_wei(float(f['monto']), 'ether'), int(f['plazo'])),
+    'aprobar_prestamo': lambda bm, f: bm.aprobar_prestamo(f['direccion'], f['clave_privada'], f['prestatario'], int(f['prestamo_id'])),
+    'reembolsar_prestamo': lambda bm, f: bm.reembolsar_prestamo(f['direccion'], f['clave_privada'], int(f['prestamo_id'])),
+    'liquidar_garantia': lambda bm, f: bm.liquidar_garantia(f['direccion'], f['clave_privada'], f['prestatario'], int(f['prestamo_id'])),
+    'obtener_prestamos_por_prestatario': lambda bm, f: bm.obtener_prestamos_por_prestatario(f['prestatario']),
+    'obtener_detalle_de_prestamo': lambda bm, f: bm.obtener_detalle_de_prestamo(f['prestatario'], int(f['prestamo_id'])),
+}
+
+# Transacción que envía cada operación, en el formato de BlockchainManager.submit_many, para ejecutar
+# las filas en lotes (--procesos-firma). Las operaciones que no están aquí (lecturas) se ejecutan una a una.
+TRANSACCIONES = {
+    'alta_prestamista': lambda bm, f: {
+        'function_call': bm.contract.functions.altaPrestamista(Web3.to_checksum_address(f['nueva_direccion'])),
+        'account_address': bm.socio_principal_address,
+        'private_key': bm.socio_principal_private_key,
+    },
+    'alta_cliente': lambda bm, f: {
+        'function_call': bm.contract.functions.altaCliente(Web3.to_checksum_address(f['nueva_direccion'])),
+        'account_address': f['direccion'],
+        'private_key': f['clave_privada'],
+    },
+    'depositar_garantia': lambda bm, f: {
+        'function_call': bm.contract.functions.depositarGarantia(),
+        'account_address': f['direccion'],
+        'private_key': f['clave_privada'],
+        'ether_value': Web3.to_wei(float(f['valor']), 'ether'),
+    },
+    'solicitar_prestamo': lambda bm, f: {
+        'function_call': bm.contract.functions.solicitarPrestamo(Web3.to_wei(float(f['monto']), 'ether'), int(f['plazo'])),
+        'account_address': f['direccion'],
+        'private_key': f['clave_privada'],
+    },
+    'aprobar_prestamo': lambda bm, f: {
+        'function_call': bm.contract.functions.aprobarPrestamo(Web3.to_checksum_address(f['prestatario']), int(f['prestamo_id'])),
+        'account_address': f['direccion'],
+        'private_key': f['clave_privada'],
+    },
+    'reembolsar_prestamo': lambda bm, f: {
+        'function_call': bm.contract.functions.reembolsarPrestamo(int(f['prestamo_id'])),
+        'account_address': f['direccion'],
+        'private_key': f['clave_privada'],
+        'plazo_reemplazo': bm.PLAZO_REEMPLAZO_URGENTE,
+    },
+    'liquidar_garantia': lambda bm, f: {
+        'function_call': bm.contract.functions.liquidarGarantia(Web3.to_checksum_address(f['prestatario']), int(f['prestamo_id'])),
+        'account_address': f['direccion'],
+        'private_key': f['clave_privada'],
+    },
+}
+
+
+def leer_filas(ruta):
+    """
+        Lee las operaciones de un archivo CSV (con cabecera) o JSONL (un objeto JSON por línea).
+        El formato se deduce de la extensión; '-' lee JSONL desde la entrada estándar.
+
+        Cada fila debe tener el campo 'operacion' (ver `OPERACIONES`) y los campos que esta necesite:
+        'direccion' y 'clave_privada' de quien firma, 'nueva_direccion', 'prestatario', 'prestamo_id',
+        'valor' y 'monto' (en ether) o 'plazo' (en segundos).
+    """
+    if ruta == '-':
+        archivo = sys.stdin
+    else:
+        archivo = open(ruta, 'r', newline='', encoding='utf-8')
+    try:
+        if ruta.lower().endswith('.csv'):
+            for fila in csv.DictReader(archivo):
+                yield {clave.strip(): valor.strip() for clave, valor in fila.items() if clave and valor not in (None, '')}
+        else:
+            for linea in archivo:
+                if linea.strip():
+                    yield json.loads(linea)
+    finally:
+        if archivo is not sys.stdin:
+            archivo.close()
+
+
+def ejecutar_fila(blockchain_manager, numero, fila):
+    """Ejecuta una fila y retorna su resultado como diccionario, incluida la latencia en segundos."""
+    inicio = time.perf_counter()
+    resultado = {'fila': numero, 'operacion': fila.get('operacion')}
+    try:
+        operacion = OPERACIONES.get(fila.get('operacion'))
+        if operacion is None:
+            raise ValueError(f"Operación desconocida: {fila.get('operacion')}")
+        resultado['resultado'] = operacion(blockchain_manager, fila)
+        resultado['estado'] = 'ok'
+    except KeyError as e:
+        resultado['estado'] = 'error'
+        resultado['error'] = f"Falta el campo {e} en la fila."
+    except Exception as e:
+        resultado['estado'] = 'error'
+        resultado['error'] = str(e)
+    resultado['latencia'] = round(time.perf_counter() - inicio, 6)
+    return resultado
+
+
+def direcciones_fila(fila):
+    """Retorna las direcciones (en minúsculas) que usa una fila: la de quien firma y las de sus argumentos."""
+    return {
+        fila[campo].lower()
+        for campo in ('direccion', 'nueva_direccion', 'prestatario')
+        if isinstance(fila.get(campo), str) and Web3.is_address(fila[campo])
+    }
+
+
+def firmante(blockchain_manager, fila):
+    """Retorna la cuenta (en minúsculas) que firma la transacción de una fila, o None si la fila es una lectura."""
+    if fila.get('operacion') == 'alta_prestamista':
+        return (blockchain_manager.socio_principal_address or '').lower() or None
+    if fila.get('operacion') in TRANSACCIONES and isinstance(fila.get('direccion'), str):
+        return fila['direccion'].lower()
+    return None
+
+
+def percentil(valores_ordenados, p):
+    """Retorna el percentil `p` (0-100) de una lista ya ordenada, por el método del rango más cercano."""
+    if not valores_ordenados:
+        return 0.0
+    indice = max(math.ceil(p / 100 * len(valores_ordenados)) - 1, 0)
+    return valores_ordenados[indice]
+
+
+def resumir(latencias, errores, duracion):
+    """
+        Calcula el resumen de una ejecución.
+
+        Parámetros:
+        - latencias (list): Latencias en segundos de todas las operaciones.
+        - errores (int): Número de operaciones fallidas.
+        - duracion (float): Duración total en segundos.
+
+        Retorna:
+        Un diccionario con el total, los errores, el rendimiento (operaciones por segundo) y la
+        latencia media, p50, p95, p99 y máxima.
+    """
+    ordenadas = sorted(latencias)
+    total = len(ordenadas)
+    return {
+        'operaciones': total,
+        'errores': errores,
+        'duracion': round(duracion, 3),
+        'operaciones_por_segundo': round(total / duracion, 3) if duracion > 0 else 0.0,
+        'latencia_media': round(sum(ordenadas) / total, 6) if total else 0.0,
+        'latencia_p50': percentil(ordenadas, 50),
+        'latencia_p95': percentil(ordenadas, 95),
+        'latencia_p99': percentil(ordenadas, 99),
+        'latencia_maxima': ordenadas[-1] if ordenadas else 0.0,
+    }
+
+
+def ejecutar_lote(blockchain_manager, filas, salida, concurrencia=4):
+    """
+        Ejecuta las filas con `concurrencia` hilos y escribe cada resultado en `salida` (una línea JSON
+        por fila, en el orden en que terminan) en cuanto está disponible.
+
+        Como mucho se mantienen `2 * concurrencia` filas en curso, de modo que los archivos grandes
+        se procesan sin cargarlos completos en memoria.
+
+        Una fila que comparte alguna dirección (la de quien firma, 'nueva_direccion' o 'prestatario')
+        con una fila anterior todavía en curso no se lanza hasta que esta termina, para que, por
+        ejemplo, el `depositar_garantia` de un cliente no se ejecute antes de su `alta_cliente`. Las
+        filas de una misma cuenta que solo comparten esa cuenta se ejecutan en paralelo (el gestor de
+        nonces las ordena). Si la fila anterior falla, la dependiente se ejecuta igualmente.
+
+        Retorna:
+        El resumen de la ejecución (ver `resumir`).
+    """
+    latencias = []
+    errores = 0
+    cerrojo = threading.Lock()
+    inicio = time.perf_counter()
+
+    def registrar(futuro):
+        nonlocal errores
+        resultado = futuro.result()
+        with cerrojo:
+            latencias.append(resultado['latencia'])
+            if resultado['estado'] != 'ok':
+                errores += 1
+            salida.write(json.dumps(resultado, default=str, ensure_ascii=False) + '\n')
+            salida.flush()
+
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+
+        def programar(numero, fila, dependencias):
+            # Lanza la fila cuando terminan todas las filas de las que depende
+            futuro = Future()
+            restantes = [len(dependencias)]
+            cerrojo_dependencias = threading.Lock()
+
+            def lanzar():
+                ejecucion = executor.submit(ejecutar_fila, blockchain_manager, numero, fila)
+                ejecucion.add_done_callback(lambda terminada: futuro.set_result(terminada.result()))
+
+            def al_terminar_dependencia(_):
+                with cerrojo_dependencias:
+                    restantes[0] -= 1
+                    listo = restantes[0] == 0
+                if listo:
+                    lanzar()
+
+            if not dependencias:
+                lanzar()
+            for dependencia in dependencias:
+                dependencia.add_done_callback(al_terminar_dependencia)
+            return futuro
+
+        en_curso = set()
+        # Filas en curso con la cuenta que las firma y las direcciones que usan
+        activas = []
+        for numero, fila in enumerate(filas, start=1):
+            if len(en_curso) >= 2 * concurrencia:
+                _, en_curso = wait(en_curso, return_when=FIRST_COMPLETED)
+                activas = [activa for activa in activas if activa[0] in en_curso]
+            cuenta = firmante(blockchain_manager, fila)
+            direcciones = direcciones_fila(fila) | ({cuenta} if cuenta else set())
+            dependencias = [
+                futuro for futuro, otra_cuenta, otras_direcciones in activas
+                if not futuro.done() and (direcciones & otras_direcciones) - ({cuenta} if cuenta is not None and cuenta == otra_cuenta else set())
+            ]
+            futuro = programar(numero, fila, dependencias)
+            futuro.add_done_callback(registrar)
+            en_curso.add(futuro)
+            activas.append((futuro, cuenta, direcciones))
+        wait(en_curso)
+
+    return resumir(latencias, errores, time.perf_counter() - inicio)
+
+
+def ejecutar_lotes_firmados(blockchain_manager, filas, salida, tamano_lote=100):
+    """
+        Ejecuta las filas en lotes con `BlockchainManager.submit_many`, que difunde todas las
+        transacciones de un lote (firmadas juntas por el `firmador` del gestor) antes de esperar sus
+        recibos, y escribe el resultado de cada fila en `salida` al terminar su lote.
+
+        Un lote se cierra antes de una fila que comparte alguna dirección con una fila anterior del lote
+        firmada por otra cuenta (por ejemplo, el `depositar_garantia` de un cliente tras su
+        `alta_cliente`), para que no se difunda antes de que la primera se mine. Las filas de una misma
+        cuenta pueden ir en el mismo lote, en orden de nonce. Las lecturas cierran el lote en curso y se
+        ejecutan una a una. La latencia de cada fila es la de su lote.
+
+        Retorna:
+        El resumen de la ejecución (ver `resumir`).
+    """
+    latencias = []
+    errores = 0
+    inicio = time.perf_counter()
+
+    def escribir(resultado):
+        nonlocal errores
+        latencias.append(resultado['latencia'])
+        if resultado['estado'] != 'ok':
+            errores += 1
+        salida.write(json.dumps(resultado, default=str, ensure_ascii=False) + '\n')
+        salida.flush()
+
+    def enviar(lote):
+        if not lote:
+            return
+        inicio_lote = time.perf_counter()
+        respuestas = blockchain_manager.submit_many([operacion for _, _, operacion in lote])
+        latencia = round(time.perf_counter() - inicio_lote, 6)
+        for (numero, fila, _), respuesta in zip(lote, respuestas):
+            resultado = {'fila': numero, 'operacion': fila.get('operacion')}
+            if isinstance(respuesta, Exception):
+                resultado['estado'] = 'error'
+                resultado['error'] = str(respuesta)
+            else:
+                resultado['resultado'] = respuesta
+                resultado['estado'] = 'ok'
+            resultado['latencia'] = latencia
+            escribir(resultado)
+        lote.clear()
+
+    lote = []
+    # Cuentas que firman las filas del lote en curso que usan cada dirección
+    cuentas_por_direccion = {}
+    for numero, fila in enumerate(filas, start=1):
+        construir = TRANSACCIONES.get(fila.get('operacion'))
+        if construir is None:
+            enviar(lote)
+            cuentas_por_direccion.clear()
+            escribir(ejecutar_fila(blockchain_manager, numero, fila))
+            continue
+        try:
+            operacion = construir(blockchain_manager, fila)
+        except Exception as e:
+            # Misma forma que los errores de `ejecutar_fila`, sin esperar al lote
+            escribir({
+                'fila': numero, 'operacion': fila.get('operacion'), 'estado': 'error',
+                'error': f"Falta el campo {e} en la fila." if isinstance(e, KeyError) else str(e), 'latencia': 0.0,
+            })
+            continue
+
+        cuenta = operacion['account_address'].lower()
+        direcciones = direcciones_fila(fila) | {cuenta}
+        if len(lote) >= tamano_lote or any(cuentas_por_direccion.get(direccion, {cuenta}) - {cuenta} for direccion in direcciones):
+            enviar(lote)
+            cuentas_por_direccion.clear()
+        lote.append((numero, fila, operacion))
+        for direccion in direcciones:
+            cuentas_por_direccion.setdefault(direccion, set()).add(cuenta)
+    enviar(lote)
+
+    return resumir(latencias, errores, time.perf_counter() - inicio)
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Ejecuta operaciones del contrato PrestamoDeFi desde un archivo CSV o JSONL, sin interfaz gráfica.")
+    parser.add_argument('entrada', help="Archivo de operaciones (.csv o .jsonl; '-' para JSONL desde la entrada estándar).")
+    parser.add_argument('-o', '--salida', default='-', help="Archivo JSONL en el que se escriben los resultados (por defecto, la salida estándar).")
+    parser.add_argument('-c', '--concurrencia', type=int, default=4, help="Número de operaciones simultáneas.")
+    parser.add_argument('--procesos-firma', type=int, help="Envía las filas en lotes con submit_many y firma cada lote en este número de procesos (en lugar de usar --concurrencia).")
+    parser.add_argument('--lote', type=int, default=100, help="Número máximo de filas por lote con --procesos-firma.")
+    parser.add_argument('--puerto-metricas', type=int, help="Sirve las métricas en formato Prometheus en este puerto mientras dura la ejecución (por defecto, METRICAS_PUERTO).")
+    parser.add_argument('--traza', help="Guarda una traza de las operaciones en formato de Chrome (chrome://tracing, Perfetto) en este archivo.")
+    parser.add_argument('--perfilar', default='', help="Funciones del contrato, separadas por comas, que se ejecutan bajo cProfile (los perfiles se guardan junto a la traza).")
+    args = parser.parse_args(argumentos)
+    trazador = Trazador(args.traza, [nombre for nombre in args.perfilar.split(',') if nombre])
+    firmador = FirmadorProcesos(args.procesos_firma) if args.procesos_firma else None
+
+    # Misma configuración que la aplicación gráfica (ver main.py)
+    load_dotenv()
+    blockchainManager = BlockchainManager(
+        ganache_url=os.getenv('GANACHE_URL'),
+        contract_address=os.getenv('CONTRACT_ADDRESS'),
+        abi_path=os.getenv('ABI_PATH'),
+        socio_principal_address=os.getenv('SOCIO_PRINCIPAL_ADDRESS'),
+        socio_principal_private_key=os.getenv('SOCIO_PRINCIPAL_PRIVATE_KEY'),
+        contract_code_hash=os.getenv('CONTRACT_CODE_HASH'),
+        # Modelo de gas propio, para no sobrescribir el de la aplicación gráfica si se ejecutan a la vez
+        ruta_modelo_gas='modelo_gas_lotes.json',
+        firmador=firmador,
+        trazador=trazador
+    )
+    puerto_metricas = args.puerto_metricas or os.getenv('METRICAS_PUERTO')
+    if puerto_metricas:
+        blockchainManager.metricas.servir(int(puerto_metricas))
+
+    salida = sys.stdout if args.salida == '-' else open(args.salida, 'w', encoding='utf-8')
+    try:
+        if firmador is not None:
+            resumen = ejecutar_lotes_firmados(blockchainManager, leer_filas(args.entrada), salida, args.lote)
+        else:
+            resumen = ejecutar_lote(blockchainManager, leer_filas(args.entrada), salida, args.concurrencia)
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+        if firmador is not None:
+            firmador.cerrar()
+        if trazador.activo:
+            trazador.exportar()
+
+    print(
+        f"{resumen['operaciones']} operaciones ({resumen['errores']} con error) en {resumen['duracion']} s: "
+        f"{resumen['operaciones_por_segundo']} op/s. Latencia media {resumen['latencia_media']:.3f} s, "
+        f"p50 {resumen['latencia_p50']:.3f} s, p95 {resumen['latencia_p95']:.3f} s, "
+        f"p99 {resumen['latencia_p99']:.3f} s, máxima {resumen['latencia_maxima']:.3f} s.",
+        file=sys.stderr
+    )
+    return 1 if resumen['errores'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
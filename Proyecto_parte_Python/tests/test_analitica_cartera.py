@@ -0,0 +1,43 @@
+import math
+import unittest
+
+from AnaliticaCartera import CarteraPrestamos
+from IndexadorPrestamos import ESTADO_PENDIENTE, ESTADO_APROBADO
+from Registros import RegistroPrestamo
+
+A = '0x' + '11' * 20
+B = '0x' + '22' * 20
+C = '0x' + '33' * 20
+
+
+class TestCarteraPrestamos(unittest.TestCase):
+
+    def setUp(self):
+        # A: 100 aprobado y 40 libres; B: 100 aprobado, 0 libres y 50 pendiente; C: sin garantía cargada
+        self.cartera = CarteraPrestamos.desde_registros(
+            [
+                RegistroPrestamo(1, A, 100, 60, 0, 1000, ESTADO_APROBADO),
+                RegistroPrestamo(1, B, 100, 60, 0, 1000, ESTADO_APROBADO),
+                RegistroPrestamo(2, B, 50, 60, 0, 0, ESTADO_PENDIENTE),
+                RegistroPrestamo(1, C, 10, 60, 0, 0, ESTADO_PENDIENTE),
+            ],
+            {A: 40, B: 0},
+        )
+
+    def test_cobertura_incluye_la_garantia_bloqueada(self):
+        cobertura = self.cartera.cobertura()
+
+        self.assertAlmostEqual(cobertura[self.cartera.codigo(A)], 1.4)
+        self.assertAlmostEqual(cobertura[self.cartera.codigo(B)], 1.0)
+        self.assertTrue(math.isnan(cobertura[self.cartera.codigo(C)]))
+
+    def test_descubiertos_por_solicitudes_pendientes(self):
+        cobertura = self.cartera.cobertura((ESTADO_PENDIENTE, ESTADO_APROBADO))
+
+        self.assertAlmostEqual(cobertura[self.cartera.codigo(B)], 100 / 150)
+        self.assertEqual(list(self.cartera.descubiertos()), [self.cartera.codigo(B)])
+        self.assertEqual(self.cartera.resumen(0)['prestatarios_descubiertos'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
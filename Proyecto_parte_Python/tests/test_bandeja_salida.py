@@ -0,0 +1,193 @@
+import unittest
+from concurrent.futures import Future
+
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from BandejaSalida import BandejaSalida, EN_COLA, FIRMADA, DIFUNDIDA, MINADA, FALLIDA
+
+PRESTAMISTA = Web3.to_checksum_address('0x' + '11' * 20)
+CLIENTE = Web3.to_checksum_address('0x' + '22' * 20)
+OTRO_CLIENTE = Web3.to_checksum_address('0x' + '33' * 20)
+HASH = '0x' + 'ab' * 32
+FIRMADA_RAW = '0x' + 'cd' * 40
+
+
+class Llamada:
+    def __init__(self, funcion, args):
+        self.fn_name = funcion
+        self.args = args
+
+
+class Funciones:
+    def __getattr__(self, funcion):
+        return lambda *args: Llamada(funcion, args)
+
+
+class EthFalso:
+    """Nodo falso para `reconciliar`: nonce confirmado, recibos, mempool y difusiones."""
+
+    def __init__(self):
+        self.nonce_confirmado = 0
+        self.recibos = {}
+        self.mempool = set()
+        self.difundidas = []
+        self.error_difusion = None
+
+    def get_transaction_count(self, cuenta, bloque):
+        return self.nonce_confirmado
+
+    def get_transaction_receipt(self, txn_hash):
+        if txn_hash not in self.recibos:
+            raise TransactionNotFound(txn_hash)
+        return self.recibos[txn_hash]
+
+    def get_transaction(self, txn_hash):
+        if txn_hash not in self.mempool:
+            raise TransactionNotFound(txn_hash)
+        return {'hash': txn_hash}
+
+    def send_raw_transaction(self, raw):
+        self.difundidas.append(bytes(raw))
+        if self.error_difusion is not None:
+            raise self.error_difusion
+        return HASH
+
+
+class ManagerFalso:
+
+    def __init__(self):
+        self.eth = EthFalso()
+        self.web3 = self
+        self.contract = self
+        self.functions = Funciones()
+        self.nonce_manager = self
+        self.notificador_recibos = self
+        self.sincronizadas = []
+        self.futuros = {}
+        self.lotes = []
+
+    def sincronizar(self, cuenta):
+        self.sincronizadas.append(cuenta)
+
+    def registrar(self, txn_hash):
+        if not isinstance(txn_hash, str):
+            txn_hash = Web3.to_hex(txn_hash)
+        return self.futuros.setdefault(txn_hash, Future())
+
+    def finalizar_transaccion(self, function_call, transaction, receipt):
+        return receipt
+
+    def difundir_lote_firmado(self, operaciones, al_firmar=None):
+        self.lotes.append([(operacion['function_call'].fn_name, operacion['account_address']) for operacion in operaciones])
+        firmadas = [
+            (indice, {'nonce': indice}, bytes([indice + 1]), bytes([indice + 1]) * 32)
+            for indice in range(len(operaciones))
+        ]
+        al_firmar(firmadas)
+        return [(transaction, txn_hash) for _, transaction, _, txn_hash in firmadas]
+
+
+class TestBandejaSalida(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = ManagerFalso()
+        self.bandeja = BandejaSalida(self.manager, ':memory:', {PRESTAMISTA: '0x01', CLIENTE: '0x02'})
+
+    def tearDown(self):
+        self.bandeja.cerrar()
+
+    def firmada(self, estado=FIRMADA, nonce=5):
+        """Encola una operación y la deja como si se hubiera firmado (o difundido) antes de reiniciar."""
+        operacion_id = self.bandeja.encolar(PRESTAMISTA, 'altaCliente', [CLIENTE])
+        with self.bandeja.conexion:
+            self.bandeja._transicion(operacion_id, estado, nonce=nonce, txn_hash=HASH, transaccion_firmada=FIRMADA_RAW)
+        return operacion_id
+
+    def estado(self, operacion_id):
+        return self.bandeja.operacion(operacion_id)['estado']
+
+    def test_reconciliar_con_recibo(self):
+        operacion_id = self.firmada(DIFUNDIDA)
+        self.manager.eth.nonce_confirmado = 6
+        self.manager.eth.recibos[HASH] = {'status': 1, 'blockNumber': 7, 'gasUsed': 21000}
+
+        self.assertEqual(self.bandeja.reconciliar(), 1)
+        self.assertEqual(self.estado(operacion_id), MINADA)
+        self.assertEqual(self.manager.eth.difundidas, [])
+
+    def test_reconciliar_revertida(self):
+        operacion_id = self.firmada()
+        self.manager.eth.nonce_confirmado = 6
+        self.manager.eth.recibos[HASH] = {'status': 0, 'blockNumber': 7, 'gasUsed': 21000}
+
+        self.bandeja.reconciliar()
+        self.assertEqual(self.estado(operacion_id), FALLIDA)
+
+    def test_reconciliar_en_el_mempool(self):
+        operacion_id = self.firmada()
+        self.manager.eth.mempool.add(HASH)
+
+        self.bandeja.reconciliar()
+        self.assertEqual(self.estado(operacion_id), DIFUNDIDA)
+        self.assertEqual(self.manager.eth.difundidas, [])
+        self.assertIn(operacion_id, self.bandeja._esperando)
+        # Ya se espera su recibo: una segunda reconciliación no la vuelve a comprobar
+        self.assertEqual(self.bandeja.reconciliar(), 0)
+
+    def test_reconciliar_nonce_usado_por_otra(self):
+        operacion_id = self.firmada()
+        self.manager.eth.nonce_confirmado = 6
+
+        self.bandeja.reconciliar()
+        self.assertEqual(self.estado(operacion_id), FALLIDA)
+        self.assertEqual(self.manager.eth.difundidas, [])
+
+    def test_reconciliar_perdida_se_difunde_de_nuevo(self):
+        operacion_id = self.firmada()
+
+        self.bandeja.reconciliar()
+        self.assertEqual(self.estado(operacion_id), DIFUNDIDA)
+        self.assertEqual(self.manager.eth.difundidas, [bytes.fromhex(FIRMADA_RAW[2:])])
+        self.assertEqual(self.manager.sincronizadas, [PRESTAMISTA])
+
+    def test_reconciliar_difusion_ya_conocida(self):
+        operacion_id = self.firmada()
+        self.manager.eth.error_difusion = ValueError({'message': 'already known'})
+
+        self.bandeja.reconciliar()
+        self.assertEqual(self.estado(operacion_id), DIFUNDIDA)
+
+    def test_reconciliar_difusion_rechazada(self):
+        operacion_id = self.firmada()
+        self.manager.eth.error_difusion = ValueError({'message': 'insufficient funds for gas * price + value'})
+
+        self.bandeja.reconciliar()
+        self.assertEqual(self.estado(operacion_id), FALLIDA)
+
+    def test_lote_espera_operaciones_de_otra_cuenta_con_direcciones_comunes(self):
+        alta = self.bandeja.encolar(PRESTAMISTA, 'altaCliente', [CLIENTE])
+        deposito = self.bandeja.encolar(CLIENTE, 'depositarGarantia', valor=10)
+        self.bandeja.encolar(PRESTAMISTA, 'altaCliente', [OTRO_CLIENTE])
+
+        self.assertEqual(self.bandeja.procesar_lote(), 1)
+        self.assertEqual(self.manager.lotes, [[('altaCliente', PRESTAMISTA)]])
+        self.assertEqual(self.estado(deposito), EN_COLA)
+        # Mientras el alta no se mine, el depósito sigue esperando
+        self.assertEqual(self.bandeja.procesar_lote(), 0)
+
+        self.manager.futuros[Web3.to_hex(b'\x01' * 32)].set_result({'status': 1, 'blockNumber': 3, 'gasUsed': 21000})
+        self.bandeja.comprobar_recibos()
+        self.assertEqual(self.estado(alta), MINADA)
+        self.assertEqual(self.bandeja.procesar_lote(), 2)
+        self.assertEqual(self.manager.lotes[-1], [('depositarGarantia', CLIENTE), ('altaCliente', PRESTAMISTA)])
+
+    def test_lote_con_operaciones_de_la_misma_cuenta(self):
+        self.bandeja.encolar(PRESTAMISTA, 'altaCliente', [CLIENTE])
+        self.bandeja.encolar(PRESTAMISTA, 'aprobarPrestamo', [CLIENTE, 1])
+
+        self.assertEqual(self.bandeja.procesar_lote(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
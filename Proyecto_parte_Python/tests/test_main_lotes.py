@@ -0,0 +1,127 @@
+import io
+import json
+import threading
+import unittest
+
+from main_lotes import ejecutar_lote, ejecutar_lotes_firmados
+
+PRESTAMISTA = '0x' + '11' * 20
+CLIENTE = '0x' + '22' * 20
+OTRO_CLIENTE = '0x' + '33' * 20
+CLAVE = '0x' + '01' * 32
+
+
+class Llamada:
+    def __init__(self, funcion, args):
+        self.fn_name = funcion
+        self.args = args
+
+
+class Funciones:
+    def __getattr__(self, funcion):
+        return lambda *args: Llamada(funcion, args)
+
+
+class ManagerFalso:
+    PLAZO_REEMPLAZO_URGENTE = 15
+
+    def __init__(self):
+        self.contract = self
+        self.functions = Funciones()
+        self.lotes = []
+
+    def submit_many(self, operaciones):
+        self.lotes.append([operacion['function_call'].fn_name for operacion in operaciones])
+        return [{'status': 'Succeeded'} for _ in operaciones]
+
+    def obtener_prestamos_por_prestatario(self, prestatario):
+        self.lotes.append(['lectura'])
+        return []
+
+
+class TestEjecutarLotesFirmados(unittest.TestCase):
+
+    def ejecutar(self, filas, tamano_lote=100):
+        manager = ManagerFalso()
+        salida = io.StringIO()
+        resumen = ejecutar_lotes_firmados(manager, filas, salida, tamano_lote)
+        resultados = [json.loads(linea) for linea in salida.getvalue().splitlines()]
+        return manager.lotes, resultados, resumen
+
+    def test_dependencias_entre_cuentas_cierran_el_lote(self):
+        lotes, resultados, resumen = self.ejecutar([
+            {'operacion': 'alta_cliente', 'direccion': PRESTAMISTA, 'clave_privada': CLAVE, 'nueva_direccion': CLIENTE},
+            {'operacion': 'depositar_garantia', 'direccion': CLIENTE, 'clave_privada': CLAVE, 'valor': '1'},
+            {'operacion': 'alta_cliente', 'direccion': PRESTAMISTA, 'clave_privada': CLAVE, 'nueva_direccion': OTRO_CLIENTE},
+            {'operacion': 'obtener_prestamos_por_prestatario', 'prestatario': CLIENTE},
+            {'operacion': 'solicitar_prestamo', 'direccion': CLIENTE, 'clave_privada': CLAVE, 'monto': '1', 'plazo': '60'},
+        ])
+
+        self.assertEqual(lotes, [
+            ['altaCliente'],
+            ['depositarGarantia', 'altaCliente'],
+            ['lectura'],
+            ['solicitarPrestamo'],
+        ])
+        self.assertEqual([resultado['fila'] for resultado in resultados], [1, 2, 3, 4, 5])
+        self.assertEqual(resumen['errores'], 0)
+
+    def test_tamano_de_lote_y_filas_incompletas(self):
+        fila = {'operacion': 'alta_cliente', 'direccion': PRESTAMISTA, 'clave_privada': CLAVE, 'nueva_direccion': CLIENTE}
+        lotes, resultados, resumen = self.ejecutar(
+            [fila, fila, {'operacion': 'depositar_garantia', 'direccion': CLIENTE}, fila], tamano_lote=2
+        )
+
+        self.assertEqual(lotes, [['altaCliente', 'altaCliente'], ['altaCliente']])
+        self.assertEqual(resultados[0]['error'], "Falta el campo 'clave_privada' en la fila.")
+        self.assertEqual(resumen['errores'], 1)
+
+
+class ManagerConcurrente:
+    """Gestor falso para `ejecutar_lote`: anota el orden en que empiezan y terminan las operaciones."""
+
+    socio_principal_address = PRESTAMISTA
+
+    def __init__(self):
+        self.eventos = []
+        self.cerrojo = threading.Lock()
+        self.otra_alta_iniciada = threading.Event()
+
+    def anotar(self, evento):
+        with self.cerrojo:
+            self.eventos.append(evento)
+
+    def alta_cliente(self, direccion, clave_privada, nueva_direccion):
+        self.anotar(('inicio', 'alta', nueva_direccion))
+        if nueva_direccion == CLIENTE:
+            # El alta de otro cliente se ejecuta a la vez que esta
+            self.otra_alta_iniciada.wait(5)
+        else:
+            self.otra_alta_iniciada.set()
+        self.anotar(('fin', 'alta', nueva_direccion))
+        return {'status': 'Succeeded'}
+
+    def depositar_garantia(self, direccion, clave_privada, valor):
+        self.anotar(('inicio', 'deposito', direccion))
+        return {'status': 'Succeeded'}
+
+
+class TestEjecutarLote(unittest.TestCase):
+
+    def test_filas_con_direcciones_comunes_en_orden(self):
+        manager = ManagerConcurrente()
+        resumen = ejecutar_lote(manager, [
+            {'operacion': 'alta_cliente', 'direccion': PRESTAMISTA, 'clave_privada': CLAVE, 'nueva_direccion': CLIENTE},
+            {'operacion': 'depositar_garantia', 'direccion': CLIENTE, 'clave_privada': CLAVE, 'valor': '1'},
+            {'operacion': 'alta_cliente', 'direccion': PRESTAMISTA, 'clave_privada': CLAVE, 'nueva_direccion': OTRO_CLIENTE},
+        ], io.StringIO(), concurrencia=3)
+
+        self.assertEqual(resumen['errores'], 0)
+        self.assertTrue(manager.otra_alta_iniciada.is_set())
+        eventos = manager.eventos
+        self.assertLess(eventos.index(('fin', 'alta', CLIENTE)), eventos.index(('inicio', 'deposito', CLIENTE)))
+        self.assertLess(eventos.index(('inicio', 'alta', OTRO_CLIENTE)), eventos.index(('fin', 'alta', CLIENTE)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import gc
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import ModeloGas as modulo
+from ModeloGas import ModeloGas
+
+CLAVE = '0xcontrato:0x12345678'
+
+
+class TestModeloGas(unittest.TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        entorno = mock.patch.dict(os.environ, {'DATOS_DIR': self.directorio})
+        entorno.start()
+        self.addCleanup(entorno.stop)
+
+    def test_ruta_relativa_dentro_de_datos_dir(self):
+        modelo = ModeloGas('modelo_gas.json', intervalo_guardado=0)
+        modelo.sembrar(CLAVE, 50000)
+
+        self.assertEqual(modelo.ruta, os.path.join(self.directorio, 'modelo_gas.json'))
+        self.assertTrue(os.path.exists(modelo.ruta))
+
+    def test_guardado_al_salir_sin_retener_modelos(self):
+        modelo = ModeloGas('modelo_gas.json', intervalo_guardado=3600)
+        modelo.sembrar(CLAVE, 50000)
+        modelo.registrar(CLAVE, 40000, 60000)
+        modulo._guardar_modelos()
+        with open(modelo.ruta) as archivo:
+            self.assertEqual(json.load(archivo)['muestras'][CLAVE], [50000, 40000])
+
+        self.assertIn(modelo, modulo._modelos_persistentes)
+        del modelo
+        gc.collect()
+        self.assertEqual(len(modulo._modelos_persistentes), 0)
+
+    def test_el_limite_no_baja_de_la_estimacion_sembrada(self):
+        modelo = ModeloGas(None, margen=0, muestras_maximas=3)
+        modelo.sembrar(CLAVE, 90000)
+        for _ in range(5):
+            modelo.registrar(CLAVE, 40000, 90000)
+
+        self.assertEqual(modelo._funciones[CLAVE], [40000, 40000, 40000])
+        self.assertEqual(modelo.limite(CLAVE), 90000)
+
+    def test_gas_agotado_eleva_el_minimo(self):
+        modelo = ModeloGas(None, margen=0)
+        modelo.sembrar(CLAVE, 50000)
+        modelo.registrar(CLAVE, 60000, 60000)
+        self.assertIsNone(modelo.limite(CLAVE))
+
+        # Una estimación posterior menor que el límite agotado no lo rebaja
+        self.assertEqual(modelo.sembrar(CLAVE, 55000), 60000)
+        modelo.registrar(CLAVE, 58000, 60000)
+        self.assertEqual(modelo.limite(CLAVE), 60000)
+
+    def test_persistencia_de_los_minimos(self):
+        modelo = ModeloGas('modelo_gas.json', margen=0, intervalo_guardado=0)
+        modelo.sembrar(CLAVE, 90000)
+        modelo.registrar(CLAVE, 40000, 90000)
+
+        cargado = ModeloGas('modelo_gas.json', margen=0)
+        self.assertEqual(cargado.limite(CLAVE), 90000)
+
+    def test_formato_anterior(self):
+        with open(os.path.join(self.directorio, 'modelo_gas.json'), 'w') as archivo:
+            json.dump({CLAVE: [40000, 45000]}, archivo)
+
+        modelo = ModeloGas('modelo_gas.json', margen=0)
+        self.assertEqual(modelo.limite(CLAVE), 45000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+
+from NotificadorRecibos import NotificadorRecibos
+
+HASH = '0x' + 'ab' * 32
+
+
+def recibo(txn_hash, bloque):
+    return {
+        'transactionHash': txn_hash,
+        'blockNumber': hex(bloque),
+        'status': '0x1',
+        'gasUsed': '0x5208',
+        'logs': [],
+    }
+
+
+class CadenaFalsa:
+    """Nodo falso: bloques con sus transacciones y los recibos de las transacciones minadas."""
+
+    TAMANO_LOTE_RPC = 200
+
+    def __init__(self, cabeza):
+        self.cabeza = cabeza
+        self.bloques = {}
+        self.recibos = {}
+        # Se ejecuta justo después de responder a un lote de recibos (para simular que se mina algo entonces)
+        self.tras_recibos = None
+        self.web3 = self
+        self.eth = self
+
+    @property
+    def block_number(self):
+        return self.cabeza
+
+    def minar(self, txn_hash):
+        self.cabeza += 1
+        self.bloques[self.cabeza] = [txn_hash]
+        self.recibos[txn_hash] = recibo(txn_hash, self.cabeza)
+
+    def rpc_batch(self, peticiones):
+        respuestas = []
+        for metodo, parametros in peticiones:
+            if metodo == 'eth_getBlockByNumber':
+                numero = int(parametros[0], 16)
+                respuestas.append({'transactions': self.bloques.get(numero, [])} if numero <= self.cabeza else None)
+            else:
+                respuestas.append(self.recibos.get(parametros[0]))
+        if self.tras_recibos is not None and peticiones and peticiones[0][0] == 'eth_getTransactionReceipt':
+            tras_recibos, self.tras_recibos = self.tras_recibos, None
+            tras_recibos()
+        return respuestas
+
+
+class TestNotificadorRecibos(unittest.TestCase):
+
+    def crear(self, cadena):
+        notificador = NotificadorRecibos(cadena)
+        # Sin hilo de seguimiento: las comprobaciones se lanzan desde el test
+        notificador._iniciar = lambda: None
+        return notificador
+
+    def test_minada_entre_la_consulta_directa_y_la_cabeza(self):
+        cadena = CadenaFalsa(10)
+        notificador = self.crear(cadena)
+        futuro = notificador.registrar(HASH)
+        cadena.tras_recibos = lambda: cadena.minar(HASH)
+
+        notificador.comprobar()
+        notificador.comprobar()
+
+        self.assertTrue(futuro.done())
+        self.assertEqual(futuro.result()['blockNumber'], 11)
+        self.assertEqual(notificador.pendientes(), 0)
+
+    def test_minada_en_un_bloque_posterior(self):
+        cadena = CadenaFalsa(10)
+        notificador = self.crear(cadena)
+        futuro = notificador.registrar(HASH)
+        notificador.comprobar()
+        self.assertFalse(futuro.done())
+
+        cadena.cabeza += 300
+        cadena.minar(HASH)
+        notificador.comprobar()
+
+        self.assertEqual(futuro.result()['blockNumber'], 311)
+        self.assertEqual(notificador._ultimo_bloque, 311)
+
+    def test_bloque_que_el_nodo_aun_no_tiene(self):
+        cadena = CadenaFalsa(10)
+        notificador = self.crear(cadena)
+        futuro = notificador.registrar(HASH)
+        notificador.comprobar()
+
+        cadena.minar(HASH)
+        # El nodo anuncia dos bloques más de los que puede servir
+        cadena.cabeza += 2
+        respuestas = cadena.rpc_batch
+        cadena.rpc_batch = lambda peticiones: [
+            respuesta if peticion[0] != 'eth_getBlockByNumber' or int(peticion[1][0], 16) <= 11 else None
+            for peticion, respuesta in zip(peticiones, respuestas(peticiones))
+        ]
+        notificador.comprobar()
+
+        self.assertTrue(futuro.done())
+        self.assertEqual(notificador._ultimo_bloque, 11)
+
+    def test_lote_fallido_conserva_la_consulta_directa(self):
+        cadena = CadenaFalsa(10)
+        notificador = self.crear(cadena)
+        futuro = notificador.registrar(HASH)
+        respuestas = cadena.rpc_batch
+
+        def fallar(peticiones):
+            raise ConnectionError("nodo caído")
+        cadena.rpc_batch = fallar
+        with self.assertRaises(ConnectionError):
+            notificador.comprobar()
+
+        cadena.rpc_batch = respuestas
+        cadena.recibos[HASH] = recibo(HASH, 9)
+        notificador.comprobar()
+        self.assertEqual(futuro.result()['blockNumber'], 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import time
+import unittest
+
+from IndexadorPrestamos import ESTADO_APROBADO
+from Metricas import Metricas
+from PlanificadorLiquidaciones import PlanificadorLiquidaciones
+from Registros import RegistroPrestamo
+
+PRESTATARIO = '0x' + '11' * 20
+# Código de estado 'Liquidado' (ver `BlockchainManager.ESTADOS_PRESTAMO`)
+ESTADO_LIQUIDADO = 3
+
+
+class Llamada:
+    def __init__(self, *args):
+        self.args = args
+
+
+class ManagerFalso:
+    """Contrato falso: estado y tiempo límite de cada préstamo, y un resultado configurable para cada envío."""
+
+    def __init__(self):
+        self.metricas = Metricas()
+        self.prestamos = {}
+        self.nodo_caido = False
+        self.resultado = None
+        self.enviadas = []
+        self.contract = self
+        self.functions = self
+
+    def liquidarGarantia(self, prestatario, prestamo_id):
+        return Llamada(prestatario, prestamo_id)
+
+    def batch_call(self, llamadas):
+        if self.nodo_caido:
+            raise ConnectionError("nodo caído")
+        return [
+            (prestamo_id, prestatario, 1, 1, 1, *self.prestamos[(prestatario, prestamo_id)])
+            for _, (prestatario, prestamo_id) in llamadas
+        ]
+
+    def submit_many(self, operaciones):
+        resultados = []
+        for operacion in operaciones:
+            clave = operacion['function_call'].args
+            self.enviadas.append(clave)
+            if self.resultado is not None:
+                resultados.append(self.resultado)
+            else:
+                self.prestamos[clave] = (self.prestamos[clave][0], ESTADO_LIQUIDADO)
+                resultados.append({'status': 'Succeeded'})
+        return resultados
+
+
+class IndexadorFalso:
+    profundidad_reorg = 4
+
+    def __init__(self):
+        self.bloque = 10
+        self.cambios = []
+        self.prestamos = {}
+
+    def sincronizar(self):
+        pass
+
+    def ultimo_bloque_procesado(self):
+        return self.bloque
+
+    def prestamos_por_estado(self, estado):
+        return [prestamo for prestamo in self.prestamos.values() if prestamo.estado == estado]
+
+    def cambios_desde(self, bloque):
+        return [cambio for cambio in self.cambios if cambio[4] >= bloque]
+
+    def prestamos_de(self, prestatario):
+        return [prestamo for (direccion, _), prestamo in self.prestamos.items() if direccion == prestatario]
+
+    def aprobar(self, prestamo_id, tiempo_limite, bloque):
+        self.prestamos[(PRESTATARIO, prestamo_id)] = RegistroPrestamo(prestamo_id, PRESTATARIO, 1, 1, 1, tiempo_limite, ESTADO_APROBADO)
+        self.cambios.append((PRESTATARIO, prestamo_id, ESTADO_APROBADO, tiempo_limite, bloque))
+
+
+class TestPlanificadorLiquidaciones(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = ManagerFalso()
+        self.indexador = IndexadorFalso()
+        self.planificador = PlanificadorLiquidaciones(
+            self.manager, '0xP', '0xclave', indexador=self.indexador, margen=0, reintento=10, max_reintentos=2, reintento_maximo=40
+        )
+
+    def aprobar(self, prestamo_id, tiempo_limite=100, bloque=9):
+        self.manager.prestamos[(PRESTATARIO, prestamo_id)] = (tiempo_limite, ESTADO_APROBADO)
+        self.indexador.aprobar(prestamo_id, tiempo_limite, bloque)
+
+    def momento(self, prestamo_id):
+        return self.planificador._programados[(PRESTATARIO, prestamo_id)][0]
+
+    def test_errores_de_conexion_no_cuentan_como_intentos(self):
+        self.aprobar(1)
+        self.planificador.sincronizar()
+        self.manager.nodo_caido = True
+        esperas = []
+        for _ in range(6):
+            # Los reintentos se programan con la hora real: se simula que ya ha llegado su momento
+            self.planificador.liquidar_vencidos(self.momento(1))
+            esperas.append(round(self.momento(1) - time.time()))
+            # La reproducción de los cambios no adelanta el reintento
+            self.planificador.sincronizar()
+        self.assertEqual(esperas, [10, 20, 40, 40, 40, 40])
+        self.assertNotIn((PRESTATARIO, 1), self.planificador._descartados)
+
+        self.manager.nodo_caido = False
+        self.planificador.liquidar_vencidos(self.momento(1))
+        self.assertEqual(self.manager.enviadas, [(PRESTATARIO, 1)])
+
+    def test_reintentos_y_abandono(self):
+        self.aprobar(1)
+        self.planificador.sincronizar()
+        self.manager.resultado = ValueError("revertida")
+        for _ in range(5):
+            self.planificador.liquidar_vencidos(time.time() + 1000)
+            self.planificador.sincronizar()
+        self.assertEqual(len(self.manager.enviadas), 3)
+        self.assertEqual(self.planificador.pendientes(), 0)
+
+    def test_aprobacion_posterior_al_descarte(self):
+        self.aprobar(1)
+        self.planificador.sincronizar()
+        self.planificador.liquidar_vencidos(1000)
+        self.assertIn((PRESTATARIO, 1), self.planificador._descartados)
+
+        # La misma aprobación reproducida no lo vuelve a programar; una de un bloque posterior, sí
+        self.planificador.sincronizar()
+        self.assertEqual(self.planificador.pendientes(), 0)
+        self.manager.prestamos[(PRESTATARIO, 1)] = (100, ESTADO_APROBADO)
+        self.indexador.aprobar(1, 100, 11)
+        self.indexador.bloque = 11
+        self.planificador.sincronizar()
+        self.assertEqual(self.planificador.pendientes(), 1)
+
+    def test_descartados_fuera_de_la_ventana(self):
+        self.aprobar(1)
+        self.aprobar(2)
+        self.planificador.sincronizar()
+        self.planificador.liquidar_vencidos(1000)
+        self.assertEqual(len(self.planificador._descartados), 2)
+
+        # El préstamo 2 se liquidó; una reorganización deshizo la liquidación del 1
+        self.indexador.prestamos[(PRESTATARIO, 2)] = self.indexador.prestamos[(PRESTATARIO, 2)]._replace(estado=ESTADO_LIQUIDADO)
+        self.manager.prestamos[(PRESTATARIO, 1)] = (100, ESTADO_APROBADO)
+        self.indexador.bloque = 20
+        self.planificador.sincronizar()
+        self.assertEqual(self.planificador._descartados, {})
+        self.assertEqual(list(self.planificador._programados), [(PRESTATARIO, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
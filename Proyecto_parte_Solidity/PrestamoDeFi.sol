@@ -137,5 +137,20 @@ contract PrestamoDeFi {
     function obtenerDetalleDePrestamo(address prestatario_, uint256 id_) public view returns (Prestamo memory) {
         return clientes[prestatario_].prestamos[id_];
     }
+
+    function obtenerPrestamosPaginados(address prestatario_, uint256 offset_, uint256 limite_) public view returns (Prestamo[] memory) {
+        Cliente storage prestatario = clientes[prestatario_];
+        uint256 total = prestatario.prestamoIds.length;
+        if (offset_ >= total) {
+            return new Prestamo[](0);
+        }
+
+        uint256 fin = limite_ > total - offset_ ? total : offset_ + limite_;
+        Prestamo[] memory pagina = new Prestamo[](fin - offset_);
+        for (uint256 i = offset_; i < fin; i++) {
+            pagina[i - offset_] = prestatario.prestamos[prestatario.prestamoIds[i]];
+        }
+        return pagina;
+    }
     
 }
\ No newline at end of file